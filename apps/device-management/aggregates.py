@@ -0,0 +1,165 @@
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Sequence
+from uuid import UUID
+
+from sqlalchemy import and_, func, literal_column, or_, select, text
+from sqlalchemy.dialects.postgresql import aggregate_order_by, array_agg
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import SensorData
+from rollups import ROLLUP_TABLES, get_high_water
+from schemas import SensorDataAggregateResponse
+
+__all__ = ["BUCKET_WIDTHS", "aggregate_sensor_data"]
+
+BUCKET_WIDTHS: Dict[str, timedelta] = {
+    "1m": timedelta(minutes=1),
+    "5m": timedelta(minutes=5),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+
+# литералы, а не bind-параметры: выражение бакета должно совпадать в SELECT и GROUP BY
+_INTERVALS: Dict[str, str] = {
+    "1m": "INTERVAL '1 minute'",
+    "5m": "INTERVAL '5 minutes'",
+    "1h": "INTERVAL '1 hour'",
+    "1d": "INTERVAL '1 day'",
+}
+# точка отсчёта для date_bin: бакеты выровнены по полуночи UTC
+_BUCKET_ORIGIN = "TIMESTAMP '2000-01-01 00:00:00'"
+_ORIGIN_DT = datetime(2000, 1, 1)
+
+_has_timescale: Optional[bool] = None
+
+
+async def _timescale_enabled(db: AsyncSession) -> bool:
+    """Проверяем расширение один раз на процесс."""
+    global _has_timescale
+    if _has_timescale is None:
+        _has_timescale = bool(
+            await db.scalar(text("SELECT 1 FROM pg_extension WHERE extname = 'timescaledb'"))
+        )
+    return _has_timescale
+
+
+def bucket_expression(column, bucket: str, timescale: bool):
+    interval = literal_column(_INTERVALS[bucket])
+    if timescale:
+        return func.time_bucket(interval, column)
+    # date_bin (PG 14+) умеет произвольную ширину, в отличие от date_trunc
+    return func.date_bin(interval, column, literal_column(_BUCKET_ORIGIN))
+
+
+def empty_response(bucket: str) -> SensorDataAggregateResponse:
+    return SensorDataAggregateResponse(
+        bucket_width=bucket, device_id=[], bucket=[], min=[], max=[], avg=[], count=[], last=[]
+    )
+
+
+def append_row(response: SensorDataAggregateResponse, row) -> None:
+    response.device_id.append(row.device_id)
+    response.bucket.append(row.bucket)
+    response.min.append(row.min)
+    response.max.append(row.max)
+    response.avg.append(row.avg)
+    response.count.append(row.count)
+    response.last.append(row.last)
+
+
+def floor_bucket(value: datetime, bucket: str) -> datetime:
+    width = BUCKET_WIDTHS[bucket]
+    return _ORIGIN_DT + ((value - _ORIGIN_DT) // width) * width
+
+
+def ceil_bucket(value: datetime, bucket: str) -> datetime:
+    floor = floor_bucket(value, bucket)
+    return floor if floor == value else floor + BUCKET_WIDTHS[bucket]
+
+
+def bucket_count(start: datetime, end: datetime, bucket: str) -> int:
+    return int((end - start) / BUCKET_WIDTHS[bucket]) + 1
+
+
+def _raw_query(bucket: str, timescale: bool, device_ids, reading_type: str, time_filter):
+    bucket_col = bucket_expression(SensorData.timestamp, bucket, timescale).label("bucket")
+    return (
+        select(
+            SensorData.device_id,
+            bucket_col,
+            func.min(SensorData.numeric_value).label("min"),
+            func.max(SensorData.numeric_value).label("max"),
+            func.avg(SensorData.numeric_value).label("avg"),
+            func.count(SensorData.numeric_value).label("count"),
+            array_agg(
+                aggregate_order_by(SensorData.numeric_value, SensorData.timestamp.desc())
+            )[1].label("last"),
+        )
+        .where(
+            SensorData.device_id.in_(device_ids),
+            SensorData.type == reading_type,
+            time_filter,
+            SensorData.numeric_value.is_not(None),
+        )
+        .group_by(SensorData.device_id, bucket_col)
+    )
+
+
+def _rollup_query(bucket: str, device_ids, reading_type: str, start: datetime, end: datetime):
+    # самый грубый роллап, из которого собирается запрошенный бакет (5m -> из 1m)
+    rollup = ROLLUP_TABLES[bucket if bucket in ROLLUP_TABLES else "1m"]
+    bucket_col = bucket_expression(rollup.bucket, bucket, timescale=False).label("bucket")
+    return (
+        select(
+            rollup.device_id,
+            bucket_col,
+            func.min(rollup.min).label("min"),
+            func.max(rollup.max).label("max"),
+            (func.sum(rollup.sum) / func.sum(rollup.count)).label("avg"),
+            func.sum(rollup.count).label("count"),
+            array_agg(aggregate_order_by(rollup.last_value, rollup.last_timestamp.desc()))[1].label("last"),
+        )
+        .where(
+            rollup.device_id.in_(device_ids),
+            rollup.type == reading_type,
+            rollup.bucket >= start,
+            rollup.bucket < end,
+        )
+        .group_by(rollup.device_id, bucket_col)
+    )
+
+
+async def aggregate_sensor_data(
+    db: AsyncSession,
+    device_ids: Sequence[UUID],
+    reading_type: str,
+    start: datetime,
+    end: datetime,
+    bucket: str,
+) -> SensorDataAggregateResponse:
+    """min/max/avg/count/last по бакетам, считается целиком в SQL.
+
+    Целые бакеты до high-water mark берутся из роллапов, неполные края
+    диапазона и свежий хвост — из сырых sensor_data.
+    """
+    timescale = await _timescale_enabled(db)
+    high_water = await get_high_water(db)
+
+    rollup_start = ceil_bucket(start, bucket)
+    rollup_end = min(floor_bucket(end, bucket), floor_bucket(high_water, bucket)) if high_water else rollup_start
+
+    rows = []
+    if rollup_start < rollup_end:
+        rows.extend(await db.execute(_rollup_query(bucket, device_ids, reading_type, rollup_start, rollup_end)))
+        time_filter = or_(
+            and_(SensorData.timestamp >= start, SensorData.timestamp < rollup_start),
+            and_(SensorData.timestamp >= rollup_end, SensorData.timestamp < end),
+        )
+    else:
+        time_filter = and_(SensorData.timestamp >= start, SensorData.timestamp < end)
+    rows.extend(await db.execute(_raw_query(bucket, timescale, device_ids, reading_type, time_filter)))
+
+    response = empty_response(bucket)
+    for row in sorted(rows, key=lambda r: (r.device_id, r.bucket)):
+        append_row(response, row)
+    return response
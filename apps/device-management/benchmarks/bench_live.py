@@ -0,0 +1,107 @@
+"""Живой поток: тысячи локальных подписчиков на одном LiveHub.
+
+Kafka и БД не нужны: сообщения топика (массивы показаний, как их читает
+run_live_stream) подаются прямо в ``live_hub.publish_message``. Подписчик
+смотрит на устройства одного дома; часть подписчиков «медленные» — забирают
+буфер редко, часть «зависшие» — не забирают вовсе. Проверяется, что publish
+не замедляется из-за них, буферы не растут выше LIVE_QUEUE_SIZE, а быстрые
+подписчики получают всё.
+
+Запуск из apps/device-management:
+
+    python benchmarks/bench_live.py --subscribers 5000 --messages 20000
+    python benchmarks/bench_live.py --policy coalesce --stalled 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from live import LiveHub  # noqa: E402
+
+
+def _message(devices: list, size: int, i: int) -> bytes:
+    return json.dumps(
+        [
+            {
+                "device_id": random.choice(devices),
+                "timestamp": "2024-01-01T00:00:00",
+                "type": "temperature",
+                "value": str(i % 40),
+            }
+            for _ in range(size)
+        ]
+    ).encode()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscribers", type=int, default=5_000)
+    parser.add_argument("--homes", type=int, default=1_000)
+    parser.add_argument("--devices-per-home", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--readings-per-message", type=int, default=10)
+    parser.add_argument("--policy", choices=("drop_oldest", "coalesce"), default="drop_oldest")
+    parser.add_argument("--queue-size", type=int, default=256)
+    parser.add_argument("--slow", type=float, default=0.1, help="доля медленных подписчиков")
+    parser.add_argument("--stalled", type=float, default=0.1, help="доля подписчиков, которые не читают")
+    args = parser.parse_args()
+
+    homes = [
+        [str(uuid.uuid4()) for _ in range(args.devices_per_home)] for _ in range(args.homes)
+    ]
+    all_devices = [device for home in homes for device in home]
+    hub = LiveHub()
+    subscribers = [
+        hub.subscribe(random.choice(homes), args.policy, args.queue_size)
+        for _ in range(args.subscribers)
+    ]
+    received = [0] * len(subscribers)
+    stalled = int(len(subscribers) * args.stalled)
+    slow = int(len(subscribers) * args.slow)
+
+    async def _reader(i: int, delay: float) -> None:
+        while True:
+            received[i] += len(await subscribers[i].get())
+            if delay:
+                await asyncio.sleep(delay)
+
+    readers = [
+        asyncio.create_task(_reader(i, 0.05 if i < stalled + slow else 0))
+        for i in range(stalled, len(subscribers))
+    ]
+
+    messages = [_message(all_devices, args.readings_per_message, i) for i in range(1_000)]
+    started = time.perf_counter()
+    publish_s = 0.0
+    for i in range(args.messages):
+        t0 = time.perf_counter()
+        hub.publish_message(messages[i % len(messages)])
+        publish_s += time.perf_counter() - t0
+        if i % 100 == 0:
+            await asyncio.sleep(0)  # даём читателям забрать буферы, как между getmany
+    await asyncio.sleep(0.2)
+    elapsed = time.perf_counter() - started
+    for task in readers:
+        task.cancel()
+    await asyncio.gather(*readers, return_exceptions=True)
+
+    readings = args.messages * args.readings_per_message
+    fast = range(stalled + slow, len(subscribers))
+    print(f"subscribers            {len(subscribers)} ({stalled} stalled, {slow} slow), policy {args.policy}")
+    print(f"readings published     {readings:,} in {elapsed:.2f}s ({readings / publish_s:,.0f}/s in publish)")
+    print(f"delivered / dropped    {hub.stats.delivered:,} / {hub.stats.dropped:,}")
+    print(f"max buffer             {max(len(s) for s in subscribers)} (limit {args.queue_size})")
+    print(f"fast subscribers got   {sum(received[i] for i in fast):,}, dropped {sum(subscribers[i].dropped for i in fast)}")
+    print(f"max RSS                {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
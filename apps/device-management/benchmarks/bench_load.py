@@ -0,0 +1,330 @@
+"""Нагрузочный прогон горячих эндпоинтов всех роутеров, результат — JSON.
+
+Данные готовит ``benchmarks/seed.py``; объёмы читаются из БД, идентификаторы
+восстанавливаются через ``seed.bench_uuid``. По умолчанию приложение
+поднимается в этом же процессе (create_app + lifespan, httpx ASGITransport),
+а вместо AIOKafkaProducer подставляется FakeProducer в памяти — Kafka не
+нужна. С --base-url нагрузка идёт по сети в уже запущенный сервис.
+
+Каждый сценарий: прогрев, затем --concurrency параллельных клиентов в течение
+--duration секунд. В JSON — rps, p50/p95/p99/max и число ошибок по сценарию,
+плюс коммит, флаги окружения и объёмы данных. --compare печатает разницу
+с прошлым прогоном.
+
+Запуск из apps/device-management (БД из DATABASE_URL):
+
+    python benchmarks/seed.py --reset --scale 0.1
+    python benchmarks/bench_load.py --output /tmp/load-main.json
+    JSON_FAST_PATH=on python benchmarks/bench_load.py --compare /tmp/load-main.json
+    python benchmarks/bench_load.py --only devices. --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, List, NamedTuple, Optional
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+# фоновый consumer инвалидации кэша без Kafka переподключается редко и не шумит в логах
+os.environ.setdefault("CACHE_RETRY_BACKOFF_S", "3600")
+
+import httpx  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+from seed import READING_TYPE, bench_uuid  # noqa: E402
+
+API_PREFIX = "/api/v2.0"
+ENV_FLAGS = ("JSON_FAST_PATH", "CACHE_BACKEND", "SQL_PROFILE", "DB_POOL_SIZE", "DB_MAX_OVERFLOW")
+BATCH_SIZE = 100
+
+
+class FakeProducer:
+    """AIOKafkaProducer в памяти: подтверждает отправку сразу, сообщения только считает."""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def flush(self) -> None:
+        pass
+
+    async def partitions_for(self, topic: str) -> set:
+        return {0}
+
+    async def send(self, topic, value=None, key=None, **kwargs) -> "asyncio.Future":
+        self.sent += 1
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+
+    async def send_and_wait(self, topic, value=None, key=None, **kwargs) -> None:
+        await self.send(topic, value=value, key=key)
+
+
+class Dataset(NamedTuple):
+    users: int
+    homes: int
+    rooms: int
+    devices: int
+    scenarios: int
+    readings: int
+
+
+def load_dataset() -> Dataset:
+    from database import get_sync_engine
+
+    with get_sync_engine().connect() as conn:
+        counts = conn.execute(
+            text(
+                "SELECT (SELECT count(*) FROM users), (SELECT count(*) FROM homes),"
+                " (SELECT count(*) FROM rooms), (SELECT count(*) FROM devices),"
+                " (SELECT count(*) FROM automation_scenarios),"
+                " (SELECT reltuples::bigint FROM pg_class WHERE relname = 'sensor_data')"
+            )
+        ).one()
+    dataset = Dataset(*counts)
+    if not dataset.homes or not dataset.devices:
+        sys.exit("no data: run benchmarks/seed.py first")
+    return dataset
+
+
+# ---------------------------------------------------------------------------
+# сценарии: по запросу на вызов, (method, url, kwargs для httpx)
+
+class Request(NamedTuple):
+    method: str
+    url: str
+    kwargs: Dict[str, Any]
+
+
+def _get(url: str) -> Request:
+    return Request("GET", url, {})
+
+
+def _pick(kind: str, count: int) -> str:
+    return str(bench_uuid(kind, random.randint(1, count)))
+
+
+def _reading(device_id: str) -> dict:
+    return {
+        "device_id": device_id,
+        "timestamp": datetime.utcnow().isoformat(),
+        "type": READING_TYPE,
+        "value": str(random.randint(15, 30)),
+    }
+
+
+def _device_update(d: Dataset) -> Request:
+    body = {
+        "name": "Sensor",
+        "type": "SENSOR",
+        "model": "TH-100",
+        "location": "Room",
+        "unit": "C",
+        "status": random.choice(("active", "inactive")),
+    }
+    return Request("PUT", f"/sensors/{_pick('device', d.devices)}", {"json": body})
+
+
+def _aggregate(d: Dataset, devices: int) -> Request:
+    end = datetime.utcnow().replace(microsecond=0)
+    params = [("device_id", _pick("device", d.devices)) for _ in range(devices)]
+    params += [
+        ("type", READING_TYPE),
+        ("start", (end - timedelta(days=1)).isoformat()),
+        ("end", end.isoformat()),
+        ("bucket", "1h"),
+    ]
+    return Request("GET", "/sensor-data/aggregate", {"params": params})
+
+
+SCENARIOS: Dict[str, Callable[[Dataset], Request]] = {
+    "users.list": lambda d: _get("/users/?limit=100"),
+    "users.get": lambda d: _get(f"/users/{_pick('user', d.users)}"),
+    "homes.list": lambda d: _get("/homes/?limit=100"),
+    "homes.get": lambda d: _get(f"/homes/{_pick('home', d.homes)}"),
+    "homes.topology": lambda d: _get(f"/homes/{_pick('home', d.homes)}/topology?include=rooms.devices"),
+    "rooms.list": lambda d: _get("/rooms/?limit=100"),
+    "rooms.get": lambda d: _get(f"/rooms/{_pick('room', d.rooms)}"),
+    "devices.list": lambda d: _get("/sensors/?limit=100"),
+    "devices.get": lambda d: _get(f"/sensors/{_pick('device', d.devices)}"),
+    "devices.update": _device_update,
+    "sensor_data.list": lambda d: _get("/sensor-data/?limit=100"),
+    "sensor_data.aggregate": lambda d: _aggregate(d, 1),
+    "sensor_data.aggregate_10": lambda d: _aggregate(d, 10),
+    "sensor_data.create": lambda d: Request(
+        "POST", "/sensor-data/", {"json": _reading(_pick("device", d.devices))}
+    ),
+    "sensor_data.batch": lambda d: Request(
+        "POST", "/sensor-data/batch", {"json": [_reading(_pick("device", d.devices)) for _ in range(BATCH_SIZE)]}
+    ),
+    "scenarios.list": lambda d: _get("/automation-scenarios/?limit=100"),
+    "scenarios.get": lambda d: _get(f"/automation-scenarios/{_pick('scenario', max(d.scenarios, 1))}"),
+}
+
+
+# ---------------------------------------------------------------------------
+# прогон
+
+@asynccontextmanager
+async def _client(base_url: Optional[str]) -> AsyncIterator[httpx.AsyncClient]:
+    if base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            yield client
+        return
+
+    import kafka
+    import main
+
+    kafka._kafka_producer = FakeProducer()
+    app = main.create_app()
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench" + API_PREFIX, timeout=60) as client:
+            yield client
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+def _summary(latencies: List[float], errors: int, elapsed: float) -> dict:
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": _ms(statistics.fmean(latencies)) if latencies else None,
+        "p50_ms": _ms(_percentile(latencies, 0.50)) if latencies else None,
+        "p95_ms": _ms(_percentile(latencies, 0.95)) if latencies else None,
+        "p99_ms": _ms(_percentile(latencies, 0.99)) if latencies else None,
+        "max_ms": _ms(latencies[-1]) if latencies else None,
+    }
+
+
+async def _run_scenario(
+    client: httpx.AsyncClient,
+    build: Callable[[Dataset], Request],
+    dataset: Dataset,
+    concurrency: int,
+    duration: float,
+    warmup: int,
+) -> dict:
+    for _ in range(warmup):
+        request = build(dataset)
+        await client.request(request.method, request.url, **request.kwargs)
+
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def _worker() -> None:
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            request = build(dataset)
+            started = time.perf_counter()
+            response = await client.request(request.method, request.url, **request.kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    return _summary(latencies, errors, time.perf_counter() - started)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> dict:
+    dataset = load_dataset()
+    names = [name for name in SCENARIOS if not args.only or re.search(args.only, name)]
+    results = {}
+    async with _client(args.base_url) as client:
+        for name in names:
+            results[name] = await _run_scenario(
+                client, SCENARIOS[name], dataset, args.concurrency, args.duration, args.warmup
+            )
+            r = results[name]
+            print(
+                f"{name:<26} {r['rps']:>8.1f} rps  p50 {r['p50_ms']:>8.2f}  p95 {r['p95_ms']:>8.2f}"
+                f"  p99 {r['p99_ms']:>8.2f} ms  errors {r['errors']}",
+                flush=True,
+            )
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "started_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "target": args.base_url or "in-process",
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "env": {flag: os.getenv(flag) for flag in ENV_FLAGS if os.getenv(flag) is not None},
+            "dataset": dataset._asdict(),
+        },
+        "results": results,
+    }
+
+
+def _compare(current: dict, baseline_path: str) -> None:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nvs {baseline['meta'].get('commit')} ({baseline_path}):")
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if not before or not before["rps"] or not before["p95_ms"] or not result["p95_ms"]:
+            continue
+        print(
+            f"{name:<26} rps {100 * (result['rps'] / before['rps'] - 1):+7.1f}%"
+            f"  p95 {100 * (result['p95_ms'] / before['p95_ms'] - 1):+7.1f}%"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default=None, help="живой сервис вместо in-process, напр. http://localhost:8000/api/v2.0")
+    parser.add_argument("--only", default=None, help="регэксп по именам сценариев")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="секунд на сценарий")
+    parser.add_argument("--warmup", type=int, default=20, help="запросов прогрева на сценарий")
+    parser.add_argument("--output", default="bench_load.json")
+    parser.add_argument("--compare", default=None, help="JSON прошлого прогона")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nwritten {args.output}")
+    if args.compare:
+        _compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Движок правил против линейного перебора на большом числе правил.
+
+Запуск из apps/device-management (БД не нужна, только импорт модулей):
+
+    python benchmarks/bench_rules.py --rules 100000 --readings 20000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rules import CompiledRule, Condition, RuleEngine  # noqa: E402
+
+_TYPES = ("temperature", "humidity", "co2")
+_OPS = (">", ">=", "<", "<=", "==", "!=")
+_OPS_WEIGHTS = (30, 10, 30, 10, 15, 5)
+
+
+def _make_rules(count: int, devices: list, wildcard_share: float) -> list:
+    rules = []
+    for _ in range(count):
+        device = None if random.random() < wildcard_share else random.choice(devices)
+        rules.append(
+            CompiledRule(
+                rule_id=uuid.uuid4(),
+                scenario_id=uuid.uuid4(),
+                condition=Condition(
+                    device_id=device,
+                    reading_type=random.choice(_TYPES),
+                    op=random.choices(_OPS, _OPS_WEIGHTS)[0],
+                    threshold=float(random.randint(0, 100)),
+                ),
+                action_type=random.choice(("TURN_ON", "TURN_OFF")),
+                action_target=uuid.uuid4(),
+            )
+        )
+    return rules
+
+
+_PY_OPS = {
+    ">": lambda v, t: v > t,
+    ">=": lambda v, t: v >= t,
+    "<": lambda v, t: v < t,
+    "<=": lambda v, t: v <= t,
+    "==": lambda v, t: v == t,
+    "!=": lambda v, t: v != t,
+}
+
+
+def _linear(rules: list, device_id, reading_type: str, value: float) -> set:
+    """То, как правила проверялись бы без индекса: каждое показание против всех."""
+    return {
+        r.rule_id
+        for r in rules
+        if r.condition.reading_type == reading_type
+        and r.condition.device_id in (None, device_id)
+        and _PY_OPS[r.condition.op](value, r.condition.threshold)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, default=100_000)
+    parser.add_argument("--devices", type=int, default=5_000)
+    parser.add_argument("--readings", type=int, default=20_000)
+    parser.add_argument("--wildcard-share", type=float, default=0.001)
+    parser.add_argument("--linear-readings", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    devices = [uuid.uuid4() for _ in range(args.devices)]
+    rules = _make_rules(args.rules, devices, args.wildcard_share)
+    readings = [
+        (random.choice(devices), random.choice(_TYPES), float(random.randint(0, 100)))
+        for _ in range(args.readings)
+    ]
+
+    engine = RuleEngine()
+    started = time.perf_counter()
+    for rule in rules:
+        engine.add_rule(rule)
+    build_s = time.perf_counter() - started
+    print(f"index build: {args.rules} rules in {build_s:.2f}s")
+
+    # корректность на выборке: индекс и перебор дают одно и то же
+    for device_id, reading_type, value in readings[: args.linear_readings]:
+        assert engine.matching_rules(device_id, reading_type, value) == _linear(
+            rules, device_id, reading_type, value
+        )
+
+    started = time.perf_counter()
+    for device_id, reading_type, value in readings:
+        engine.evaluate(device_id, reading_type, value)
+    indexed_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for device_id, reading_type, value in readings[: args.linear_readings]:
+        _linear(rules, device_id, reading_type, value)
+    linear_s = time.perf_counter() - started
+
+    indexed_rate = args.readings / indexed_s
+    linear_rate = args.linear_readings / linear_s
+    print(f"indexed: {indexed_rate:,.0f} readings/s ({indexed_s / args.readings * 1e6:.1f} us/reading)")
+    print(f"linear:  {linear_rate:,.0f} readings/s ({linear_s / args.linear_readings * 1e6:.1f} us/reading)")
+    print(f"speedup: x{indexed_rate / linear_rate:.0f}")
+
+    # инкрементальные изменения без полной перестройки
+    sample = random.sample(rules, min(1000, len(rules)))
+    started = time.perf_counter()
+    for rule in sample:
+        engine.remove_rule(rule.rule_id)
+        engine.add_rule(rule)
+    update_us = (time.perf_counter() - started) / len(sample) * 1e6
+    print(f"update: {update_us:.1f} us per remove+add")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Сравнение пропускной способности записи показаний: по одному vs пачкой.
+
+Запуск против поднятого сервиса (device_id должен существовать):
+
+    python benchmarks/bench_sensor_ingest.py --device-id <uuid> --count 20000
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+
+import httpx
+
+
+def _reading(device_id: str, i: int) -> dict:
+    return {
+        "device_id": device_id,
+        "timestamp": datetime.utcnow().isoformat(),
+        "type": "temperature",
+        "value": str(20 + i % 10),
+    }
+
+
+async def _single(client: httpx.AsyncClient, device_id: str, count: int, concurrency: int) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def _one(i: int) -> None:
+        async with sem:
+            r = await client.post("/sensor-data/", json=_reading(device_id, i))
+            r.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_one(i) for i in range(count)))
+    return time.perf_counter() - started
+
+
+async def _batch(
+    client: httpx.AsyncClient, device_id: str, count: int, batch_size: int, ndjson: bool
+) -> float:
+    started = time.perf_counter()
+    for offset in range(0, count, batch_size):
+        items = [_reading(device_id, i) for i in range(offset, min(offset + batch_size, count))]
+        if ndjson:
+            r = await client.post(
+                "/sensor-data/batch",
+                content="\n".join(json.dumps(x) for x in items),
+                headers={"content-type": "application/x-ndjson"},
+            )
+        else:
+            r = await client.post("/sensor-data/batch", json=items)
+        r.raise_for_status()
+        if r.json()["rejected"]:
+            raise RuntimeError(f"unexpected rejects: {r.json()['rejected'][:3]}")
+    return time.perf_counter() - started
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000/api/v2.0")
+    parser.add_argument("--device-id", required=True)
+    parser.add_argument("--count", type=int, default=10_000)
+    parser.add_argument("--batch-size", type=int, default=1_000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as client:
+        results = {
+            "single": await _single(client, args.device_id, args.count, args.concurrency),
+            "batch_json": await _batch(client, args.device_id, args.count, args.batch_size, False),
+            "batch_ndjson": await _batch(client, args.device_id, args.count, args.batch_size, True),
+        }
+
+    for name, elapsed in results.items():
+        print(f"{name:<14} {args.count / elapsed:>10.0f} rows/s  ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+"""Сериализация больших списков: response_model против кортежей + orjson.
+
+Обычный путь повторяет то, что делает FastAPI для ``response_model=List[...]``:
+валидация каждого ORM-объекта схемой, jsonable_encoder и json.dumps.
+Быстрый путь — ``pagination._encode_rows`` по кортежам колонок. Перед замером
+проверяется, что байты ответа совпадают.
+
+Запуск из apps/device-management (БД не нужна):
+
+    python benchmarks/bench_serialization.py --rows 50000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from models import Device, DeviceType, SensorData  # noqa: E402
+from pagination import _encode_rows  # noqa: E402
+from schemas import DeviceResponse, SensorDataResponse  # noqa: E402
+
+
+def _devices(count: int) -> list:
+    home_id = uuid.uuid4()
+    return [
+        Device(
+            id=uuid.uuid4(),
+            name=f"Датчик {i}",
+            type=DeviceType.SENSOR,
+            model="TH-100",
+            firmware_version="1.2.3",
+            status="active",
+            location="Кухня",
+            unit="C",
+            home_id=home_id if i % 2 else None,
+            room_id=None,
+            activation_code=f"code-{i}",
+            is_activated=bool(i % 3),
+            activated_at=datetime(2024, 1, 1, 12, 0, 0, i % 1000) if i % 3 else None,
+        )
+        for i in range(count)
+    ]
+
+
+def _readings(count: int) -> list:
+    device_id = uuid.uuid4()
+    start = datetime(2024, 1, 1)
+    return [
+        SensorData(
+            id=uuid.uuid4(),
+            device_id=device_id,
+            timestamp=start + timedelta(seconds=i, microseconds=i % 1000),
+            type="temperature",
+            value=f"{20 + i % 10}.5",
+        )
+        for i in range(count)
+    ]
+
+
+def _response_model_path(adapter: TypeAdapter, objects: list) -> bytes:
+    validated = adapter.validate_python(objects, from_attributes=True)
+    content = jsonable_encoder(validated)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def _fast_path(fields: List[str], rows: list) -> bytes:
+    return _encode_rows(fields, rows)
+
+
+def _bench(fn, *args, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = {}
+    for name, schema, objects in (
+        ("devices", DeviceResponse, _devices(args.rows)),
+        ("sensor_data", SensorDataResponse, _readings(args.rows)),
+    ):
+        adapter = TypeAdapter(List[schema])
+        fields = list(schema.model_fields)
+        rows = [tuple(getattr(obj, field) for field in fields) for obj in objects]
+
+        assert _response_model_path(adapter, objects) == _fast_path(fields, rows), name
+
+        slow = _bench(_response_model_path, adapter, objects, repeat=args.repeat)
+        fast = _bench(_fast_path, fields, rows, repeat=args.repeat)
+        results[name] = {
+            "response_model_ms": round(slow * 1000, 1),
+            "orjson_tuples_ms": round(fast * 1000, 1),
+            "speedup": round(slow / fast, 1),
+        }
+
+    print(json.dumps({"rows": args.rows, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Холодный старт: время импорта main, сборки приложения и первого ответа.
+
+Каждый прогон — свежий интерпретатор. Для time-to-first-response поднимается
+uvicorn, и от запуска процесса до первого 200 опрашивается --path; lifespan
+при этом ходит в БД и Kafka из окружения (DATABASE_URL, KAFKA_BOOTSTRAP_SERVERS).
+
+Запуск из apps/device-management:
+
+    python benchmarks/bench_startup.py --runs 5
+    OPENAPI_SCHEMA_PATH=/tmp/openapi.json python benchmarks/bench_startup.py
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORT_PROBE = """
+import json, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+app = main.create_app()
+t2 = time.perf_counter()
+app.openapi()
+t3 = time.perf_counter()
+app.openapi()
+t4 = time.perf_counter()
+print(json.dumps({"import_s": t1 - t0, "create_app_s": t2 - t1,
+                  "openapi_first_s": t3 - t2, "openapi_cached_s": t4 - t3}))
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _probe_import() -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", _IMPORT_PROBE],
+        cwd=APP_DIR,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _get(url: str) -> float:
+    started = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=5) as response:
+        response.read()
+    return time.perf_counter() - started
+
+
+def _probe_first_response(path: str, timeout: float) -> dict:
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}{path}"
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=APP_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+            if time.perf_counter() - started > timeout:
+                raise RuntimeError(f"no response from {url} in {timeout}s")
+            try:
+                _get(url)
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        first = time.perf_counter() - started
+        return {"first_response_s": first, "second_request_s": _get(url)}
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def _summary(samples: list) -> dict:
+    return {
+        key: {
+            "median_ms": round(statistics.median(s[key] for s in samples) * 1000, 2),
+            "max_ms": round(max(s[key] for s in samples) * 1000, 2),
+        }
+        for key in samples[0]
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/openapi.json")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--skip-server", action="store_true", help="только импорт и create_app")
+    args = parser.parse_args()
+
+    samples = []
+    for _ in range(args.runs):
+        sample = _probe_import()
+        if not args.skip_server:
+            sample.update(_probe_first_response(args.path, args.timeout))
+        samples.append(sample)
+
+    print(json.dumps(
+        {
+            "runs": args.runs,
+            "path": args.path,
+            "openapi_schema_path": os.getenv("OPENAPI_SCHEMA_PATH", ""),
+            "results": _summary(samples),
+        },
+        indent=2,
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Наполнение БД данными для нагрузочных прогонов (bench_load.py).
+
+Всё генерируется на стороне PostgreSQL через generate_series: пользователь
+на каждый дом, по --rooms-per-home комнат, устройства раскладываются по домам
+и комнатам, показания — равномерно по устройствам, по минуте на показание.
+Идентификаторы детерминированы (``bench_uuid``), поэтому нагрузочный скрипт
+выбирает случайные сущности, не читая их из БД. После вставки считаются
+роллапы и делается ANALYZE.
+
+По умолчанию объём «реалистичный»: 10k домов, 100k устройств, 10M показаний;
+--scale 0.01 даёт быстрый прогон. --reset очищает таблицы приложения —
+запускать только на отдельной БД.
+
+Запуск из apps/device-management (БД из DATABASE_URL, схема — alembic upgrade head):
+
+    python benchmarks/seed.py --reset
+    python benchmarks/seed.py --reset --scale 0.01
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text  # noqa: E402
+
+from database import AsyncSessionLocal, dispose_db, get_sync_engine  # noqa: E402
+from rollups import refresh_rollups  # noqa: E402
+
+TABLES = (
+    "automation_rules",
+    "automation_scenarios",
+    "sensor_data_rollup_invalidations",
+    "sensor_data_rollup_1d",
+    "sensor_data_rollup_1h",
+    "sensor_data_rollup_1m",
+    "rollup_state",
+    "sensor_data",
+    "devices",
+    "rooms",
+    "homes",
+    "users",
+    "outbox_events",
+)
+
+READING_TYPE = "temperature"
+READINGS_CHUNK = 1_000_000
+
+
+def bench_uuid(kind: str, i: int) -> uuid.UUID:
+    """UUID v4 из md5(kind || i); в SQL то же самое делает функция _uuid ниже."""
+    digest = hashlib.md5(f"{kind}{i}".encode()).hexdigest()
+    return uuid.UUID(digest[:12] + "4" + digest[13:16] + "8" + digest[17:])
+
+
+def _uuid(kind: str, expr: str) -> str:
+    return f"overlay(overlay(md5('{kind}' || {expr}) placing '4' from 13) placing '8' from 17)::uuid"
+
+
+_USERS = f"""
+INSERT INTO users (id, email, name, registered_at)
+SELECT {_uuid('user', 'i')}, 'user' || i || '@bench.local', 'User ' || i, timezone('utc', now())
+FROM generate_series(1, :homes) AS i
+"""
+
+_HOMES = f"""
+INSERT INTO homes (id, name, address, owner_id)
+SELECT {_uuid('home', 'i')}, 'Home ' || i, 'Street ' || i, {_uuid('user', 'i')}
+FROM generate_series(1, :homes) AS i
+"""
+
+_ROOMS = f"""
+INSERT INTO rooms (id, name, info, home_id)
+SELECT {_uuid('room', 'j')}, 'Room ' || j, NULL, {_uuid('home', '((j - 1) / :rooms_per_home + 1)')}
+FROM generate_series(1, :homes * :rooms_per_home) AS j
+"""
+
+# устройство k: дом (k-1) % homes + 1, комната внутри дома — по кругу
+_DEVICES = f"""
+INSERT INTO devices (id, name, type, model, firmware_version, status, location, unit,
+                     room_id, home_id, owner_id, activation_code, is_activated, activated_at)
+SELECT {_uuid('device', 'k')}, 'Sensor ' || k, 'SENSOR', 'TH-100', '1.2.3', 'active', 'Room', 'C',
+       {_uuid('room', '(h - 1) * :rooms_per_home + ((k - 1) / :homes) % :rooms_per_home + 1')},
+       {_uuid('home', 'h')}, {_uuid('user', 'h')},
+       'bench-' || k, true, timezone('utc', now())
+FROM generate_series(1, :devices) AS k, LATERAL (SELECT (k - 1) % :homes + 1 AS h) AS home
+"""
+
+# показание n: устройство (n-1) % devices + 1, по минуте на показание, последнее — час назад;
+# роллапы подхватят их первым же пересчётом после commit
+_READINGS = f"""
+INSERT INTO sensor_data (id, device_id, timestamp, type, value, numeric_value)
+SELECT gen_random_uuid(), {_uuid('device', '((n - 1) % :devices + 1)')},
+       timezone('utc', now()) - interval '1 hour'
+           - make_interval(mins => (:per_device - (n - 1) / :devices)::int),
+       :type, (20 + n % 10)::text, 20 + n % 10
+FROM generate_series(:lo, :hi) AS n
+"""
+
+# сценарий s у владельца дома s, два SENSOR-правила на устройства этого дома
+_SCENARIOS = f"""
+INSERT INTO automation_scenarios (id, name, user_id, enabled, created_at)
+SELECT {_uuid('scenario', 's')}, 'Scenario ' || s, {_uuid('user', 's')}, true, timezone('utc', now())
+FROM generate_series(1, :scenarios) AS s
+"""
+
+_RULES = f"""
+INSERT INTO automation_rules (id, scenario_id, trigger_type, trigger_condition, action_type, action_target)
+SELECT gen_random_uuid(), {_uuid('scenario', 's')}, 'SENSOR',
+       {_uuid('device', 's')}::text || '.{READING_TYPE} > ' || (25 + r),
+       CASE WHEN r = 1 THEN 'TURN_ON' ELSE 'TURN_OFF' END::actiontype,
+       {_uuid('device', 's')}
+FROM generate_series(1, :scenarios) AS s, generate_series(1, 2) AS r
+"""
+
+
+def _step(name: str, started: float) -> None:
+    print(f"{name:<12} {time.perf_counter() - started:8.1f}s", flush=True)
+
+
+def seed(homes: int, rooms_per_home: int, devices: int, readings: int, scenarios: int, reset: bool) -> None:
+    engine = get_sync_engine()
+    params = {
+        "homes": homes,
+        "rooms_per_home": rooms_per_home,
+        "devices": devices,
+        "scenarios": scenarios,
+        "per_device": readings // devices,
+        "type": READING_TYPE,
+    }
+    with engine.begin() as conn:
+        if reset:
+            conn.execute(text(f"TRUNCATE {', '.join(TABLES)} CASCADE"))
+        for name, sql in (
+            ("users", _USERS),
+            ("homes", _HOMES),
+            ("rooms", _ROOMS),
+            ("devices", _DEVICES),
+            ("scenarios", _SCENARIOS),
+            ("rules", _RULES),
+        ):
+            started = time.perf_counter()
+            conn.execute(text(sql), params)
+            _step(name, started)
+
+    # показания — отдельными транзакциями по READINGS_CHUNK строк
+    started = time.perf_counter()
+    for lo in range(1, readings + 1, READINGS_CHUNK):
+        hi = min(lo + READINGS_CHUNK - 1, readings)
+        with engine.begin() as conn:
+            conn.execute(text(_READINGS), {**params, "lo": lo, "hi": hi})
+        print(f"  readings {hi:>12,}", flush=True)
+    _step("readings", started)
+
+    started = time.perf_counter()
+    asyncio.run(_refresh_rollups())
+    _step("rollups", started)
+
+    started = time.perf_counter()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE"))
+    _step("analyze", started)
+
+
+async def _refresh_rollups() -> None:
+    try:
+        async with AsyncSessionLocal() as db:
+            await refresh_rollups(db)
+    finally:
+        await dispose_db()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--homes", type=int, default=10_000)
+    parser.add_argument("--rooms-per-home", type=int, default=4)
+    parser.add_argument("--devices", type=int, default=100_000)
+    parser.add_argument("--readings", type=int, default=10_000_000)
+    parser.add_argument("--scenarios", type=int, default=1_000)
+    parser.add_argument("--scale", type=float, default=1.0, help="множитель для всех объёмов")
+    parser.add_argument("--reset", action="store_true", help="очистить таблицы перед вставкой")
+    args = parser.parse_args()
+
+    def scaled(value: int) -> int:
+        return max(1, int(value * args.scale))
+
+    homes = scaled(args.homes)
+    devices = max(scaled(args.devices), homes)
+    seed(
+        homes=homes,
+        rooms_per_home=args.rooms_per_home,
+        devices=devices,
+        readings=max(scaled(args.readings), devices),
+        scenarios=min(scaled(args.scenarios), homes),
+        reset=args.reset,
+    )
+
+
+if __name__ == "__main__":
+    main()
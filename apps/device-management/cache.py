@@ -0,0 +1,229 @@
+"""Read-through кэш GET-ручек устройств, домов, комнат и пользователей.
+
+В кэше лежат уже готовые DTO (не ORM-объекты, привязанные к сессии).
+Свой процесс инвалидирует запись сразу на PUT/DELETE; остальные воркеры —
+по событиям ``uiCommand``/``uiActivatedCommand``/``deleteDeviceNotification``,
+которые и так публикуются через outbox. Для домов, комнат и пользователей
+событий нет, там свежесть между воркерами ограничена TTL.
+"""
+import abc
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from uuid import UUID
+
+from aiokafka import AIOKafkaConsumer
+
+from kafka import BOOTSTRAP_SERVERS
+
+__all__ = [
+    "CACHE_INVALIDATION_TOPICS",
+    "EntityCache",
+    "LRUTTLCache",
+    "NullCache",
+    "cache_stats",
+    "caches",
+    "run_cache_invalidator",
+]
+
+logger = logging.getLogger("cache")
+
+# memory | none
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_INVALIDATION_TOPICS = ("uiCommand", "uiActivatedCommand", "deleteDeviceNotification")
+CACHE_RETRY_BACKOFF_S = float(os.getenv("CACHE_RETRY_BACKOFF_S", "5"))
+
+# сущность -> (TTL по умолчанию, размер по умолчанию); переопределяются CACHE_<NAME>_TTL_S / _MAX_SIZE
+_DEFAULTS: Dict[str, Tuple[float, int]] = {
+    "device": (30.0, 10_000),
+    "home": (60.0, 2_000),
+    "room": (60.0, 5_000),
+    "user": (60.0, 5_000),
+}
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def as_dict(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+class EntityCache(abc.ABC):
+    """Интерфейс кэша; реализации подменяются через CACHE_BACKEND."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stats = CacheStats()
+        # растёт на каждую инвалидацию: загрузка, начатая до неё, в кэш не попадёт
+        self.generation = 0
+
+    @abc.abstractmethod
+    def get(self, key: Hashable) -> Optional[Any]:
+        ...
+
+    @abc.abstractmethod
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        ...
+
+    @abc.abstractmethod
+    def invalidate(self, key: Hashable) -> None:
+        ...
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        ...
+
+    def __len__(self) -> int:
+        return 0
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Optional[Any]:
+        """Read-through: None от loader (нет сущности) не кэшируется."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        generation = self.generation
+        value = await loader()
+        if value is not None:
+            self.set(key, value, generation)
+        return value
+
+    def as_dict(self) -> dict:
+        return {"backend": type(self).__name__, "size": len(self), **self.stats.as_dict()}
+
+
+class NullCache(EntityCache):
+    """Кэш выключен: каждый запрос идёт в БД."""
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        self.stats.misses += 1
+        return None
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        pass
+
+    def invalidate(self, key: Hashable) -> None:
+        self.generation += 1
+
+    def clear(self) -> None:
+        self.generation += 1
+
+
+class LRUTTLCache(EntityCache):
+    def __init__(self, name: str, ttl: float, max_size: int):
+        super().__init__(name)
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            self.stats.misses += 1
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        if generation is not None and generation != self.generation:
+            return  # пока грузили, запись успели инвалидировать
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.stats.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self.generation += 1
+        if self._data.pop(key, None) is not None:
+            self.stats.invalidations += 1
+
+    def clear(self) -> None:
+        self.generation += 1
+        self.stats.invalidations += len(self._data)
+        self._data.clear()
+
+
+def _make_cache(name: str) -> EntityCache:
+    if CACHE_BACKEND == "none":
+        return NullCache(name)
+    default_ttl, default_size = _DEFAULTS[name]
+    prefix = f"CACHE_{name.upper()}"
+    return LRUTTLCache(
+        name,
+        ttl=float(os.getenv(f"{prefix}_TTL_S", str(default_ttl))),
+        max_size=int(os.getenv(f"{prefix}_MAX_SIZE", str(default_size))),
+    )
+
+
+caches: Dict[str, EntityCache] = {name: _make_cache(name) for name in _DEFAULTS}
+
+
+def cache_stats() -> dict:
+    return {name: cache.as_dict() for name, cache in caches.items()}
+
+
+def _device_id_from_event(value: bytes) -> Optional[UUID]:
+    try:
+        return UUID(json.loads(value)["id"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+async def run_cache_invalidator() -> None:
+    """Фоновый цикл: события изменений устройств от всех воркеров сбрасывают локальный кэш.
+
+    Без group_id каждый процесс читает все партиции сам, с конца топика.
+    """
+    device_cache = caches["device"]
+    while True:
+        consumer = AIOKafkaConsumer(
+            *CACHE_INVALIDATION_TOPICS,
+            bootstrap_servers=BOOTSTRAP_SERVERS,
+            group_id=None,
+            auto_offset_reset="latest",
+        )
+        try:
+            await consumer.start()
+            # пока подписки не было, события могли пройти мимо
+            device_cache.clear()
+            async for message in consumer:
+                device_id = _device_id_from_event(message.value)
+                if device_id is not None:
+                    device_cache.invalidate(device_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Cache invalidation consumer failed")
+        finally:
+            await consumer.stop()
+        # потеряли поток событий — не доверяем содержимому
+        device_cache.clear()
+        await asyncio.sleep(CACHE_RETRY_BACKOFF_S)
@@ -0,0 +1,326 @@
+"""Воркер приёма показаний: Kafka -> sensor_data пачками.
+
+Запускается отдельно от API:
+
+    python consumer.py
+
+Каждый из CONSUMER_WORKERS воркеров — свой AIOKafkaConsumer в общей группе,
+так что партиции топика распределяются между ними. Оффсеты коммитятся только
+после успешного commit транзакции в БД (at-least-once).
+
+Пачка, которую не удалось записать CONSUMER_MAX_ATTEMPTS раз подряд, делится
+пополам до отдельных сообщений: записывается всё, что пишется, а сообщения,
+которые падают и поодиночке, уходят в SENSOR_READINGS_DLQ_TOPIC. Оффсеты
+коммитятся после каждой записанной части, так что повтор после сбоя
+начинается с первой незаписанной, а не с начала пачки. Потеря связи с БД сообщение виноватым не делает —
+такая пачка просто повторяется.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, List
+
+import asyncpg
+from aiokafka import AIOKafkaConsumer, ConsumerRecord, TopicPartition
+from aiokafka.errors import CommitFailedError
+from sqlalchemy import exc as sa_exc
+
+from database import AsyncSessionLocal
+from ingest import validate_readings, write_readings
+from kafka import BOOTSTRAP_SERVERS, send_and_wait, shutdown_kafka
+from rules import load_rule_engine, rule_engine
+from scenario_sync import ScenarioSync
+
+logger = logging.getLogger("consumer")
+
+SENSOR_READINGS_TOPIC = os.getenv("SENSOR_READINGS_TOPIC", "sensorReadings")
+SENSOR_READINGS_DLQ_TOPIC = os.getenv("SENSOR_READINGS_DLQ_TOPIC", "sensorReadingsDLQ")
+CONSUMER_GROUP = os.getenv("SENSOR_READINGS_GROUP", "device-management-ingest")
+CONSUMER_WORKERS = int(os.getenv("CONSUMER_WORKERS", "4"))
+BATCH_MAX_SIZE = int(os.getenv("CONSUMER_BATCH_MAX_SIZE", "5000"))
+BATCH_MAX_WAIT_MS = int(os.getenv("CONSUMER_BATCH_MAX_WAIT_MS", "500"))
+RETRY_BACKOFF_S = float(os.getenv("CONSUMER_RETRY_BACKOFF_S", "2"))
+MAX_ATTEMPTS = int(os.getenv("CONSUMER_MAX_ATTEMPTS", "3"))
+STATS_PORT = int(os.getenv("CONSUMER_STATS_PORT", "8001"))
+
+
+class WorkerStats:
+    """Счётчики одного воркера; отдаются как JSON на STATS_PORT."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.batches = 0
+        self.rows_written = 0
+        self.rows_rejected = 0
+        self.failures = 0
+        self.split_batches = 0
+        self.dead_lettered = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_batch_ms = 0.0
+        self.lag: Dict[str, int] = {}
+
+    def record_batch(self, written: int, rejected: int, elapsed_ms: float) -> None:
+        size = written + rejected
+        self.batches += 1
+        self.rows_written += written
+        self.rows_rejected += rejected
+        self.last_batch_size = size
+        self.max_batch_size = max(self.max_batch_size, size)
+        self.last_batch_ms = elapsed_ms
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "worker": self.name,
+            "batches": self.batches,
+            "rows_written": self.rows_written,
+            "rows_rejected": self.rows_rejected,
+            "failures": self.failures,
+            "split_batches": self.split_batches,
+            "dead_lettered": self.dead_lettered,
+            "last_batch_size": self.last_batch_size,
+            "avg_batch_size": round((self.rows_written + self.rows_rejected) / self.batches, 1)
+            if self.batches
+            else 0,
+            "max_batch_size": self.max_batch_size,
+            "last_batch_ms": round(self.last_batch_ms, 2),
+            "lag": self.lag,
+            "total_lag": sum(self.lag.values()),
+        }
+
+
+# ---------------------------------------------------------------------------
+
+def _decode(raw: bytes) -> List[Any]:
+    """Сообщение — одно показание или массив показаний; битое сообщение -> [None]."""
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        logger.warning("Skipping non-JSON message")
+        return [None]
+    return value if isinstance(value, list) else [value]
+
+
+async def _collect_batch(consumer: AIOKafkaConsumer) -> Dict[TopicPartition, list]:
+    """Набираем пачку, пока не упрёмся в BATCH_MAX_SIZE или BATCH_MAX_WAIT_MS."""
+    batch: Dict[TopicPartition, list] = {}
+    size = 0
+    deadline = time.monotonic() + BATCH_MAX_WAIT_MS / 1000
+    while size < BATCH_MAX_SIZE:
+        remaining_ms = int((deadline - time.monotonic()) * 1000)
+        if remaining_ms <= 0:
+            break
+        fetched = await consumer.getmany(
+            timeout_ms=remaining_ms, max_records=BATCH_MAX_SIZE - size
+        )
+        for tp, messages in fetched.items():
+            batch.setdefault(tp, []).extend(messages)
+            size += len(messages)
+    return batch
+
+
+async def _update_lag(consumer: AIOKafkaConsumer, stats: WorkerStats) -> None:
+    lag = {}
+    for tp in consumer.assignment():
+        highwater = consumer.highwater(tp)
+        if highwater is None:  # по партиции ещё не было fetch
+            continue
+        position = await consumer.position(tp)
+        lag[f"{tp.topic}-{tp.partition}"] = max(0, highwater - position)
+    stats.lag = lag
+
+
+async def _write_batch(messages: List[ConsumerRecord], stats: WorkerStats) -> None:
+    items: List[Any] = []
+    for message in messages:
+        items.extend(_decode(message.value))
+
+    started = time.perf_counter()
+    rows, rejects = validate_readings(items)
+    async with AsyncSessionLocal() as db:
+        written = await write_readings(db, rows, rejects)
+        await db.commit()
+
+    stats.record_batch(written, len(rejects), (time.perf_counter() - started) * 1000)
+    if rejects:
+        logger.warning("%s: rejected %d readings, first: %s", stats.name, len(rejects), rejects[0])
+
+
+# сбои связи и ресурсов БД: данные тут ни при чём, сообщение в DLQ не отправляем
+_TRANSIENT_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.TransactionRollbackError,
+    asyncpg.InsufficientResourcesError,
+    asyncpg.OperatorInterventionError,
+    sa_exc.TimeoutError,
+)
+
+
+def _is_transient(error: BaseException) -> bool:
+    # SQLAlchemy заворачивает исключение asyncpg: исходное лежит в .orig / __cause__
+    while error is not None:
+        if isinstance(error, _TRANSIENT_ERRORS) or getattr(error, "connection_invalidated", False):
+            return True
+        error = getattr(error, "orig", None) or error.__cause__
+    return False
+
+
+async def _dead_letter(message: ConsumerRecord, error: Exception, stats: WorkerStats) -> None:
+    await send_and_wait(
+        SENSOR_READINGS_DLQ_TOPIC,
+        key=f"{message.topic}-{message.partition}-{message.offset}",
+        value={
+            "topic": message.topic,
+            "partition": message.partition,
+            "offset": message.offset,
+            "timestamp": message.timestamp,
+            "value": message.value.decode("utf-8", "replace") if message.value is not None else None,
+            "error": repr(error),
+        },
+    )
+    stats.dead_lettered += 1
+    logger.error(
+        "%s: %s-%d@%d sent to %s: %r",
+        stats.name, message.topic, message.partition, message.offset, SENSOR_READINGS_DLQ_TOPIC, error,
+    )
+
+
+async def _commit_offsets(
+    consumer: AIOKafkaConsumer,
+    messages: Iterable[ConsumerRecord],
+    positions: Dict[TopicPartition, int],
+    name: str,
+) -> None:
+    """Коммитим оффсеты за messages; positions — откуда перечитывать при сбое."""
+    offsets: Dict[TopicPartition, int] = {}
+    for message in messages:
+        tp = TopicPartition(message.topic, message.partition)
+        offsets[tp] = max(offsets.get(tp, 0), message.offset + 1)
+    try:
+        await consumer.commit(offsets)
+    except CommitFailedError:
+        # партиции ушли другому воркеру при ребалансе — он перечитает пачку
+        logger.warning("%s: offset commit failed after rebalance", name)
+        return
+    positions.update(offsets)
+
+
+async def _write_split(
+    consumer: AIOKafkaConsumer,
+    messages: List[ConsumerRecord],
+    positions: Dict[TopicPartition, int],
+    stats: WorkerStats,
+) -> None:
+    """Пишем пачку половинами, пока сбой не сузится до одного сообщения; его — в DLQ.
+
+    Части идут по порядку, поэтому записанное — всегда префикс пачки: его
+    оффсеты коммитятся сразу, и повтор после сбоя в следующей части не
+    запишет те же показания второй раз.
+    """
+    stats.split_batches += 1
+    pending = [messages]
+    while pending:
+        chunk = pending.pop()
+        try:
+            await _write_batch(chunk, stats)
+        except Exception as e:
+            if _is_transient(e):
+                raise
+            if len(chunk) > 1:
+                middle = len(chunk) // 2
+                pending += [chunk[middle:], chunk[:middle]]
+                continue
+            await _dead_letter(chunk[0], e, stats)
+        await _commit_offsets(consumer, chunk, positions, stats.name)
+
+
+async def run_worker(name: str, stats: WorkerStats) -> None:
+    consumer = AIOKafkaConsumer(
+        SENSOR_READINGS_TOPIC,
+        bootstrap_servers=BOOTSTRAP_SERVERS,
+        group_id=CONSUMER_GROUP,
+        client_id=name,
+        enable_auto_commit=False,
+        auto_offset_reset="earliest",
+        max_poll_records=BATCH_MAX_SIZE,
+    )
+    await consumer.start()
+    logger.info("%s subscribed to %s", name, SENSOR_READINGS_TOPIC)
+    attempts = 0  # неудачных попыток подряд с одних и тех же оффсетов
+    try:
+        while True:
+            batch = await _collect_batch(consumer)
+            await _update_lag(consumer, stats)
+            if not batch:
+                continue
+
+            messages = [message for tp_messages in batch.values() for message in tp_messages]
+            positions = {tp: tp_messages[0].offset for tp, tp_messages in batch.items()}
+            try:
+                if attempts < MAX_ATTEMPTS:
+                    await _write_batch(messages, stats)
+                else:
+                    await _write_split(consumer, messages, positions, stats)
+            except Exception:
+                # транзакция откатилась: возвращаемся к первому незаписанному сообщению
+                attempts += 1
+                stats.failures += 1
+                logger.exception("%s: batch write failed (attempt %d), retrying", name, attempts)
+                assigned = consumer.assignment()
+                for tp, offset in positions.items():
+                    if tp in assigned:
+                        consumer.seek(tp, offset)
+                await asyncio.sleep(RETRY_BACKOFF_S)
+                continue
+            attempts = 0
+
+            # оффсеты — только после успешного commit в БД
+            await _commit_offsets(consumer, messages, positions, name)
+    finally:
+        await consumer.stop()
+
+
+# ---------------------------------------------------------------------------
+# stats endpoint: GET на любой путь -> JSON со счётчиками всех воркеров
+
+async def _serve_stats(workers: List[WorkerStats]) -> asyncio.AbstractServer:
+    async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await reader.readline()
+        body = json.dumps(
+            {
+                "topic": SENSOR_READINGS_TOPIC,
+                "group": CONSUMER_GROUP,
+                "workers": [w.as_dict() for w in workers],
+            }
+        ).encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+            + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(_handle, host="0.0.0.0", port=STATS_PORT)
+
+
+async def main() -> None:
+    workers = [WorkerStats(f"ingest-{i}") for i in range(CONSUMER_WORKERS)]
+    server = await _serve_stats(workers)
+    scenario_sync = ScenarioSync([(rule_engine, load_rule_engine)])
+    await scenario_sync.start()
+    try:
+        await asyncio.gather(scenario_sync.run(), *(run_worker(w.name, w) for w in workers))
+    finally:
+        server.close()
+        await shutdown_kafka()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    asyncio.run(main())
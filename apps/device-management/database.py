@@ -1,20 +1,90 @@
+import os
+from functools import lru_cache
+from typing import AsyncGenerator
+
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = 'postgresql://postgres:device-management-user@db/dockert'
+from index_check import install_index_check
+from metrics import TimedQueuePool, register_pool_collector
+from sql_profile import install_sql_profiler
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+SQLALCHEMY_DATABASE_URL = os.getenv(
+    "DATABASE_URL", "postgresql://postgres:device-management-user@db/dockert"
+)
+# тот же DSN, но через драйвер asyncpg
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    SQLALCHEMY_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1),
+)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
 
 Base = declarative_base()
 
+# предупреждать о запросах, фильтрующих только по колонкам без индекса
+install_index_check()
+
+# ---------------------------------------------------------------------------
+# async-путь: используется всеми роутерами.
+# create_async_engine не открывает соединений: пул наполняется на первом запросе
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+    poolclass=TimedQueuePool,
+)
+register_pool_collector(async_engine.pool)
+install_sql_profiler(async_engine)
+
+# expire_on_commit=False: после commit атрибуты остаются загруженными,
+# поэтому отдельный refresh-запрос не нужен
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# ---------------------------------------------------------------------------
+# sync-путь: только для скриптов, миграций и тестов, в обработчиках запросов не использовать
+
+# драйвер указываем явно: SQLAlchemy 2.1 для голого postgresql:// берёт psycopg 3,
+# а в образе стоит psycopg2
+SYNC_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgresql://", "postgresql+psycopg2://", 1)
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+
+@lru_cache(maxsize=None)
+def get_sync_engine():
+    """Sync-движок создаётся по требованию: веб-процессу psycopg2 не нужен."""
+    return create_engine(SYNC_DATABASE_URL)
+
+
+async def dispose_db() -> None:
+    """Закрываем соединения пула при остановке приложения."""
+    await async_engine.dispose()
+
+
 def get_db():
-    db = SessionLocal()
+    db = SessionLocal(bind=get_sync_engine())
     try:
         yield db
     finally:
         db.close()
-
-
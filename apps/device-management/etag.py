@@ -0,0 +1,104 @@
+"""ETag и условные запросы (If-None-Match → 304, If-Match → 412).
+
+ETag сущности — её ``version`` (новое значение row_version_seq на каждом
+INSERT/UPDATE). ETag списка — count, max и sum ``version`` строк самой
+страницы плюс query-строка: это один агрегат по тому же индексу, что и
+страница, без общего счётчика, который сериализовал бы писателей. Версии
+не повторяются, поэтому любая вставка, правка или удаление в пределах
+страницы меняет хотя бы одно из трёх чисел. Агрегат и страница читаются
+из одного снимка REPEATABLE READ, иначе запись, закоммиченная между ними,
+дала бы ETag, не описывающий отданное тело. На 304 для списка не строятся
+ORM-объекты и не сериализуется страница; для закэшированной сущности нет
+ни одного запроса.
+"""
+import hashlib
+from typing import Any, NamedTuple, Optional, Set, Type
+
+from fastapi import HTTPException, Request, Response, status
+from pydantic import BaseModel
+from sqlalchemy import Select, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+__all__ = [
+    "Tagged",
+    "check_if_match",
+    "collection_etag",
+    "entity_etag",
+    "if_match_requested",
+    "none_match",
+    "not_modified",
+    "tagged",
+]
+
+
+class Tagged(NamedTuple):
+    """DTO вместе с ETag: так сущность лежит в кэше."""
+    body: Any
+    etag: str
+
+
+def entity_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def tagged(schema: Type[BaseModel], obj: Any) -> Tagged:
+    return Tagged(schema.model_validate(obj, from_attributes=True), entity_etag(obj.version))
+
+
+async def collection_etag(db: AsyncSession, selection: Select, request: Request) -> str:
+    """ETag по строкам ``selection`` (см. ``pagination.page_selection``).
+
+    Переводит транзакцию сессии в REPEATABLE READ, поэтому вызывается первым
+    запросом в ней: страница, прочитанная следом, видит тот же снимок.
+    Для ``stream_ndjson`` снимок передаётся через ``export_snapshot``.
+    """
+    await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    rows = selection.subquery()
+    count, top, total = (
+        await db.execute(
+            select(func.count(), func.max(rows.c.version), func.sum(rows.c.version))
+        )
+    ).one()
+    digest = hashlib.blake2b(
+        f"{count}:{top}:{total}?{request.url.query}".encode(), digest_size=8
+    ).hexdigest()
+    return f'"{digest}"'
+
+
+def _parse(header: str, weak: bool) -> Set[str]:
+    tags = set()
+    for tag in header.split(","):
+        tag = tag.strip()
+        if weak and tag.startswith("W/"):
+            tag = tag[2:]
+        tags.add(tag)
+    return tags
+
+
+def none_match(request: Request, etag: str) -> bool:
+    """If-None-Match совпал (слабое сравнение): клиенту хватит 304."""
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    return header.strip() == "*" or etag in _parse(header, weak=True)
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+
+def if_match_requested(request: Request) -> bool:
+    """Есть If-Match: строку стоит читать FOR UPDATE до проверки версии."""
+    return "if-match" in request.headers
+
+
+def check_if_match(request: Request, etag: Optional[str]) -> None:
+    """412, если If-Match не совпал с текущим ETag (строгое сравнение)."""
+    header = request.headers.get("if-match")
+    if header is None or header.strip() == "*":
+        return
+    if etag not in _parse(header, weak=False):
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="Resource has been modified",
+        )
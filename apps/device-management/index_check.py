@@ -0,0 +1,106 @@
+"""Проверка, что ORM-запросы фильтруют по индексированным колонкам.
+
+Хук ``do_orm_execute`` смотрит на WHERE каждого SELECT/UPDATE/DELETE: если ни
+одна из колонок фильтра не является ведущей колонкой индекса (PK, Index,
+UNIQUE), запрос помечается. Режим задаётся DB_CHECK_UNINDEXED:
+``warn`` — предупреждение в лог (по разу на набор колонок), ``raise`` — ошибка
+(для dev/CI), ``off`` — выключено. Осознанный полный проход помечается
+``.execution_options(allow_unindexed=True)``.
+
+Отдельно ``python index_check.py`` печатает FK-колонки без индекса и
+завершается с кодом 1, если такие есть.
+"""
+import logging
+import os
+import sys
+from typing import Dict, List, Set
+
+from sqlalchemy import Column, Table, UniqueConstraint, event
+from sqlalchemy.orm import ORMExecuteState, Session
+from sqlalchemy.sql import visitors
+
+__all__ = ["UnindexedFilterError", "install_index_check", "unindexed_filter_columns"]
+
+logger = logging.getLogger("index_check")
+
+DB_CHECK_UNINDEXED = os.getenv("DB_CHECK_UNINDEXED", "warn")  # warn | raise | off
+
+_leading_cache: Dict[Table, Set[str]] = {}
+_reported: Set[tuple] = set()
+
+
+class UnindexedFilterError(RuntimeError):
+    """Запрос фильтрует только по колонкам без индекса."""
+
+
+def _leading_columns(table: Table) -> Set[str]:
+    """Колонки, с которых начинается хотя бы один индекс таблицы."""
+    leading = _leading_cache.get(table)
+    if leading is None:
+        leading = set()
+        if table.primary_key.columns:
+            leading.add(list(table.primary_key.columns)[0].name)
+        for index in table.indexes:
+            leading.add(list(index.columns)[0].name)
+        for constraint in table.constraints:
+            if isinstance(constraint, UniqueConstraint) and constraint.columns:
+                leading.add(list(constraint.columns)[0].name)
+        _leading_cache[table] = leading
+    return leading
+
+
+def unindexed_filter_columns(statement) -> List[Column]:
+    """Колонки фильтра, если ни одна из них не ведёт индекс; иначе пустой список."""
+    where = getattr(statement, "whereclause", None)
+    if where is None:
+        return []
+    columns = [
+        element
+        for element in visitors.iterate(where)
+        if isinstance(element, Column) and isinstance(element.table, Table)
+    ]
+    if any(column.name in _leading_columns(column.table) for column in columns):
+        return []
+    return columns
+
+
+def _check(state: ORMExecuteState) -> None:
+    if not (state.is_select or state.is_update or state.is_delete):
+        return
+    if state.execution_options.get("allow_unindexed"):
+        return
+    columns = unindexed_filter_columns(state.statement)
+    if not columns:
+        return
+    names = tuple(sorted({f"{c.table.name}.{c.name}" for c in columns}))
+    message = f"Query filters only on unindexed columns: {', '.join(names)}"
+    if DB_CHECK_UNINDEXED == "raise":
+        raise UnindexedFilterError(message)
+    if names not in _reported:
+        _reported.add(names)
+        logger.warning(message)
+
+
+def install_index_check() -> None:
+    if DB_CHECK_UNINDEXED != "off" and not event.contains(Session, "do_orm_execute", _check):
+        event.listen(Session, "do_orm_execute", _check)
+
+
+def _unindexed_foreign_keys(metadata) -> List[str]:
+    missing = []
+    for table in metadata.sorted_tables:
+        leading = _leading_columns(table)
+        for fk in table.foreign_keys:
+            if fk.parent.name not in leading:
+                missing.append(f"{table.name}.{fk.parent.name}")
+    return missing
+
+
+if __name__ == "__main__":
+    from database import Base
+    import models  # noqa: F401
+
+    missing = _unindexed_foreign_keys(Base.metadata)
+    for name in missing:
+        print(f"unindexed foreign key: {name}")
+    sys.exit(1 if missing else 0)
@@ -0,0 +1,131 @@
+import json
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Iterable, List, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Device, SensorData, parse_numeric
+from rules import evaluate_readings
+from schemas import SensorDataBase, SensorDataReject
+
+__all__ = ["as_naive_utc", "parse_batch_body", "validate_readings", "write_readings"]
+
+# порядок колонок для COPY / INSERT
+_COLUMNS = ("id", "device_id", "timestamp", "type", "value", "numeric_value")
+
+
+def as_naive_utc(value: datetime) -> datetime:
+    """Колонки timestamp без tz — храним и сравниваем в UTC."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def parse_batch_body(body: bytes, content_type: str) -> Tuple[List[Any], List[SensorDataReject]]:
+    """Разбираем тело запроса: JSON-массив или NDJSON (по строке на показание)."""
+    if content_type.startswith("application/x-ndjson"):
+        items: List[Any] = []
+        rejects: List[SensorDataReject] = []
+        lines = [line for line in body.splitlines() if line.strip()]
+        for index, line in enumerate(lines):
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                items.append(None)
+                rejects.append(SensorDataReject(index=index, errors=[f"invalid JSON: {e}"]))
+        return items, rejects
+
+    try:
+        items = json.loads(body)
+    except ValueError as e:
+        raise ValueError(f"invalid JSON: {e}") from e
+    if not isinstance(items, list):
+        raise ValueError("expected a JSON array of readings")
+    return items, []
+
+
+def validate_readings(items: Iterable[Any]) -> Tuple[List[dict], List[SensorDataReject]]:
+    """Валидируем пачку за один проход; битые строки уходят в rejects, а не валят всё."""
+    rows: List[dict] = []
+    rejects: List[SensorDataReject] = []
+    for index, item in enumerate(items):
+        if item is None:  # уже отбракован на этапе разбора
+            continue
+        try:
+            reading = SensorDataBase.model_validate(item)
+        except ValidationError as e:
+            rejects.append(
+                SensorDataReject(
+                    index=index,
+                    errors=[f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()],
+                )
+            )
+            continue
+
+        rows.append(
+            {
+                "_index": index,
+                "id": uuid.uuid4(),
+                "device_id": reading.device_id,
+                "timestamp": as_naive_utc(reading.timestamp),
+                "type": reading.type,
+                "value": reading.value,
+                "numeric_value": parse_numeric(reading.value),
+            }
+        )
+    return rows, rejects
+
+
+async def write_readings(
+    db: AsyncSession,
+    rows: List[dict],
+    rejects: List[SensorDataReject],
+) -> int:
+    """Пишем пачку одной транзакцией; показания неизвестных устройств отбраковываем.
+
+    На asyncpg используем COPY, на остальных драйверах — multi-row INSERT.
+    Принятые показания прогоняются через движок правил, сработавшие действия
+    ложатся в outbox этой же транзакции. Commit остаётся за вызывающим кодом.
+    """
+    if not rows:
+        return 0
+
+    # один запрос вместо проверки FK на каждую строку
+    device_ids = {row["device_id"] for row in rows}
+    known = set(
+        (await db.scalars(select(Device.id).where(Device.id.in_(device_ids)))).all()
+    )
+
+    accepted = []
+    for row in rows:
+        if row["device_id"] in known:
+            accepted.append(row)
+        else:
+            rejects.append(
+                SensorDataReject(
+                    index=row["_index"],
+                    errors=[f"device_id: device {row['device_id']} not found"],
+                )
+            )
+    if not accepted:
+        return 0
+
+    conn = await db.connection()
+    if conn.dialect.driver == "asyncpg":
+        # транзакция уже открыта запросом выше, COPY попадает в неё же
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            SensorData.__tablename__,
+            records=[tuple(row[c] for c in _COLUMNS) for row in accepted],
+            columns=list(_COLUMNS),
+        )
+    else:
+        await db.execute(
+            insert(SensorData),
+            [{c: row[c] for c in _COLUMNS} for row in accepted],
+        )
+    evaluate_readings(db, accepted)
+    return len(accepted)
@@ -1,36 +1,209 @@
+import asyncio
 import json
-from typing import AsyncGenerator, Optional
+import logging
+import os
+import time
+from typing import Any, Optional, Union
 
 from aiokafka import AIOKafkaProducer
 
-__all__ = ["get_kafka_producer", "shutdown_kafka"]
+from metrics import KAFKA_PRODUCE_FAILURES, KAFKA_PRODUCE_LATENCY, KAFKA_PRODUCE_REJECTED
 
-BOOTSTRAP_SERVERS = "kafka:9092"
+__all__ = [
+    "KafkaUnavailableError",
+    "get_kafka_producer",
+    "kafka_breaker_state",
+    "kafka_stats",
+    "send_and_wait",
+    "send_nowait",
+    "shutdown_kafka",
+    "start_kafka",
+    "warm_up_kafka",
+]
+
+logger = logging.getLogger("kafka")
+
+BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092")
+
+# тюнинг producer'а: небольшой linger собирает сообщения в батчи
+KAFKA_LINGER_MS = int(os.getenv("KAFKA_LINGER_MS", "5"))
+KAFKA_MAX_BATCH_SIZE = int(os.getenv("KAFKA_MAX_BATCH_SIZE", str(64 * 1024)))
+KAFKA_COMPRESSION = os.getenv("KAFKA_COMPRESSION", "lz4") or None  # lz4 | zstd | gzip | ""
+KAFKA_ACKS = os.getenv("KAFKA_ACKS", "all")  # 0 | 1 | all
+KAFKA_REQUEST_TIMEOUT_MS = int(os.getenv("KAFKA_REQUEST_TIMEOUT_MS", "10000"))
+KAFKA_WARMUP_TOPICS = [
+    t for t in os.getenv(
+        "KAFKA_WARMUP_TOPICS",
+        "newDeviceNotification,deleteDeviceNotification,uiActivatedCommand,uiCommand,autoCommand,automationAction",
+    ).split(",") if t
+]
+
+# circuit breaker: после N ошибок подряд не ходим в брокер RESET_TIMEOUT секунд
+KAFKA_BREAKER_FAILURES = int(os.getenv("KAFKA_BREAKER_FAILURES", "5"))
+KAFKA_BREAKER_RESET_S = float(os.getenv("KAFKA_BREAKER_RESET_S", "10"))
+
+
+class KafkaUnavailableError(Exception):
+    """Брокер считается недоступным (circuit breaker открыт)."""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # в half_open в брокер идёт одна проба; зависшая дольше reset_timeout не в счёт
+        self.probe_started_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state != "half_open":
+            return state == "closed"
+        # одна проба за раз: остальные отбиваем сразу, пока она не закроет или не откроет breaker
+        now = time.monotonic()
+        if self.probe_started_at is not None and now - self.probe_started_at < self.reset_timeout:
+            return False
+        self.probe_started_at = now
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.probe_started_at = None
+        if self.failures >= self.failure_threshold or self.opened_at is not None:
+            # в half_open неудачная проба снова открывает breaker на полный таймаут
+            self.opened_at = time.monotonic()
+
+
+class ProducerStats:
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.rejected = 0
+        self.last_latency_ms = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "rejected_by_breaker": self.rejected,
+            "last_latency_ms": round(self.last_latency_ms, 2),
+            "breaker": _breaker.state,
+        }
 
 
 def _json_serializer(obj) -> bytes:
     return json.dumps(obj, default=str).encode()
-_kafka_producer: Optional[AIOKafkaProducer] = None
 
 
-async def get_kafka_producer() -> AsyncGenerator[AIOKafkaProducer, None]:
+def _acks(value: str) -> Union[int, str]:
+    return value if value == "all" else int(value)
 
+
+_kafka_producer: Optional[AIOKafkaProducer] = None
+_breaker = CircuitBreaker(KAFKA_BREAKER_FAILURES, KAFKA_BREAKER_RESET_S)
+_stats = ProducerStats()
+
+
+async def start_kafka() -> AIOKafkaProducer:
+    """Создаём и запускаем общий producer, если его ещё нет."""
     global _kafka_producer
 
     if _kafka_producer is None:
-        _kafka_producer = AIOKafkaProducer(
+        producer = AIOKafkaProducer(
             bootstrap_servers=BOOTSTRAP_SERVERS,
             key_serializer=str.encode,
             value_serializer=_json_serializer,
+            linger_ms=KAFKA_LINGER_MS,
+            max_batch_size=KAFKA_MAX_BATCH_SIZE,
+            compression_type=KAFKA_COMPRESSION,
+            acks=_acks(KAFKA_ACKS),
+            request_timeout_ms=KAFKA_REQUEST_TIMEOUT_MS,
         )
-        await _kafka_producer.start()
+        await producer.start()
+        _kafka_producer = producer
+    return _kafka_producer
+
 
+async def warm_up_kafka() -> None:
+    """Старт producer'а и метаданные топиков при запуске приложения, а не на первом запросе."""
     try:
-        yield _kafka_producer
-    finally:
-       
-        pass
+        producer = await start_kafka()
+        for topic in KAFKA_WARMUP_TOPICS:
+            await producer.partitions_for(topic)
+    except Exception as e:
+        # не валим старт: отправки повторит relay, breaker не даст висеть запросам
+        logger.warning("Kafka warm-up failed: %s", e)
+
+
+async def send_nowait(topic: str, key: Optional[str], value: Any) -> "asyncio.Future":
+    """Fire-and-forget: кладём сообщение в буфер producer'а и сразу возвращаем future.
+
+    При открытом circuit breaker сразу бросаем KafkaUnavailableError,
+    не дожидаясь таймаута брокера.
+    """
+    if not _breaker.allow():
+        _stats.rejected += 1
+        KAFKA_PRODUCE_REJECTED.labels(topic).inc()
+        raise KafkaUnavailableError(f"Kafka circuit is open, dropping send to {topic}")
+
+    started = time.perf_counter()
+    try:
+        producer = await start_kafka()
+        future = await producer.send(topic, key=key, value=value)
+    except Exception:
+        _breaker.record_failure()
+        _stats.failed += 1
+        KAFKA_PRODUCE_FAILURES.labels(topic).inc()
+        raise
+
+    def _on_done(f: "asyncio.Future") -> None:
+        if f.cancelled() or f.exception() is not None:
+            _breaker.record_failure()
+            _stats.failed += 1
+            KAFKA_PRODUCE_FAILURES.labels(topic).inc()
+        else:
+            elapsed = time.perf_counter() - started
+            _breaker.record_success()
+            _stats.sent += 1
+            _stats.last_latency_ms = elapsed * 1000
+            KAFKA_PRODUCE_LATENCY.labels(topic).observe(elapsed)
+
+    if future.done():
+        _on_done(future)
+    else:
+        future.add_done_callback(_on_done)
+    return future
+
+
+async def send_and_wait(topic: str, key: Optional[str], value: Any) -> Any:
+    return await (await send_nowait(topic, key, value))
+
+
+def kafka_stats() -> dict:
+    return _stats.as_dict()
+
+
+def kafka_breaker_state() -> str:
+    return _breaker.state
+
 
+async def get_kafka_producer() -> AIOKafkaProducer:
+    """FastAPI-зависимость: общий producer процесса; останавливает его shutdown_kafka."""
+    return await start_kafka()
 
 
 async def shutdown_kafka() -> None:
@@ -0,0 +1,300 @@
+"""Живой поток показаний: Kafka -> подписчики SSE/WebSocket этого воркера.
+
+Каждый воркер API сам читает SENSOR_READINGS_TOPIC (без group_id, с конца
+топика) и только пока у него есть подписчики. Подписка — это множество
+устройств (дом, комната или явный список), подписчики проиндексированы по
+устройству, так что показание проверяет только своих получателей и
+кодируется в JSON один раз на всех.
+
+Буфер подписчика ограничен LIVE_QUEUE_SIZE, publish никогда не ждёт:
+медленный клиент теряет только свои показания и не тормозит остальных.
+Политики переполнения:
+
+``drop_oldest`` — выбрасывается самое старое показание;
+``coalesce`` — по каждой паре (устройство, тип) хранится только последнее.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Dict, FrozenSet, Iterable, List, Optional, Set
+from uuid import UUID
+
+import orjson
+from aiokafka import AIOKafkaConsumer
+from fastapi import HTTPException, WebSocket, status
+from sqlalchemy import select
+
+from database import AsyncSessionLocal
+from kafka import BOOTSTRAP_SERVERS
+from models import Device
+
+__all__ = [
+    "LIVE_POLICIES",
+    "LIVE_DEFAULT_POLICY",
+    "LiveHub",
+    "Subscriber",
+    "live_hub",
+    "live_stats",
+    "resolve_live_devices",
+    "run_live_stream",
+    "serve_websocket",
+    "sse_events",
+]
+
+logger = logging.getLogger("live")
+
+SENSOR_READINGS_TOPIC = os.getenv("SENSOR_READINGS_TOPIC", "sensorReadings")
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "256"))
+LIVE_DEFAULT_POLICY = os.getenv("LIVE_DEFAULT_POLICY", "drop_oldest")
+LIVE_MAX_DEVICES = int(os.getenv("LIVE_MAX_DEVICES", "10000"))
+LIVE_HEARTBEAT_S = float(os.getenv("LIVE_HEARTBEAT_S", "15"))
+# столько секунд без подписчиков — и consumer останавливается до следующей подписки
+LIVE_IDLE_STOP_S = float(os.getenv("LIVE_IDLE_STOP_S", "60"))
+LIVE_RETRY_BACKOFF_S = float(os.getenv("LIVE_RETRY_BACKOFF_S", "5"))
+
+LIVE_POLICIES = ("drop_oldest", "coalesce")
+
+
+class Subscriber:
+    """Ограниченный буфер одного клиента; put синхронный и O(1)."""
+
+    def __init__(self, devices: FrozenSet[str], policy: str, size: int):
+        self.devices = devices
+        self.policy = policy
+        self.size = size
+        self.dropped = 0
+        self._queue: deque = deque(maxlen=size)
+        self._latest: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._ready = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._latest) if self.policy == "coalesce" else len(self._queue)
+
+    def put(self, key: tuple, data: bytes) -> bool:
+        """Положить показание; False, если что-то пришлось выбросить."""
+        kept = True
+        if self.policy == "coalesce":
+            latest = self._latest
+            if key in latest:
+                del latest[key]
+                kept = False
+            elif len(latest) >= self.size:
+                latest.popitem(last=False)
+                kept = False
+            latest[key] = data
+        else:
+            if len(self._queue) == self.size:
+                kept = False  # deque(maxlen) сам вытеснит самое старое
+            self._queue.append(data)
+        if not kept:
+            self.dropped += 1
+        self._ready.set()
+        return kept
+
+    async def get(self) -> List[bytes]:
+        """Дождаться данных и забрать всё накопленное разом."""
+        await self._ready.wait()
+        self._ready.clear()
+        if self.policy == "coalesce":
+            items = list(self._latest.values())
+            self._latest.clear()
+        else:
+            items = list(self._queue)
+            self._queue.clear()
+        return items
+
+
+class LiveStats:
+    def __init__(self):
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def as_dict(self) -> dict:
+        return {"received": self.received, "delivered": self.delivered, "dropped": self.dropped}
+
+
+class LiveHub:
+    """Подписчики процесса, проиндексированные по устройству."""
+
+    def __init__(self):
+        self._by_device: Dict[str, Set[Subscriber]] = {}
+        self._subscribers: Set[Subscriber] = set()
+        self._has_subscribers = asyncio.Event()
+        self.stats = LiveStats()
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, devices: Iterable[str], policy: str = LIVE_DEFAULT_POLICY,
+                  size: int = LIVE_QUEUE_SIZE) -> Subscriber:
+        subscriber = Subscriber(frozenset(devices), policy, size)
+        for device_id in subscriber.devices:
+            self._by_device.setdefault(device_id, set()).add(subscriber)
+        self._subscribers.add(subscriber)
+        self._has_subscribers.set()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+        for device_id in subscriber.devices:
+            subscribers = self._by_device.get(device_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._by_device[device_id]
+        if not self._subscribers:
+            self._has_subscribers.clear()
+
+    async def wait_for_subscribers(self) -> None:
+        await self._has_subscribers.wait()
+
+    def publish(self, reading: dict) -> None:
+        self.stats.received += 1
+        try:
+            device_id = str(UUID(str(reading["device_id"])))
+        except (KeyError, ValueError, TypeError):
+            return
+        subscribers = self._by_device.get(device_id)
+        if not subscribers:
+            return
+        key = (device_id, reading.get("type"))
+        data = orjson.dumps(reading)
+        for subscriber in subscribers:
+            if subscriber.put(key, data):
+                self.stats.delivered += 1
+            else:
+                self.stats.dropped += 1
+
+    def publish_message(self, raw: bytes) -> None:
+        """Сообщение топика — одно показание или массив, как у consumer.py."""
+        if not self._subscribers:
+            return
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return
+        for reading in value if isinstance(value, list) else [value]:
+            if isinstance(reading, dict):
+                self.publish(reading)
+
+
+live_hub = LiveHub()
+
+
+def live_stats() -> dict:
+    return {"subscribers": len(live_hub), **live_hub.stats.as_dict()}
+
+
+# ---------------------------------------------------------------------------
+# Kafka
+
+async def _consume(consumer: AIOKafkaConsumer, hub: LiveHub) -> None:
+    """Читаем, пока есть подписчики; LIVE_IDLE_STOP_S без них — выходим."""
+    idle_since: Optional[float] = None
+    while True:
+        fetched = await consumer.getmany(timeout_ms=1000)
+        for messages in fetched.values():
+            for message in messages:
+                hub.publish_message(message.value)
+        if len(hub):
+            idle_since = None
+        elif idle_since is None:
+            idle_since = time.monotonic()
+        elif time.monotonic() - idle_since >= LIVE_IDLE_STOP_S:
+            return
+
+
+async def run_live_stream(hub: LiveHub = live_hub) -> None:
+    """Фоновый цикл для lifespan: consumer живёт, только пока кто-то подписан."""
+    while True:
+        await hub.wait_for_subscribers()
+        consumer = AIOKafkaConsumer(
+            SENSOR_READINGS_TOPIC,
+            bootstrap_servers=BOOTSTRAP_SERVERS,
+            group_id=None,
+            auto_offset_reset="latest",
+        )
+        failed = False
+        try:
+            await consumer.start()
+            await _consume(consumer, hub)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            failed = True
+            logger.exception("Live stream consumer failed")
+        finally:
+            await consumer.stop()
+        if failed:
+            await asyncio.sleep(LIVE_RETRY_BACKOFF_S)
+
+
+# ---------------------------------------------------------------------------
+# подписка из HTTP
+
+async def resolve_live_devices(
+    home_id: Optional[UUID], room_id: Optional[UUID], device_ids: List[UUID]
+) -> Set[str]:
+    """Фильтр подписки -> множество устройств; состав фиксируется на момент подписки."""
+    conditions = []
+    if home_id is not None:
+        conditions.append(Device.home_id == home_id)
+    if room_id is not None:
+        conditions.append(Device.room_id == room_id)
+    if device_ids:
+        conditions.append(Device.id.in_(device_ids))
+    if not conditions:
+        raise HTTPException(status_code=400, detail="Filter by home_id, room_id or device_id")
+
+    # своя короткая сессия: подписка живёт дольше запроса
+    async with AsyncSessionLocal() as db:
+        ids = (await db.scalars(select(Device.id).where(*conditions).limit(LIVE_MAX_DEVICES + 1))).all()
+    if not ids:
+        raise HTTPException(status_code=404, detail="No devices match the filter")
+    if len(ids) > LIVE_MAX_DEVICES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Subscription is limited to {LIVE_MAX_DEVICES} devices",
+        )
+    return {str(device_id) for device_id in ids}
+
+
+async def sse_events(devices: Set[str], policy: str) -> AsyncIterator[bytes]:
+    """text/event-stream: событие на показание, комментарий-пинг при тишине."""
+    subscriber = live_hub.subscribe(devices, policy)
+    try:
+        yield b": subscribed\n\n"
+        while True:
+            try:
+                items = await asyncio.wait_for(subscriber.get(), LIVE_HEARTBEAT_S)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+                continue
+            yield b"".join(b"data: " + item + b"\n\n" for item in items)
+    finally:
+        live_hub.unsubscribe(subscriber)
+
+
+async def serve_websocket(websocket: WebSocket, devices: Set[str], policy: str) -> None:
+    """Каждый кадр — JSON-массив показаний, накопившихся с прошлой отправки."""
+    subscriber = live_hub.subscribe(devices, policy)
+
+    async def _pump() -> None:
+        while True:
+            items = await subscriber.get()
+            await websocket.send_text((b"[" + b",".join(items) + b"]").decode())
+
+    sender = asyncio.create_task(_pump())
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect" or sender.done():
+                break
+    finally:
+        sender.cancel()
+        await asyncio.gather(sender, return_exceptions=True)
+        live_hub.unsubscribe(subscriber)
@@ -1,47 +1,159 @@
-from fastapi import FastAPI
+"""Точка входа REST API.
+
+Приложение собирает фабрика ``create_app()``; роутеры, модели и схемы
+импортируются внутри неё, а соединения с БД и Kafka открываются только
+в lifespan. ``uvicorn main:app`` продолжает работать: ``app`` создаётся
+при первом обращении к атрибуту модуля.
+
+Схема OpenAPI строится один раз и кэшируется. Если задан OPENAPI_SCHEMA_PATH
+и файл существует, схема читается из него (собирается заранее командой
+``python main.py openapi <path>``).
+"""
+import asyncio
+import json
+import os
+import sys
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from fastapi import FastAPI, Response
 from fastapi.openapi.utils import get_openapi
 
-from database import Base, engine           
-from kafka import shutdown_kafka            
-import models                              
+API_PREFIX = "/api/v2.0"
 
+OPENAPI_SCHEMA_PATH = os.getenv("OPENAPI_SCHEMA_PATH", "")
 
-from routers.users                import router as users_router
-from routers.homes                import router as homes_router
-from routers.rooms                import router as rooms_router
-from routers.devices              import router as devices_router
-from routers.sensor_data          import router as sensor_data_router
-from routers.automation_scenarios import router as automation_scenarios_router
+_background_tasks: List[asyncio.Task] = []
 
 
-app = FastAPI(
-    title="Smart Home API",
-    version="2.0",
-    description="REST & Kafka gateway for the smart-home platform",
-)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Прогреваем Kafka producer, грузим правила и запускаем фоновые задачи."""
+    from cache import run_cache_invalidator
+    from database import dispose_db
+    from kafka import shutdown_kafka, warm_up_kafka
+    from live import run_live_stream
+    from outbox import run_outbox_relay
+    from rollups import run_rollup_refresher
+    from rules import load_rule_engine, rule_engine
+    from scenario_sync import ScenarioSync
+    from scheduler import load_scheduler, rule_scheduler, run_rule_scheduler
 
-Base.metadata.create_all(bind=engine)
+    await warm_up_kafka()
+    # LISTEN и полная загрузка индексов; дальше правки приходят по одному сценарию
+    scenario_sync = ScenarioSync([(rule_engine, load_rule_engine), (rule_scheduler, load_scheduler)])
+    await scenario_sync.start()
+    _background_tasks.append(asyncio.create_task(run_outbox_relay()))
+    _background_tasks.append(asyncio.create_task(run_rollup_refresher()))
+    _background_tasks.append(asyncio.create_task(run_rule_scheduler()))
+    _background_tasks.append(asyncio.create_task(scenario_sync.run()))
+    _background_tasks.append(asyncio.create_task(run_cache_invalidator()))
+    _background_tasks.append(asyncio.create_task(run_live_stream()))
+    try:
+        yield
+    finally:
+        # останавливаем фоновые задачи, закрываем AIOKafkaProducer и пул БД
+        for task in _background_tasks:
+            task.cancel()
+        await asyncio.gather(*_background_tasks, return_exceptions=True)
+        _background_tasks.clear()
+        await shutdown_kafka()
+        await dispose_db()
 
-@app.on_event("shutdown")
-async def _shutdown() -> None:
-    """Закрываем AIOKafkaProducer при остановке приложения."""
-    await shutdown_kafka()
 
-API_PREFIX = "/api/v2.0"
+def _load_openapi(path: str) -> Optional[dict]:
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _install_openapi(app: FastAPI) -> None:
+    """Схема OpenAPI строится один раз: из готового файла или по роутам."""
+
+    def openapi() -> dict:
+        if app.openapi_schema is None:
+            app.openapi_schema = _load_openapi(OPENAPI_SCHEMA_PATH) or get_openapi(
+                title=app.title,
+                version=app.version,
+                description=app.description,
+                routes=app.routes,
+            )
+        return app.openapi_schema
+
+    app.openapi = openapi
+
+
+def create_app() -> FastAPI:
+    from cache import cache_stats
+    from kafka import kafka_stats
+    from live import live_stats
+    from metrics import CONTENT_TYPE_LATEST, generate_latest, register_app_collector
+    from scheduler import scheduler_stats
+    from sql_profile import SQLProfileMiddleware
 
-app.include_router(users_router,                prefix=API_PREFIX)
-app.include_router(homes_router,                prefix=API_PREFIX)
-app.include_router(rooms_router,                prefix=API_PREFIX)
-app.include_router(devices_router,              prefix=API_PREFIX)
-app.include_router(sensor_data_router,          prefix=API_PREFIX)
-app.include_router(automation_scenarios_router, prefix=API_PREFIX)
-
-
-@app.get("/openapi.json", include_in_schema=False)
-def custom_openapi():   
-    return get_openapi(
-        title=app.title,
-        version=app.version,
-        description=app.description,
-        routes=app.routes,
+    import models  # noqa: F401  регистрирует таблицы в Base.metadata
+
+    from routers.users                import router as users_router
+    from routers.homes                import router as homes_router
+    from routers.rooms                import router as rooms_router
+    from routers.devices              import router as devices_router
+    from routers.sensor_data          import router as sensor_data_router
+    from routers.automation_scenarios import router as automation_scenarios_router
+    from routers.notifications        import router as notifications_router
+
+    app = FastAPI(
+        title="Smart Home API",
+        version="2.0",
+        description="REST & Kafka gateway for the smart-home platform",
+        lifespan=lifespan,
     )
+    app.add_middleware(SQLProfileMiddleware)
+
+    app.include_router(users_router,                prefix=API_PREFIX)
+    app.include_router(homes_router,                prefix=API_PREFIX)
+    app.include_router(rooms_router,                prefix=API_PREFIX)
+    app.include_router(devices_router,              prefix=API_PREFIX)
+    app.include_router(sensor_data_router,          prefix=API_PREFIX)
+    app.include_router(automation_scenarios_router, prefix=API_PREFIX)
+    app.include_router(notifications_router,        prefix=API_PREFIX)
+
+    @app.get("/stats", include_in_schema=False)
+    def stats() -> dict:
+        """Счётчики процесса: Kafka producer, планировщик, кэши, живой поток."""
+        return {
+            "kafka": kafka_stats(),
+            "scheduler": scheduler_stats(),
+            "cache": cache_stats(),
+            "live": live_stats(),
+        }
+
+    @app.get("/metrics", include_in_schema=False)
+    def prometheus_metrics() -> Response:
+        """Метрики в формате Prometheus: HTTP, пул БД, Kafka, кэши, планировщик."""
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+    register_app_collector()
+    _install_openapi(app)
+    return app
+
+
+def __getattr__(name: str):
+    # `uvicorn main:app`: приложение собирается при первом обращении
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == "__main__":
+    # python main.py openapi [path] — собрать схему OpenAPI для OPENAPI_SCHEMA_PATH
+    if len(sys.argv) >= 2 and sys.argv[1] == "openapi":
+        schema = json.dumps(create_app().openapi(), ensure_ascii=False, indent=2)
+        if len(sys.argv) > 2:
+            with open(sys.argv[2], "w", encoding="utf-8") as f:
+                f.write(schema)
+        else:
+            print(schema)
+    else:
+        sys.exit("usage: python main.py openapi [path]")
@@ -0,0 +1,224 @@
+"""Prometheus-метрики процесса; отдаются на /metrics (см. main).
+
+На горячих путях — только инкременты дочерних метрик, лейблы которых
+связаны заранее: обработчик каждого роута оборачивается при его создании
+(TimedRoute), поэтому шаблон пути известен без повторного сопоставления.
+Всё, что можно прочитать из состояния (пул БД, кэши, планировщик, circuit
+breaker), собирается коллекторами только в момент scrape.
+"""
+import time
+from typing import Any, Callable, Dict, Tuple
+
+from fastapi import Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.exceptions import HTTPException as StarletteHTTPException
+
+__all__ = [
+    "CONTENT_TYPE_LATEST",
+    "KAFKA_PRODUCE_FAILURES",
+    "KAFKA_PRODUCE_LATENCY",
+    "KAFKA_PRODUCE_REJECTED",
+    "LIST_ROWS",
+    "TimedQueuePool",
+    "TimedRoute",
+    "generate_latest",
+    "register_app_collector",
+    "register_pool_collector",
+]
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# ---------------------------------------------------------------------------
+# HTTP
+
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки запроса по шаблону роута",
+    ["method", "route"],
+    buckets=_LATENCY_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Запросы в обработке", ["method", "route"]
+)
+HTTP_REQUESTS = Counter(
+    "http_requests", "Ответы по статусу", ["method", "route", "status"]
+)
+LIST_ROWS = Counter(
+    "list_rows_returned", "Строки, отданные списочными эндпоинтами", ["resource"]
+)
+
+
+class TimedRoute(APIRoute):
+    """Роут с метриками: лейбл route — шаблон пути, связывается один раз на роут.
+
+    Подключается через ``APIRouter(route_class=TimedRoute)``. Время считается до
+    возврата Response; тело StreamingResponse отдаётся уже после замера.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        children: Dict[str, Tuple[Any, Any]] = {}
+        route = self.path_format
+
+        async def timed_handler(request: Request) -> Response:
+            method = request.method
+            bound = children.get(method)
+            if bound is None:
+                bound = children[method] = (
+                    HTTP_LATENCY.labels(method, route),
+                    HTTP_IN_FLIGHT.labels(method, route),
+                )
+            latency, in_flight = bound
+            status = 500
+            in_flight.inc()
+            started = time.perf_counter()
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except StarletteHTTPException as e:  # в том числе fastapi.HTTPException
+                status = e.status_code
+                raise
+            except RequestValidationError:
+                status = 422  # так отвечает обработчик FastAPI по умолчанию
+                raise
+            finally:
+                latency.observe(time.perf_counter() - started)
+                in_flight.dec()
+                HTTP_REQUESTS.labels(method, route, str(status)).inc()
+
+        return timed_handler
+
+
+# ---------------------------------------------------------------------------
+# DB pool
+
+DB_POOL_CHECKOUT = Histogram(
+    "db_pool_checkout_seconds",
+    "Получение соединения из пула: ожидание свободного или открытие нового",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул async-движка, который замеряет время выдачи соединения."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT.observe(time.perf_counter() - started)
+
+
+class _PoolCollector:
+    def __init__(self, pool: AsyncAdaptedQueuePool):
+        self.pool = pool
+
+    def collect(self):
+        pool = self.pool
+        yield GaugeMetricFamily("db_pool_size", "Постоянный размер пула", value=pool.size())
+        yield GaugeMetricFamily(
+            "db_pool_checked_out", "Соединения, выданные сессиям", value=pool.checkedout()
+        )
+        yield GaugeMetricFamily(
+            "db_pool_checked_in", "Свободные соединения в пуле", value=pool.checkedin()
+        )
+        # QueuePool.overflow() отрицателен, пока постоянная часть пула не занята
+        yield GaugeMetricFamily(
+            "db_pool_overflow", "Соединения сверх pool_size", value=max(pool.overflow(), 0)
+        )
+
+
+def register_pool_collector(pool: AsyncAdaptedQueuePool) -> None:
+    REGISTRY.register(_PoolCollector(pool))
+
+
+# ---------------------------------------------------------------------------
+# Kafka
+
+KAFKA_PRODUCE_LATENCY = Histogram(
+    "kafka_produce_duration_seconds",
+    "От send до подтверждения брокера",
+    ["topic"],
+    buckets=_LATENCY_BUCKETS,
+)
+KAFKA_PRODUCE_FAILURES = Counter(
+    "kafka_produce_failures", "Отправки, завершившиеся ошибкой", ["topic"]
+)
+KAFKA_PRODUCE_REJECTED = Counter(
+    "kafka_produce_rejected", "Отправки, отклонённые открытым circuit breaker", ["topic"]
+)
+
+
+# ---------------------------------------------------------------------------
+# состояние приложения: кэши, планировщик, circuit breaker, живой поток
+
+class _AppCollector:
+    def collect(self):
+        from cache import caches
+        from kafka import kafka_breaker_state
+        from live import live_hub
+        from scheduler import rule_scheduler
+
+        counters = {
+            name: CounterMetricFamily(f"cache_{name}", f"Кэш сущностей: {name}", labels=["cache"])
+            for name in ("hits", "misses", "evictions", "expirations", "invalidations")
+        }
+        size = GaugeMetricFamily("cache_size", "Записей в кэше", labels=["cache"])
+        for cache_name, cache in caches.items():
+            for name, family in counters.items():
+                family.add_metric([cache_name], getattr(cache.stats, name))
+            size.add_metric([cache_name], len(cache))
+        yield from counters.values()
+        yield size
+
+        stats = rule_scheduler.stats
+        yield GaugeMetricFamily(
+            "scheduler_rules", "TIME-правила в куче планировщика", value=len(rule_scheduler)
+        )
+        yield CounterMetricFamily("scheduler_fired", "Сработавшие слоты", value=stats.fired)
+        yield CounterMetricFamily("scheduler_skipped", "Пропущенные слоты", value=stats.skipped)
+        yield GaugeMetricFamily(
+            "scheduler_max_lag_seconds", "Максимальное опоздание срабатывания",
+            value=stats.max_lag_ms / 1000,
+        )
+
+        breaker = GaugeMetricFamily(
+            "kafka_circuit_state", "Состояние circuit breaker producer'а", labels=["state"]
+        )
+        current = kafka_breaker_state()
+        for state in ("closed", "half_open", "open"):
+            breaker.add_metric([state], 1 if state == current else 0)
+        yield breaker
+
+        yield GaugeMetricFamily("live_subscribers", "Подписчики живого потока", value=len(live_hub))
+        yield CounterMetricFamily(
+            "live_readings_delivered", "Показания, положенные в буферы подписчиков",
+            value=live_hub.stats.delivered,
+        )
+        yield CounterMetricFamily(
+            "live_readings_dropped", "Показания, вытесненные из переполненных буферов",
+            value=live_hub.stats.dropped,
+        )
+
+
+_app_collector_registered = False
+
+
+def register_app_collector() -> None:
+    global _app_collector_registered
+    if not _app_collector_registered:
+        REGISTRY.register(_AppCollector())
+        _app_collector_registered = True
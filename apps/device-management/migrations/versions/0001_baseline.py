@@ -0,0 +1,137 @@
+"""baseline: схема, которую раньше создавал create_all при импорте main
+
+Таблицы создаются только если их ещё нет, поэтому на базе, поднятой старым
+create_all, ревизия просто фиксирует текущее состояние.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name: str) -> bool:
+    # в режиме --sql базы нет: генерируем DDL для пустой схемы
+    return not op.get_context().as_sql and sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade() -> None:
+    if not _has_table("users"):
+        op.create_table(
+            "users",
+            sa.Column("id", UUID(as_uuid=True), primary_key=True),
+            sa.Column("email", sa.String(), nullable=False),
+            sa.Column("name", sa.String(), nullable=False),
+            sa.Column("registered_at", sa.DateTime()),
+            sa.Column("phone", sa.String()),
+        )
+
+    if not _has_table("homes"):
+        op.create_table(
+            "homes",
+            sa.Column("id", UUID(as_uuid=True), primary_key=True),
+            sa.Column("name", sa.String(), nullable=False),
+            sa.Column("address", sa.String()),
+            sa.Column("owner_id", UUID(as_uuid=True), sa.ForeignKey("users.id")),
+        )
+
+    if not _has_table("rooms"):
+        op.create_table(
+            "rooms",
+            sa.Column("id", UUID(as_uuid=True), primary_key=True),
+            sa.Column("name", sa.String()),
+            sa.Column("info", sa.String()),
+            sa.Column("home_id", UUID(as_uuid=True), sa.ForeignKey("homes.id")),
+        )
+
+    if not _has_table("devices"):
+        op.create_table(
+            "devices",
+            sa.Column("id", UUID(as_uuid=True), primary_key=True),
+            sa.Column("name", sa.String(), nullable=False),
+            sa.Column("type", sa.Enum("SENSOR", "CAMERA", name="devicetype"), nullable=False),
+            sa.Column("model", sa.String(), nullable=False),
+            sa.Column("firmware_version", sa.String(), nullable=False),
+            sa.Column("status", sa.String(), nullable=False),
+            sa.Column("location", sa.String(), nullable=False),
+            sa.Column("unit", sa.String(), nullable=False),
+            sa.Column("room_id", UUID(as_uuid=True), sa.ForeignKey("rooms.id", ondelete="SET NULL")),
+            sa.Column("home_id", UUID(as_uuid=True), sa.ForeignKey("homes.id", ondelete="SET NULL")),
+            sa.Column("owner_id", UUID(as_uuid=True), sa.ForeignKey("users.id", ondelete="SET NULL")),
+            sa.Column("activation_code", sa.String()),
+            sa.Column("is_activated", sa.Boolean(), nullable=False),
+            sa.Column("activated_at", sa.DateTime()),
+        )
+
+    if not _has_table("sensor_data"):
+        op.create_table(
+            "sensor_data",
+            sa.Column("id", UUID(as_uuid=True), primary_key=True),
+            sa.Column("device_id", UUID(as_uuid=True), sa.ForeignKey("devices.id")),
+            sa.Column("timestamp", sa.DateTime()),
+            sa.Column("type", sa.String()),
+            sa.Column("value", sa.String()),
+        )
+
+    if not _has_table("automation_scenarios"):
+        op.create_table(
+            "automation_scenarios",
+            sa.Column("id", UUID(as_uuid=True), primary_key=True),
+            sa.Column("name", sa.String()),
+            sa.Column("user_id", UUID(as_uuid=True), sa.ForeignKey("users.id")),
+            sa.Column("enabled", sa.Boolean()),
+            sa.Column("created_at", sa.DateTime()),
+        )
+
+    if not _has_table("automation_rules"):
+        op.create_table(
+            "automation_rules",
+            sa.Column("id", UUID(as_uuid=True), primary_key=True),
+            sa.Column(
+                "scenario_id",
+                UUID(as_uuid=True),
+                sa.ForeignKey("automation_scenarios.id", ondelete="CASCADE"),
+            ),
+            sa.Column("trigger_type", sa.Enum("SENSOR", "TIME", name="triggertype")),
+            sa.Column("trigger_condition", sa.String()),
+            sa.Column("action_type", sa.Enum("TURN_ON", "TURN_OFF", name="actiontype")),
+            sa.Column(
+                "action_target",
+                UUID(as_uuid=True),
+                sa.ForeignKey("devices.id", ondelete="SET NULL"),
+            ),
+        )
+
+    if not _has_table("notifications"):
+        op.create_table(
+            "notifications",
+            sa.Column("id", UUID(as_uuid=True), primary_key=True),
+            sa.Column("user_id", UUID(as_uuid=True), sa.ForeignKey("users.id")),
+            sa.Column("title", sa.String()),
+            sa.Column("body", sa.String()),
+            sa.Column("sent_at", sa.DateTime()),
+            sa.Column("read", sa.Boolean()),
+        )
+
+
+def downgrade() -> None:
+    for table in (
+        "notifications",
+        "automation_rules",
+        "automation_scenarios",
+        "sensor_data",
+        "devices",
+        "rooms",
+        "homes",
+        "users",
+    ):
+        op.drop_table(table)
+    for enum in ("actiontype", "triggertype", "devicetype"):
+        sa.Enum(name=enum).drop(op.get_bind(), checkfirst=True)
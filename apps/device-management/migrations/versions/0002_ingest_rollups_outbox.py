@@ -0,0 +1,115 @@
+"""колонки и таблицы приёма показаний, роллапов, outbox и планировщика
+
+sensor_data.numeric_value/ingested_at, роллапы 1m/1h/1d, очередь инвалидаций,
+rollup_state, outbox_events и automation_rules.last_fired_at. Всё добавляется
+только если отсутствует: часть баз уже получила эти объекты через create_all.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+_ROLLUP_TABLES = ("sensor_data_rollup_1m", "sensor_data_rollup_1h", "sensor_data_rollup_1d")
+
+# то же, что принимает parse_numeric: конечное десятичное число;
+# короткая экспонента и длина строки не дают касту в double переполниться
+_NUMERIC_RE = r"^\s*[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]{1,2})?\s*$"
+
+
+def _has_table(name: str) -> bool:
+    # в режиме --sql базы нет: генерируем DDL для пустой схемы
+    return not op.get_context().as_sql and sa.inspect(op.get_bind()).has_table(name)
+
+
+def _has_column(table: str, column: str) -> bool:
+    if op.get_context().as_sql:
+        return False
+    return column in {c["name"] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    if not _has_column("sensor_data", "numeric_value"):
+        op.add_column("sensor_data", sa.Column("numeric_value", sa.Float()))
+        op.execute(
+            sa.text(
+                "UPDATE sensor_data SET numeric_value = value::double precision "
+                "WHERE length(value) <= 64 AND value ~ :pattern"
+            ).bindparams(pattern=_NUMERIC_RE)
+        )
+
+    if not _has_column("sensor_data", "ingested_at"):
+        # существующие строки получат now() и попадут в первый пересчёт роллапов
+        op.add_column(
+            "sensor_data",
+            sa.Column(
+                "ingested_at",
+                sa.DateTime(),
+                nullable=False,
+                server_default=sa.text("timezone('utc', now())"),
+            ),
+        )
+        op.create_index("ix_sensor_data_ingested_at", "sensor_data", ["ingested_at"])
+
+    for table in _ROLLUP_TABLES:
+        if not _has_table(table):
+            op.create_table(
+                table,
+                sa.Column("device_id", UUID(as_uuid=True), primary_key=True),
+                sa.Column("type", sa.String(), primary_key=True),
+                sa.Column("bucket", sa.DateTime(), primary_key=True),
+                sa.Column("count", sa.Integer(), nullable=False),
+                sa.Column("sum", sa.Float(), nullable=False),
+                sa.Column("min", sa.Float(), nullable=False),
+                sa.Column("max", sa.Float(), nullable=False),
+                sa.Column("last_value", sa.Float(), nullable=False),
+                sa.Column("last_timestamp", sa.DateTime(), nullable=False),
+            )
+
+    if not _has_table("sensor_data_rollup_invalidations"):
+        op.create_table(
+            "sensor_data_rollup_invalidations",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("device_id", UUID(as_uuid=True), nullable=False),
+            sa.Column("type", sa.String(), nullable=False),
+            sa.Column("timestamp", sa.DateTime(), nullable=False),
+        )
+
+    if not _has_table("rollup_state"):
+        op.create_table(
+            "rollup_state",
+            sa.Column("name", sa.String(), primary_key=True),
+            sa.Column("high_water", sa.DateTime(), nullable=False),
+        )
+
+    if not _has_table("outbox_events"):
+        op.create_table(
+            "outbox_events",
+            sa.Column("id", sa.BigInteger(), primary_key=True, autoincrement=True),
+            sa.Column("topic", sa.String(), nullable=False),
+            sa.Column("key", sa.String()),
+            sa.Column("payload", JSONB(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+        )
+
+    if not _has_column("automation_rules", "last_fired_at"):
+        op.add_column("automation_rules", sa.Column("last_fired_at", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("automation_rules", "last_fired_at")
+    op.drop_table("outbox_events")
+    op.drop_table("rollup_state")
+    op.drop_table("sensor_data_rollup_invalidations")
+    for table in _ROLLUP_TABLES:
+        op.drop_table(table)
+    op.drop_index("ix_sensor_data_ingested_at", table_name="sensor_data")
+    op.drop_column("sensor_data", "ingested_at")
+    op.drop_column("sensor_data", "numeric_value")
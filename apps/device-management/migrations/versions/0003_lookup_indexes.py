@@ -0,0 +1,71 @@
+"""индексы под горячие пути чтения и FK-колонки
+
+Индексы строятся CONCURRENTLY вне транзакции, чтобы не блокировать запись
+в рабочие таблицы. Перед уникальными индексами проверяем дубликаты: упавший
+CONCURRENTLY оставил бы невалидный индекс.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+# (имя, таблица, колонки, unique)
+_INDEXES = (
+    ("ix_users_email", "users", ["email"], True),
+    ("ix_devices_activation_code", "devices", ["activation_code"], True),
+    ("ix_sensor_data_device_id_timestamp", "sensor_data", ["device_id", "timestamp"], False),
+    ("ix_homes_owner_id", "homes", ["owner_id"], False),
+    ("ix_rooms_home_id", "rooms", ["home_id"], False),
+    ("ix_devices_home_id", "devices", ["home_id"], False),
+    ("ix_devices_room_id", "devices", ["room_id"], False),
+    ("ix_devices_owner_id", "devices", ["owner_id"], False),
+    ("ix_automation_scenarios_user_id", "automation_scenarios", ["user_id"], False),
+    ("ix_automation_rules_scenario_id", "automation_rules", ["scenario_id"], False),
+    ("ix_automation_rules_action_target", "automation_rules", ["action_target"], False),
+    ("ix_notifications_user_id", "notifications", ["user_id"], False),
+)
+
+
+def _check_unique(table: str, column: str) -> None:
+    duplicates = op.get_bind().execute(
+        sa.text(
+            f"SELECT {column}, count(*) FROM {table} WHERE {column} IS NOT NULL "
+            f"GROUP BY {column} HAVING count(*) > 1 LIMIT 5"
+        )
+    ).all()
+    if duplicates:
+        raise RuntimeError(
+            f"Cannot create unique index on {table}.{column}: duplicates "
+            + ", ".join(f"{value!r} x{count}" for value, count in duplicates)
+        )
+
+
+def upgrade() -> None:
+    if not op.get_context().as_sql:  # в режиме --sql данных не видно
+        for _, table, columns, unique in _INDEXES:
+            if unique:
+                _check_unique(table, columns[0])
+
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in _INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=unique,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(_INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,114 @@
+"""версии строк для ETag
+
+version у users/homes/rooms/devices/automation_scenarios берётся из общей
+последовательности row_version_seq на INSERT и триггером на каждом UPDATE
+строки, в том числе от ON DELETE SET NULL. nextval не держит блокировок,
+так что писатели одной таблицы друг друга не ждут, а версии не повторяются:
+ETag списка считается по самой выборке страницы — count, max и sum её version.
+
+Изменение правил поднимает version их сценария: GET сценария отдаёт правила.
+Служебные колонки правил (last_fired_at, которую пишет планировщик) версию
+не трогают.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+_TABLES = ("users", "homes", "rooms", "devices", "automation_scenarios")
+
+# колонки правила, которые отдаёт GET сценария; UPDATE OF с transition tables
+# PostgreSQL не допускает, поэтому изменение колонок сравнивается в функции
+_RULE_RESPONSE_COLUMNS = ("scenario_id", "trigger_type", "trigger_condition", "action_type", "action_target")
+
+
+def _row(alias: str) -> str:
+    return "(" + ", ".join(f"{alias}.{column}" for column in _RULE_RESPONSE_COLUMNS) + ")"
+
+
+def upgrade() -> None:
+    op.execute("CREATE SEQUENCE row_version_seq")
+    op.execute(
+        """
+        CREATE FUNCTION bump_row_version() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.version := nextval('row_version_seq');
+            RETURN NEW;
+        END $$
+        """
+    )
+    op.execute(
+        f"""
+        CREATE FUNCTION bump_scenario_version() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE automation_scenarios SET version = version + 1
+                WHERE id IN (SELECT scenario_id FROM new_rules);
+            ELSIF TG_OP = 'UPDATE' THEN
+                UPDATE automation_scenarios SET version = version + 1
+                WHERE id IN (
+                    SELECT unnest(ARRAY[o.scenario_id, n.scenario_id])
+                    FROM old_rules o JOIN new_rules n USING (id)
+                    WHERE {_row("o")} IS DISTINCT FROM {_row("n")}
+                );
+            ELSE
+                UPDATE automation_scenarios SET version = version + 1
+                WHERE id IN (SELECT scenario_id FROM old_rules);
+            END IF;
+            RETURN NULL;
+        END $$
+        """
+    )
+
+    for table in _TABLES:
+        # у существующих строк default вычисляется построчно: версии сразу разные
+        op.add_column(
+            table,
+            sa.Column(
+                "version",
+                sa.BigInteger(),
+                nullable=False,
+                server_default=sa.text("nextval('row_version_seq')"),
+            ),
+        )
+        op.execute(
+            f"CREATE TRIGGER {table}_row_version BEFORE UPDATE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION bump_row_version()"
+        )
+
+    # bulk-импорт вставляет правила сотнями: version сценария поднимается одним
+    # UPDATE на оператор по transition table, а не отдельным UPDATE на каждое правило
+    op.execute(
+        "CREATE TRIGGER automation_rules_scenario_version_ins AFTER INSERT ON automation_rules "
+        "REFERENCING NEW TABLE AS new_rules "
+        "FOR EACH STATEMENT EXECUTE FUNCTION bump_scenario_version()"
+    )
+    # срабатывание планировщика пишет только last_fired_at — version сценария не растёт
+    op.execute(
+        "CREATE TRIGGER automation_rules_scenario_version_upd AFTER UPDATE ON automation_rules "
+        "REFERENCING OLD TABLE AS old_rules NEW TABLE AS new_rules "
+        "FOR EACH STATEMENT EXECUTE FUNCTION bump_scenario_version()"
+    )
+    op.execute(
+        "CREATE TRIGGER automation_rules_scenario_version_del AFTER DELETE ON automation_rules "
+        "REFERENCING OLD TABLE AS old_rules "
+        "FOR EACH STATEMENT EXECUTE FUNCTION bump_scenario_version()"
+    )
+
+
+def downgrade() -> None:
+    for suffix in ("ins", "upd", "del"):
+        op.execute(f"DROP TRIGGER automation_rules_scenario_version_{suffix} ON automation_rules")
+    for table in _TABLES:
+        op.execute(f"DROP TRIGGER {table}_row_version ON {table}")
+        op.drop_column(table, "version")
+    op.execute("DROP FUNCTION bump_scenario_version()")
+    op.execute("DROP FUNCTION bump_row_version()")
+    op.execute("DROP SEQUENCE row_version_seq")
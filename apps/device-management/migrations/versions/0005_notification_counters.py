@@ -0,0 +1,137 @@
+"""счётчики непрочитанных уведомлений и индекс ленты
+
+notification_counters хранит число непрочитанных на пользователя, его ведут
+statement-триггеры на notifications в той же транзакции, что и запись:
+бейдж читается по первичному ключу вместо COUNT(*). Индекс (user_id, sent_at,
+id) обслуживает keyset-ленту и заменяет одиночный индекс по user_id.
+sent_at становится NOT NULL: строка с NULL в ключе ленты в неё не попадает.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # настоящее время отправки таких строк неизвестно — считаем их отправленными сейчас
+    op.execute("UPDATE notifications SET sent_at = timezone('utc', now()) WHERE sent_at IS NULL")
+    op.alter_column(
+        "notifications",
+        "sent_at",
+        nullable=False,
+        server_default=sa.text("timezone('utc', now())"),
+    )
+
+    op.create_table(
+        "notification_counters",
+        sa.Column(
+            "user_id",
+            UUID(as_uuid=True),
+            sa.ForeignKey("users.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("unread", sa.BigInteger(), nullable=False, server_default=sa.text("0")),
+    )
+
+    # INSERT ... ORDER BY user_id: конкурентные рассылки блокируют строки
+    # счётчиков в одном порядке и не ловят deadlock
+    op.execute(
+        """
+        CREATE FUNCTION count_unread_notifications() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO notification_counters AS c (user_id, unread)
+                SELECT user_id, count(*) FROM new_rows
+                WHERE user_id IS NOT NULL AND read IS NOT TRUE
+                GROUP BY user_id ORDER BY user_id
+                ON CONFLICT (user_id) DO UPDATE SET unread = c.unread + EXCLUDED.unread;
+            ELSIF TG_OP = 'UPDATE' THEN
+                INSERT INTO notification_counters AS c (user_id, unread)
+                SELECT user_id, sum(delta) FROM (
+                    SELECT user_id, 1 AS delta FROM new_rows WHERE read IS NOT TRUE
+                    UNION ALL
+                    SELECT user_id, -1 FROM old_rows WHERE read IS NOT TRUE
+                ) d
+                WHERE user_id IS NOT NULL
+                GROUP BY user_id HAVING sum(delta) <> 0 ORDER BY user_id
+                ON CONFLICT (user_id) DO UPDATE SET unread = c.unread + EXCLUDED.unread;
+            ELSE
+                UPDATE notification_counters c SET unread = c.unread - d.n
+                FROM (SELECT user_id, count(*) AS n FROM old_rows
+                      WHERE user_id IS NOT NULL AND read IS NOT TRUE
+                      GROUP BY user_id) d
+                WHERE c.user_id = d.user_id;
+            END IF;
+            RETURN NULL;
+        END $$
+        """
+    )
+    # по триггеру на событие: INSERT видит только new_rows, DELETE — только old_rows
+    op.execute(
+        "CREATE TRIGGER notifications_unread_ins AFTER INSERT ON notifications "
+        "REFERENCING NEW TABLE AS new_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION count_unread_notifications()"
+    )
+    op.execute(
+        "CREATE TRIGGER notifications_unread_upd AFTER UPDATE ON notifications "
+        "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION count_unread_notifications()"
+    )
+    op.execute(
+        "CREATE TRIGGER notifications_unread_del AFTER DELETE ON notifications "
+        "REFERENCING OLD TABLE AS old_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION count_unread_notifications()"
+    )
+    op.execute(
+        """
+        INSERT INTO notification_counters (user_id, unread)
+        SELECT user_id, count(*) FROM notifications
+        WHERE user_id IS NOT NULL AND read IS NOT TRUE
+        GROUP BY user_id
+        """
+    )
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_notifications_user_id_sent_at",
+            "notifications",
+            ["user_id", "sent_at", "id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_notifications_user_id",
+            table_name="notifications",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_notifications_user_id",
+            "notifications",
+            ["user_id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_notifications_user_id_sent_at",
+            table_name="notifications",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    for suffix in ("ins", "upd", "del"):
+        op.execute(f"DROP TRIGGER notifications_unread_{suffix} ON notifications")
+    op.execute("DROP FUNCTION count_unread_notifications()")
+    op.drop_table("notification_counters")
+    op.alter_column("notifications", "sent_at", nullable=True, server_default=None)
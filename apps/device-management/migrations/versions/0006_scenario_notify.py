@@ -0,0 +1,103 @@
+"""NOTIFY scenario_changed на правки правил и сценариев
+
+Процессы API и consumer держат правила в памяти (движок SENSOR, планировщик
+TIME). Триггеры шлют pg_notify('scenario_changed', <id сценария>) на каждую
+вставку, удаление и содержательную правку правил, а также на выключение,
+включение и удаление сценария; уведомление доставляется после commit, и
+процесс перечитывает только затронутые сценарии (scenario_sync.py).
+Одинаковые уведомления одной транзакции PostgreSQL склеивает сам.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+# колонки правила, от которых зависят скомпилированные индексы; last_fired_at,
+# которую пишет планировщик, уведомления не шлёт
+_RULE_COLUMNS = ("scenario_id", "trigger_type", "trigger_condition", "action_type", "action_target")
+
+
+def _row(alias: str) -> str:
+    return "(" + ", ".join(f"{alias}.{column}" for column in _RULE_COLUMNS) + ")"
+
+
+def upgrade() -> None:
+    op.execute(
+        f"""
+        CREATE FUNCTION notify_rules_changed() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM pg_notify('scenario_changed', s::text)
+                FROM (SELECT DISTINCT scenario_id FROM new_rules) d(s) WHERE s IS NOT NULL;
+            ELSIF TG_OP = 'UPDATE' THEN
+                PERFORM pg_notify('scenario_changed', s::text)
+                FROM (
+                    SELECT DISTINCT unnest(ARRAY[o.scenario_id, n.scenario_id])
+                    FROM old_rules o JOIN new_rules n USING (id)
+                    WHERE {_row("o")} IS DISTINCT FROM {_row("n")}
+                ) d(s) WHERE s IS NOT NULL;
+            ELSE
+                PERFORM pg_notify('scenario_changed', s::text)
+                FROM (SELECT DISTINCT scenario_id FROM old_rules) d(s) WHERE s IS NOT NULL;
+            END IF;
+            RETURN NULL;
+        END $$
+        """
+    )
+    # новый сценарий без правил индексам не интересен: его правила придут INSERT'ом в automation_rules
+    op.execute(
+        """
+        CREATE FUNCTION notify_scenarios_changed() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' THEN
+                PERFORM pg_notify('scenario_changed', n.id::text)
+                FROM old_scenarios o JOIN new_scenarios n USING (id)
+                WHERE o.enabled IS DISTINCT FROM n.enabled;
+            ELSE
+                PERFORM pg_notify('scenario_changed', id::text) FROM old_scenarios;
+            END IF;
+            RETURN NULL;
+        END $$
+        """
+    )
+
+    op.execute(
+        "CREATE TRIGGER automation_rules_notify_ins AFTER INSERT ON automation_rules "
+        "REFERENCING NEW TABLE AS new_rules "
+        "FOR EACH STATEMENT EXECUTE FUNCTION notify_rules_changed()"
+    )
+    op.execute(
+        "CREATE TRIGGER automation_rules_notify_upd AFTER UPDATE ON automation_rules "
+        "REFERENCING OLD TABLE AS old_rules NEW TABLE AS new_rules "
+        "FOR EACH STATEMENT EXECUTE FUNCTION notify_rules_changed()"
+    )
+    op.execute(
+        "CREATE TRIGGER automation_rules_notify_del AFTER DELETE ON automation_rules "
+        "REFERENCING OLD TABLE AS old_rules "
+        "FOR EACH STATEMENT EXECUTE FUNCTION notify_rules_changed()"
+    )
+    op.execute(
+        "CREATE TRIGGER automation_scenarios_notify_upd AFTER UPDATE ON automation_scenarios "
+        "REFERENCING OLD TABLE AS old_scenarios NEW TABLE AS new_scenarios "
+        "FOR EACH STATEMENT EXECUTE FUNCTION notify_scenarios_changed()"
+    )
+    op.execute(
+        "CREATE TRIGGER automation_scenarios_notify_del AFTER DELETE ON automation_scenarios "
+        "REFERENCING OLD TABLE AS old_scenarios "
+        "FOR EACH STATEMENT EXECUTE FUNCTION notify_scenarios_changed()"
+    )
+
+
+def downgrade() -> None:
+    for suffix in ("ins", "upd", "del"):
+        op.execute(f"DROP TRIGGER automation_rules_notify_{suffix} ON automation_rules")
+    for suffix in ("upd", "del"):
+        op.execute(f"DROP TRIGGER automation_scenarios_notify_{suffix} ON automation_scenarios")
+    op.execute("DROP FUNCTION notify_scenarios_changed()")
+    op.execute("DROP FUNCTION notify_rules_changed()")
@@ -0,0 +1,78 @@
+"""high-water mark роллапов по id пишущей транзакции
+
+sensor_data.ingest_xid — pg_current_xact_id() вставившей транзакции,
+rollup_state.high_water_xid — граница уже учтённых строк. Граница пересчёта
+берётся как pg_snapshot_xmin(pg_current_snapshot()): ниже неё нет незавершённых
+пишущих транзакций. Длинные читающие транзакции (NDJSON-выгрузки) xid не
+получают и её не держат, прав на pg_stat_activity не нужно.
+
+Строки, которые пересчёт по ingested_at ещё не учёл, получают xid миграции и
+попадут в первый пересчёт; остальные остаются с NULL. Индекс по ingested_at
+больше не нужен.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+_XID = "(pg_current_xact_id()::text)::bigint"
+
+
+def upgrade() -> None:
+    op.add_column("sensor_data", sa.Column("ingest_xid", sa.BigInteger()))
+    # ALTER TABLE дождался всех пишущих транзакций: неучтённый хвост виден целиком
+    op.execute(
+        f"""
+        UPDATE sensor_data SET ingest_xid = {_XID}
+        WHERE ingested_at >= coalesce(
+            (SELECT high_water FROM rollup_state WHERE name = 'sensor_data'),
+            '-infinity'
+        )
+        """
+    )
+    op.alter_column("sensor_data", "ingest_xid", server_default=sa.text(_XID))
+    op.add_column(
+        "rollup_state",
+        sa.Column("high_water_xid", sa.BigInteger(), nullable=False, server_default=sa.text("0")),
+    )
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_sensor_data_ingest_xid",
+            "sensor_data",
+            ["ingest_xid"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_sensor_data_ingested_at",
+            table_name="sensor_data",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_sensor_data_ingested_at",
+            "sensor_data",
+            ["ingested_at"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_sensor_data_ingest_xid",
+            table_name="sensor_data",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_column("rollup_state", "high_water_xid")
+    op.drop_column("sensor_data", "ingest_xid")
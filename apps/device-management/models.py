@@ -1,17 +1,25 @@
 from enum import Enum as PyEnum
 from datetime import datetime
+import math
 import uuid
 
 from sqlalchemy import (
+    BigInteger,
     Column,
     String,
     Boolean,
     DateTime,
     Enum,
+    FetchedValue,
+    Float,
     ForeignKey,
+    Index,
+    Integer,
+    func,
+    text,
 )
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.orm import relationship, validates
 
 from database import Base
 
@@ -34,15 +42,35 @@ class ActionType(PyEnum):
     TURN_OFF = "TURN_OFF"
 
 
+# ---------------------------------------------------------------------
+# VERSIONS (ETag)
+# ---------------------------------------------------------------------
+
+class VersionedMixin:
+    """Версия строки для ETag/If-Match; берётся из row_version_seq на INSERT
+    и триггером на каждом UPDATE (миграция 0004).
+
+    eager_defaults: новое значение приходит через RETURNING того же INSERT/UPDATE.
+    """
+    version = Column(
+        BigInteger,
+        nullable=False,
+        server_default=text("nextval('row_version_seq')"),
+        server_onupdate=FetchedValue(),
+    )
+
+    __mapper_args__ = {"eager_defaults": True}
+
+
 # ---------------------------------------------------------------------
 # USER
 # ---------------------------------------------------------------------
 
-class User(Base):
+class User(VersionedMixin, Base):
     __tablename__ = "users"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    email = Column(String, nullable=False)
+    email = Column(String, nullable=False, unique=True, index=True)
     name = Column(String, nullable=False)
     registered_at = Column(DateTime, default=datetime.utcnow)
     phone = Column(String)
@@ -66,13 +94,13 @@ class User(Base):
 # HOME / ROOM
 # ---------------------------------------------------------------------
 
-class Home(Base):
+class Home(VersionedMixin, Base):
     __tablename__ = "homes"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(String, nullable=False)
     address = Column(String)
-    owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
+    owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), index=True)
 
     # relationships
     owner = relationship("User", back_populates="homes")
@@ -84,13 +112,13 @@ class Home(Base):
     )
 
 
-class Room(Base):
+class Room(VersionedMixin, Base):
     __tablename__ = "rooms"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(String)
     info = Column(String)
-    home_id = Column(UUID(as_uuid=True), ForeignKey("homes.id"))
+    home_id = Column(UUID(as_uuid=True), ForeignKey("homes.id"), index=True)
 
     # relationships
     home = relationship("Home", back_populates="rooms")
@@ -103,7 +131,7 @@ class Room(Base):
 # DEVICE
 # ---------------------------------------------------------------------
 
-class Device(Base):
+class Device(VersionedMixin, Base):
     __tablename__ = "devices"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -114,11 +142,11 @@ class Device(Base):
     status = Column(String, nullable=False, default="inactive")
     location = Column(String, nullable=False, default="Default room")
     unit = Column(String, nullable=False, default="Default room")
-    room_id = Column(UUID(as_uuid=True), ForeignKey("rooms.id", ondelete="SET NULL"))
-    home_id = Column(UUID(as_uuid=True), ForeignKey("homes.id", ondelete="SET NULL"))
-    owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"))
+    room_id = Column(UUID(as_uuid=True), ForeignKey("rooms.id", ondelete="SET NULL"), index=True)
+    home_id = Column(UUID(as_uuid=True), ForeignKey("homes.id", ondelete="SET NULL"), index=True)
+    owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), index=True)
 
-    activation_code = Column(String)
+    activation_code = Column(String, unique=True, index=True)
     is_activated = Column(Boolean, default=False, nullable=False)
     activated_at = Column(DateTime)
 
@@ -133,28 +161,108 @@ class Device(Base):
 # SENSOR DATA
 # ---------------------------------------------------------------------
 
+def parse_numeric(value):
+    """Число из строкового показания; NULL для нечисловых значений."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
 class SensorData(Base):
     __tablename__ = "sensor_data"
+    __table_args__ = (
+        # показания устройства за интервал; покрывает и FK device_id
+        Index("ix_sensor_data_device_id_timestamp", "device_id", "timestamp"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     device_id = Column(UUID(as_uuid=True), ForeignKey("devices.id"))
     timestamp = Column(DateTime)
     type = Column(String)
     value = Column(String)
+    # числовое представление value для агрегаций; NULL, если value не число
+    numeric_value = Column(Float)
+    # начало пишущей транзакции (UTC)
+    ingested_at = Column(
+        DateTime,
+        nullable=False,
+        server_default=func.timezone("utc", func.now()),
+    )
+    # id пишущей транзакции; по нему роллапы догоняют high-water mark (миграция 0007)
+    ingest_xid = Column(
+        BigInteger,
+        server_default=text("(pg_current_xact_id()::text)::bigint"),
+        index=True,
+    )
 
     device = relationship("Device")
 
+    @validates("value")
+    def _sync_numeric_value(self, key, value):
+        self.numeric_value = parse_numeric(value)
+        return value
+
+
+# ---------------------------------------------------------------------
+# SENSOR DATA ROLLUPS
+# ---------------------------------------------------------------------
+
+class SensorDataRollupMixin:
+    device_id = Column(UUID(as_uuid=True), primary_key=True)
+    type = Column(String, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    count = Column(Integer, nullable=False)
+    sum = Column(Float, nullable=False)
+    min = Column(Float, nullable=False)
+    max = Column(Float, nullable=False)
+    last_value = Column(Float, nullable=False)
+    last_timestamp = Column(DateTime, nullable=False)
+
+
+class SensorDataRollup1m(SensorDataRollupMixin, Base):
+    __tablename__ = "sensor_data_rollup_1m"
+
+
+class SensorDataRollup1h(SensorDataRollupMixin, Base):
+    __tablename__ = "sensor_data_rollup_1h"
+
+
+class SensorDataRollup1d(SensorDataRollupMixin, Base):
+    __tablename__ = "sensor_data_rollup_1d"
+
+
+class RollupInvalidation(Base):
+    """Показания, удалённые после попадания в роллап: их бакеты пересчитываются."""
+    __tablename__ = "sensor_data_rollup_invalidations"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    device_id = Column(UUID(as_uuid=True), nullable=False)
+    type = Column(String, nullable=False)
+    timestamp = Column(DateTime, nullable=False)
+
+
+class RollupState(Base):
+    __tablename__ = "rollup_state"
+
+    name = Column(String, primary_key=True)
+    # время последнего пересчёта: до него aggregates берут целые бакеты из роллапов
+    high_water = Column(DateTime, nullable=False)
+    # строки sensor_data с ingest_xid ниже уже учтены
+    high_water_xid = Column(BigInteger, nullable=False, server_default=text("0"))
+
 
 # ---------------------------------------------------------------------
 # AUTOMATION
 # ---------------------------------------------------------------------
 
-class AutomationScenario(Base):
+class AutomationScenario(VersionedMixin, Base):
     __tablename__ = "automation_scenarios"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(String)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), index=True)
     enabled = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -174,11 +282,14 @@ class AutomationRule(Base):
     scenario_id = Column(
         UUID(as_uuid=True),
         ForeignKey("automation_scenarios.id", ondelete="CASCADE"),
+        index=True,
     )
     trigger_type = Column(Enum(TriggerType))
     trigger_condition = Column(String)
     action_type = Column(Enum(ActionType))
-    action_target = Column(UUID(as_uuid=True), ForeignKey("devices.id", ondelete="SET NULL"))
+    action_target = Column(UUID(as_uuid=True), ForeignKey("devices.id", ondelete="SET NULL"), index=True)
+    # последний отработанный слот TIME-правила, пишется вместе с событием в outbox
+    last_fired_at = Column(DateTime, nullable=True)
 
     scenario = relationship("AutomationScenario", back_populates="rules")
     device = relationship("Device", back_populates="rules")
@@ -190,12 +301,44 @@ class AutomationRule(Base):
 
 class Notification(Base):
     __tablename__ = "notifications"
+    __table_args__ = (
+        # лента пользователя по keyset (sent_at, id); покрывает и FK user_id
+        Index("ix_notifications_user_id_sent_at", "user_id", "sent_at", "id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
     title = Column(String)
     body = Column(String)
-    sent_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(
+        DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        server_default=func.timezone("utc", func.now()),
+    )
     read = Column(Boolean, default=False)
 
     user = relationship("User", back_populates="notices")
+
+
+class NotificationCounter(Base):
+    """Непрочитанные уведомления пользователя; ведётся триггером на notifications."""
+    __tablename__ = "notification_counters"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    unread = Column(BigInteger, nullable=False, server_default=text("0"))
+
+
+# ---------------------------------------------------------------------
+# OUTBOX
+# ---------------------------------------------------------------------
+
+class OutboxEvent(Base):
+    """Событие для Kafka, записанное в одной транзакции с изменением сущности."""
+    __tablename__ = "outbox_events"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    topic = Column(String, nullable=False)
+    key = Column(String)
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
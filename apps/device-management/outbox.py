@@ -0,0 +1,102 @@
+"""Transactional outbox: события Kafka пишутся в БД вместе с изменением сущности.
+
+Обработчик запроса только добавляет строку в ``outbox_events`` в своей
+транзакции и не ждёт брокер. Фоновый relay вычитывает таблицу пачками по
+порядку id, отправляет в Kafka и удаляет строки после подтверждения
+(at-least-once).
+
+id выдаётся на INSERT, а не на commit: у двух пересекающихся транзакций
+порядок id и порядок commit могут разойтись. Поэтому событие сущности
+ставится после flush её изменения: транзакция уже держит блокировку строки
+до commit, и следующий писатель той же сущности получит id только после
+этого commit. Для ключа, равного id сущности, порядок id совпадает с
+порядком commit; ``version`` в payload устройства позволяет потребителю
+отбросить устаревшее состояние. У ключей без такой строки
+(``automationAction`` по целевому устройству) порядок между одновременными
+транзакциями не определён — это независимые команды.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Optional
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from kafka import send_nowait
+from models import OutboxEvent
+
+__all__ = ["enqueue_event", "relay_outbox", "run_outbox_relay"]
+
+logger = logging.getLogger("outbox")
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_POLL_INTERVAL_S = float(os.getenv("OUTBOX_POLL_INTERVAL_S", "0.2"))
+OUTBOX_RETRY_BACKOFF_S = float(os.getenv("OUTBOX_RETRY_BACKOFF_S", "2"))
+
+# один relay на кластер, иначе SKIP LOCKED-конкуренты перемешают порядок по ключу
+_LOCK_KEY = 0x0B7B0C
+
+
+def enqueue_event(db: AsyncSession, topic: str, key: Optional[str], value: Any) -> None:
+    """Добавить событие в текущую транзакцию; commit — за вызывающим кодом.
+
+    Событие сущности ставится после flush её изменения (см. docstring модуля).
+    """
+    db.add(OutboxEvent(topic=topic, key=key, payload=value))
+
+
+async def relay_outbox(db: AsyncSession) -> Optional[int]:
+    """Отправить одну пачку; число отправленных или None, если relay занят другим процессом."""
+    if not await db.scalar(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _LOCK_KEY}):
+        return None
+
+    events = (
+        await db.scalars(select(OutboxEvent).order_by(OutboxEvent.id).limit(OUTBOX_BATCH_SIZE))
+    ).all()
+    if not events:
+        await db.rollback()
+        return 0
+
+    # send_nowait только ставит сообщение в буфер — вся пачка уходит конвейером;
+    # при открытом circuit breaker падаем сразу, строки остаются в outbox
+    futures = []
+    for event in events:
+        try:
+            futures.append(await send_nowait(event.topic, key=event.key, value=event.payload))
+        except Exception as e:
+            logger.warning("Outbox relay stopped at event %s: %s", event.id, e)
+            break
+    results = await asyncio.gather(*futures, return_exceptions=True)
+
+    # удаляем только префикс до первой ошибки: хвост уйдёт повторно и в том же порядке
+    sent_ids = []
+    for event, result in zip(events, results):
+        if isinstance(result, Exception):
+            logger.warning("Outbox event %s to %s failed: %s", event.id, event.topic, result)
+            break
+        sent_ids.append(event.id)
+
+    if sent_ids:
+        await db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_(sent_ids)))
+    await db.commit()
+    if len(sent_ids) < len(events):
+        raise RuntimeError(f"{len(events) - len(sent_ids)} outbox events left for retry")
+    return len(sent_ids)
+
+
+async def run_outbox_relay() -> None:
+    """Пачки подряд, пока очередь полна, иначе опрос раз в OUTBOX_POLL_INTERVAL_S."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                sent = await relay_outbox(db)
+            if sent == OUTBOX_BATCH_SIZE:
+                continue  # очередь не пуста — сразу следующая пачка
+            await asyncio.sleep(OUTBOX_POLL_INTERVAL_S)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Outbox relay failed")
+            await asyncio.sleep(OUTBOX_RETRY_BACKOFF_S)
@@ -0,0 +1,281 @@
+import base64
+import binascii
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Type
+
+import orjson
+from fastapi import HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import Select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from metrics import LIST_ROWS
+
+__all__ = [
+    "JSON_FAST_PATH",
+    "NEXT_CURSOR_HEADER",
+    "PageParams",
+    "export_snapshot",
+    "page_selection",
+    "paginate",
+    "paginate_json",
+    "stream_ndjson",
+]
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 1000
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# on: списки читаются кортежами колонок схемы и кодируются orjson без
+# построчной валидации Pydantic; байты ответа те же, что у response_model
+JSON_FAST_PATH = os.getenv("JSON_FAST_PATH", "off")  # on | off
+
+
+class PageParams:
+    """Общие query-параметры для списочных эндпоинтов."""
+
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[str] = Query(
+            None, description=f"Непрозрачный курсор из заголовка {NEXT_CURSOR_HEADER}"
+        ),
+        stream: bool = Query(
+            False, description=f"Отдать всю выборку потоком {NDJSON_MEDIA_TYPE}"
+        ),
+    ):
+        self.limit = limit
+        self.after = after
+        self.stream = stream
+
+
+# ---------------------------------------------------------------------------
+# cursor
+
+def _encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([str(v) for v in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, key_columns: Sequence[Any]) -> List[Any]:
+    """Раскодируем курсор и приводим значения к python-типам ключевых колонок."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, list) or len(values) != len(key_columns):
+            raise ValueError("cursor shape mismatch")
+        return [_coerce(col, v) for col, v in zip(key_columns, values)]
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from e
+
+
+def _coerce(column: Any, value: str) -> Any:
+    python_type = column.type.python_type
+    if python_type is uuid.UUID:
+        return uuid.UUID(value)
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    return python_type(value)
+
+
+def _keyset(
+    stmt: Select, key_columns: Sequence[Any], after: Optional[str], descending: bool = False
+) -> Select:
+    if after:
+        values = _decode_cursor(after, key_columns)
+        if len(key_columns) == 1:
+            key, value = key_columns[0], values[0]
+        else:
+            key, value = tuple_(*key_columns), tuple_(*values)
+        stmt = stmt.where(key < value if descending else key > value)
+    if descending:
+        return stmt.order_by(*(col.desc() for col in key_columns))
+    return stmt.order_by(*key_columns)
+
+
+def page_selection(
+    stmt: Select, key_columns: Sequence[Any], page: PageParams, descending: bool = False
+) -> Select:
+    """Строки, которые попадут в ответ: страница плюс строка-признак следующей.
+
+    Для stream — вся выборка после курсора, без сортировки.
+    """
+    stmt = _keyset(stmt, key_columns, page.after, descending)
+    return stmt.order_by(None) if page.stream else stmt.limit(page.limit + 1)
+
+
+async def export_snapshot(db: AsyncSession) -> str:
+    """Снимок транзакции сессии для ``stream_ndjson``: поток увидит те же строки, что ETag.
+
+    Импортировать снимок можно, пока экспортировавшая транзакция открыта;
+    сессия get_async_db закрывается только после отправки ответа.
+    """
+    return await db.scalar(text("SELECT pg_export_snapshot()"))
+
+
+async def _use_snapshot(db: AsyncSession, snapshot: str) -> None:
+    # SET TRANSACTION SNAPSHOT — первым оператором транзакции REPEATABLE READ
+    await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    await db.execute(text(f"SET TRANSACTION SNAPSHOT '{snapshot}'"))
+
+
+def _resource(stmt: Select) -> str:
+    return stmt.column_descriptions[0]["entity"].__tablename__
+
+
+# ---------------------------------------------------------------------------
+# fast path: кортежи колонок + orjson
+
+_columns_cache: Dict[tuple, List[Any]] = {}
+
+
+def _schema_columns(stmt: Select, schema: Type[BaseModel]) -> List[Any]:
+    """Колонки сущности запроса в порядке полей схемы ответа."""
+    entity = stmt.column_descriptions[0]["entity"]
+    columns = _columns_cache.get((entity, schema))
+    if columns is None:
+        columns = [getattr(entity, name) for name in schema.model_fields]
+        _columns_cache[(entity, schema)] = columns
+    return columns
+
+
+def _orjson_default(value: Any) -> Any:
+    # asyncpg отдаёт свой подкласс uuid.UUID, а orjson нативно пишет только точный тип
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def _encode_rows(fields: Sequence[str], rows: Sequence[Any]) -> bytes:
+    return orjson.dumps([dict(zip(fields, row)) for row in rows], default=_orjson_default)
+
+
+# ---------------------------------------------------------------------------
+# public helpers
+
+async def paginate(
+    db: AsyncSession,
+    stmt: Select,
+    key_columns: Sequence[Any],
+    page: PageParams,
+    response: Response,
+    descending: bool = False,
+) -> list:
+    """Одна страница по keyset-курсору; курсор следующей — в заголовке ответа.
+
+    ``descending`` — от больших ключей к меньшим (лента «сначала новые»).
+    """
+    stmt = _keyset(stmt, key_columns, page.after, descending).limit(page.limit + 1)
+    rows = (await db.scalars(stmt)).all()
+    LIST_ROWS.labels(_resource(stmt)).inc(min(len(rows), page.limit))
+
+    if len(rows) > page.limit:
+        rows = rows[: page.limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = _encode_cursor(
+            [getattr(last, col.key) for col in key_columns]
+        )
+    return rows
+
+
+async def paginate_json(
+    db: AsyncSession,
+    stmt: Select,
+    key_columns: Sequence[Any],
+    schema: Type[BaseModel],
+    page: PageParams,
+    headers: Optional[Dict[str, str]] = None,
+    descending: bool = False,
+) -> Response:
+    """То же, что paginate, но сразу готовый JSON: без ORM-объектов и валидации схемы.
+
+    Выбираются только колонки полей ``schema``; ключевые колонки должны быть
+    среди них.
+    """
+    fields = list(schema.model_fields)
+    stmt = stmt.with_only_columns(*_schema_columns(stmt, schema))
+    stmt = _keyset(stmt, key_columns, page.after, descending).limit(page.limit + 1)
+    rows = (await db.execute(stmt)).all()
+    LIST_ROWS.labels(_resource(stmt)).inc(min(len(rows), page.limit))
+
+    headers = dict(headers or {})
+    if len(rows) > page.limit:
+        rows = rows[: page.limit]
+        last = rows[-1]._mapping
+        headers[NEXT_CURSOR_HEADER] = _encode_cursor([last[col.key] for col in key_columns])
+    return Response(_encode_rows(fields, rows), media_type="application/json", headers=headers)
+
+
+def stream_ndjson(
+    stmt: Select,
+    key_columns: Sequence[Any],
+    schema: Type[BaseModel],
+    page: PageParams,
+    headers: Optional[Dict[str, str]] = None,
+    descending: bool = False,
+    snapshot: Optional[str] = None,
+) -> StreamingResponse:
+    """Отдаём выборку NDJSON-потоком с серверного курсора, память не растёт с таблицей.
+
+    ``snapshot`` — из ``export_snapshot``: поток читает тот же снимок, что и ETag.
+    """
+    if JSON_FAST_PATH == "on":
+        return _stream_ndjson_fast(stmt, key_columns, schema, page, headers, descending, snapshot)
+    stmt = _keyset(stmt, key_columns, page.after, descending).execution_options(
+        yield_per=STREAM_CHUNK_SIZE
+    )
+    rows_returned = LIST_ROWS.labels(_resource(stmt))
+
+    async def _lines() -> AsyncIterator[bytes]:
+        # своя сессия: поток живёт дольше, чем зависимость get_async_db
+        async with AsyncSessionLocal() as db:
+            if snapshot is not None:
+                await _use_snapshot(db, snapshot)
+            result = await db.stream_scalars(stmt)
+            async for chunk in result.partitions():
+                rows_returned.inc(len(chunk))
+                yield "".join(
+                    schema.model_validate(obj, from_attributes=True).model_dump_json() + "\n"
+                    for obj in chunk
+                ).encode()
+
+    return StreamingResponse(_lines(), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+
+
+def _stream_ndjson_fast(
+    stmt: Select,
+    key_columns: Sequence[Any],
+    schema: Type[BaseModel],
+    page: PageParams,
+    headers: Optional[Dict[str, str]],
+    descending: bool,
+    snapshot: Optional[str],
+) -> StreamingResponse:
+    fields = list(schema.model_fields)
+    stmt = stmt.with_only_columns(*_schema_columns(stmt, schema))
+    stmt = _keyset(stmt, key_columns, page.after, descending).execution_options(
+        yield_per=STREAM_CHUNK_SIZE
+    )
+    rows_returned = LIST_ROWS.labels(_resource(stmt))
+
+    async def _lines() -> AsyncIterator[bytes]:
+        async with AsyncSessionLocal() as db:
+            if snapshot is not None:
+                await _use_snapshot(db, snapshot)
+            result = await db.stream(stmt)
+            async for chunk in result.partitions():
+                rows_returned.inc(len(chunk))
+                yield b"".join(
+                    orjson.dumps(dict(zip(fields, row)), default=_orjson_default) + b"\n"
+                    for row in chunk
+                )
+
+    return StreamingResponse(_lines(), media_type=NDJSON_MEDIA_TYPE, headers=headers)
@@ -0,0 +1,187 @@
+"""Предрасчитанные агрегаты sensor_data: 1m -> 1h -> 1d.
+
+Фоновая задача догоняет high-water mark по ``sensor_data.ingest_xid`` (id
+пишущей транзакции): пересчитываются только бакеты, в которые попали новые
+(в том числе опоздавшие) показания, а 1h/1d собираются из более мелкого уровня.
+Удаления показаний доходят сюда через ``sensor_data_rollup_invalidations``.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models import RollupState, SensorDataRollup1d, SensorDataRollup1h, SensorDataRollup1m
+
+__all__ = ["ROLLUP_TABLES", "get_high_water", "refresh_rollups", "run_rollup_refresher"]
+
+logger = logging.getLogger("rollups")
+
+ROLLUP_REFRESH_INTERVAL_S = float(os.getenv("ROLLUP_REFRESH_INTERVAL_S", "30"))
+
+_STATE_NAME = "sensor_data"
+# произвольная константа для pg_advisory_xact_lock: один пересчёт на кластер
+_LOCK_KEY = 0x5E7503
+
+# ширина бакета -> модель роллапа
+ROLLUP_TABLES = {
+    "1m": SensorDataRollup1m,
+    "1h": SensorDataRollup1h,
+    "1d": SensorDataRollup1d,
+}
+
+_ORIGIN = "TIMESTAMP '2000-01-01 00:00:00'"
+
+_CREATE_AFFECTED = """
+CREATE TEMP TABLE {name} (
+    device_id UUID NOT NULL,
+    type VARCHAR NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    PRIMARY KEY (device_id, type, bucket)
+) ON COMMIT DROP
+"""
+
+# ниже xmin снимка нет незавершённых транзакций с xid: каждая строка с
+# ingest_xid < границы уже закоммичена (и видна) или откатилась. Пишущая
+# транзакция, как бы долго ни шла COPY, держит границу только своим xid и
+# попадает в следующий пересчёт целиком. Читающие транзакции (NDJSON-выгрузки)
+# xid не получают и границу не держат; прав на pg_stat_activity не нужно.
+_UNTIL = "SELECT (pg_snapshot_xmin(pg_current_snapshot())::text)::bigint"
+
+# бакеты 1m, задетые показаниями, пришедшими с прошлого пересчёта
+_COLLECT_NEW = f"""
+INSERT INTO _affected_1m (device_id, type, bucket)
+SELECT DISTINCT device_id, type, date_bin(INTERVAL '1 minute', timestamp, {_ORIGIN})
+FROM sensor_data
+WHERE ingest_xid >= :since AND ingest_xid < :until
+  AND device_id IS NOT NULL AND type IS NOT NULL AND timestamp IS NOT NULL
+ON CONFLICT DO NOTHING
+"""
+
+_COLLECT_INVALIDATED = f"""
+WITH drained AS (
+    DELETE FROM sensor_data_rollup_invalidations
+    RETURNING device_id, type, timestamp
+)
+INSERT INTO _affected_1m (device_id, type, bucket)
+SELECT DISTINCT device_id, type, date_bin(INTERVAL '1 minute', timestamp, {_ORIGIN})
+FROM drained
+ON CONFLICT DO NOTHING
+"""
+
+_COLLECT_COARSER = f"""
+INSERT INTO {{target}} (device_id, type, bucket)
+SELECT DISTINCT device_id, type, date_bin(INTERVAL '{{interval}}', bucket, {_ORIGIN})
+FROM {{source}}
+ON CONFLICT DO NOTHING
+"""
+
+_DELETE_AFFECTED = """
+DELETE FROM {table} r
+USING {affected} a
+WHERE r.device_id = a.device_id AND r.type = a.type AND r.bucket = a.bucket
+"""
+
+_INSERT_FROM_RAW = """
+INSERT INTO sensor_data_rollup_1m
+    (device_id, type, bucket, count, sum, min, max, last_value, last_timestamp)
+SELECT s.device_id, s.type, a.bucket,
+       count(*), sum(s.numeric_value), min(s.numeric_value), max(s.numeric_value),
+       (array_agg(s.numeric_value ORDER BY s.timestamp DESC))[1], max(s.timestamp)
+FROM _affected_1m a
+JOIN sensor_data s
+  ON s.device_id = a.device_id AND s.type = a.type
+ AND s.timestamp >= a.bucket AND s.timestamp < a.bucket + INTERVAL '1 minute'
+WHERE s.numeric_value IS NOT NULL
+GROUP BY s.device_id, s.type, a.bucket
+"""
+
+_INSERT_FROM_FINER = """
+INSERT INTO {table}
+    (device_id, type, bucket, count, sum, min, max, last_value, last_timestamp)
+SELECT r.device_id, r.type, a.bucket,
+       sum(r.count), sum(r.sum), min(r.min), max(r.max),
+       (array_agg(r.last_value ORDER BY r.last_timestamp DESC))[1], max(r.last_timestamp)
+FROM {affected} a
+JOIN {source} r
+  ON r.device_id = a.device_id AND r.type = a.type
+ AND r.bucket >= a.bucket AND r.bucket < a.bucket + INTERVAL '{interval}'
+GROUP BY r.device_id, r.type, a.bucket
+"""
+
+
+async def get_high_water(db: AsyncSession) -> Optional[datetime]:
+    state = await db.get(RollupState, _STATE_NAME)
+    return state.high_water if state else None
+
+
+async def refresh_rollups(db: AsyncSession) -> Optional[int]:
+    """Один инкрементальный пересчёт; None, если пересчёт уже идёт в другом процессе."""
+    if not await db.scalar(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _LOCK_KEY}):
+        return None
+
+    state = await db.get(RollupState, _STATE_NAME, with_for_update=True)
+    since = state.high_water_xid if state else 0
+    until = await db.scalar(text(_UNTIL))
+    if until <= since:
+        return 0
+
+    for name in ("_affected_1m", "_affected_1h", "_affected_1d"):
+        await db.execute(text(_CREATE_AFFECTED.format(name=name)))
+
+    await db.execute(text(_COLLECT_NEW), {"since": since, "until": until})
+    await db.execute(text(_COLLECT_INVALIDATED))
+
+    # 1m — из сырых данных
+    await db.execute(text(_DELETE_AFFECTED.format(table="sensor_data_rollup_1m", affected="_affected_1m")))
+    await db.execute(text(_INSERT_FROM_RAW))
+
+    # 1h из 1m, 1d из 1h — только задетые бакеты
+    for target, source, interval in (("1h", "1m", "1 hour"), ("1d", "1h", "1 day")):
+        affected = f"_affected_{target}"
+        table = ROLLUP_TABLES[target].__tablename__
+        await db.execute(
+            text(_COLLECT_COARSER.format(target=affected, source=f"_affected_{source}", interval=interval))
+        )
+        await db.execute(text(_DELETE_AFFECTED.format(table=table, affected=affected)))
+        await db.execute(
+            text(
+                _INSERT_FROM_FINER.format(
+                    table=table,
+                    affected=affected,
+                    source=ROLLUP_TABLES[source].__tablename__,
+                    interval=interval,
+                )
+            )
+        )
+
+    touched = await db.scalar(text("SELECT count(*) FROM _affected_1m"))
+
+    now = await db.scalar(text("SELECT timezone('utc', now())"))
+    if state is None:
+        db.add(RollupState(name=_STATE_NAME, high_water=now, high_water_xid=until))
+    else:
+        state.high_water = now
+        state.high_water_xid = until
+    await db.commit()
+    return touched
+
+
+async def run_rollup_refresher() -> None:
+    """Пересчёт раз в ROLLUP_REFRESH_INTERVAL_S; из всех реплик его делает та, что взяла lock."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                touched = await refresh_rollups(db)
+            if touched:
+                logger.info("Rollups refreshed: %d minute buckets recomputed", touched)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Rollup refresh failed")
+        await asyncio.sleep(ROLLUP_REFRESH_INTERVAL_S)
+
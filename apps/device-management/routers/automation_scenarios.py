@@ -1,26 +1,43 @@
 from uuid import UUID
-from typing import List
+from typing import Dict, List, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import insert, select
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
-from aiokafka import AIOKafkaProducer
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
-from database import get_db
+from database import get_async_db
+from metrics import TimedRoute
+from etag import (
+    check_if_match,
+    collection_etag,
+    entity_etag,
+    if_match_requested,
+    none_match,
+    not_modified,
+)
+from pagination import PageParams, export_snapshot, page_selection, paginate, stream_ndjson
 from models import AutomationScenario, AutomationRule, User, Device
 from schemas import (
     ScenarioBase,
     ScenarioResponse,
     RuleBase,
     RuleResponse,
+    TriggerType,
 )
-from kafka import get_kafka_producer
+from outbox import enqueue_event
+from rules import compile_condition, rule_engine
+from scheduler import parse_schedule, rule_scheduler
 
 router = APIRouter(
     prefix="/automation-scenarios",
     tags=["AutomationScenarios"],
+    route_class=TimedRoute,
 )
 
+MAX_BULK_SCENARIOS = 1_000
+
 # ---------------------------------------------------------------------------
 # helpers
 class ScenarioWithRulesResponse(ScenarioResponse):
@@ -49,20 +66,167 @@ def _build_response(
         rules=[RuleResponse.model_validate(r, from_attributes=True) for r in rules],
     )
 
+
+def _scenario_payload(
+    scenario: AutomationScenario,
+    rules: List[AutomationRule],
+) -> dict:
+    return {
+        "id": str(scenario.id),
+        "name": scenario.name,
+        "user_id": str(scenario.user_id),
+        "enabled": scenario.enabled,
+        "created_at": scenario.created_at.isoformat(),
+        "rules": [
+            {
+                "id": str(r.id),
+                "trigger_type": r.trigger_type.value,
+                "trigger_condition": r.trigger_condition,
+                "action_type": r.action_type.value,
+                "action_target": str(r.action_target),
+            }
+            for r in rules
+        ],
+    }
+
+
+def _validate_condition(rule_data: RuleBase) -> None:
+    """Условие компилируется так же, как его потом разберёт движок или планировщик."""
+    parse = compile_condition if rule_data.trigger_type == TriggerType.SENSOR else parse_schedule
+    try:
+        parse(rule_data.trigger_condition)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+
+async def _create_scenarios(
+    db: AsyncSession,
+    items: List[ScenarioWithRulesCreate],
+) -> List[Tuple[AutomationScenario, List[AutomationRule]]]:
+    """Сценарии + правила + события outbox одной транзакцией.
+
+    Число запросов не зависит от числа правил: пользователи и устройства
+    проверяются одним IN, сценарии и правила вставляются пачкой с RETURNING.
+    """
+    # 1. валидируем условия, пользователей и устройства
+    for item in items:
+        for rule_data in item.rules:
+            _validate_condition(rule_data)
+
+    user_ids = {item.user_id for item in items}
+    missing_users = user_ids - set(await db.scalars(select(User.id).where(User.id.in_(user_ids))))
+    if missing_users:
+        raise HTTPException(
+            status_code=404,
+            detail=f"User not found: {', '.join(sorted(map(str, missing_users)))}",
+        )
+
+    targets = {r.action_target for item in items for r in item.rules if r.action_target}
+    if targets:
+        missing = targets - set(await db.scalars(select(Device.id).where(Device.id.in_(targets))))
+        if missing:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Device not found: {', '.join(sorted(map(str, missing)))}",
+            )
+
+    try:
+        # 2. сценарии и правила — по одному INSERT ... RETURNING на таблицу
+        scenarios = (
+            await db.scalars(
+                insert(AutomationScenario).returning(AutomationScenario, sort_by_parameter_order=True),
+                [item.dict(exclude={"rules"}) for item in items],
+            )
+        ).all()
+
+        rule_rows = [
+            {**rule_data.dict(exclude={"scenario_id"}), "scenario_id": scenario.id}
+            for scenario, item in zip(scenarios, items)
+            for rule_data in item.rules
+        ]
+        rules_by_scenario: Dict[UUID, List[AutomationRule]] = {scenario.id: [] for scenario in scenarios}
+        if rule_rows:
+            rules = await db.scalars(
+                insert(AutomationRule).returning(AutomationRule, sort_by_parameter_order=True),
+                rule_rows,
+            )
+            for rule in rules:
+                rules_by_scenario[rule.scenario_id].append(rule)
+
+        # 3. события для Kafka — в той же транзакции
+        created = [(scenario, rules_by_scenario[scenario.id]) for scenario in scenarios]
+        for scenario, rules in created:
+            enqueue_event(
+                db,
+                topic="autoCommand",
+                key=str(scenario.id),
+                value=_scenario_payload(scenario, rules),
+            )
+        await db.commit()
+
+    except IntegrityError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Database integrity error") from e
+
+    for scenario, rules in created:
+        _reload_scenario(scenario, rules)
+    return created
+
+
+def _reload_scenario(scenario: AutomationScenario, rules: List[AutomationRule]) -> None:
+    rule_engine.load_scenario(scenario, rules)
+    rule_scheduler.load_scenario(scenario, rules)
+
 # ---------------------------------------------------------------------------
 @router.get("/", response_model=List[ScenarioResponse])
-def list_scenarios(db: Session = Depends(get_db)):
-    return db.query(AutomationScenario).all()
+async def list_scenarios(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+):
+    selection = page_selection(select(AutomationScenario), [AutomationScenario.id], page)
+    etag = await collection_etag(db, selection, request)
+    if none_match(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    if page.stream:
+        return stream_ndjson(
+            select(AutomationScenario),
+            [AutomationScenario.id],
+            ScenarioResponse,
+            page,
+            headers={"ETag": etag},
+            snapshot=await export_snapshot(db),
+        )
+    return await paginate(db, select(AutomationScenario), [AutomationScenario.id], page, response)
 
 
 @router.get("/{scenario_id}", response_model=ScenarioWithRulesResponse)
-def get_scenario(scenario_id: UUID, db: Session = Depends(get_db)):
-    scenario = db.query(AutomationScenario).filter(
-        AutomationScenario.id == scenario_id
-    ).first()
+async def get_scenario(
+    scenario_id: UUID,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+):
+    if "if-none-match" in request.headers:
+        # версия сценария учитывает и его правила: на 304 правила не читаем
+        version = await db.scalar(
+            select(AutomationScenario.version).where(AutomationScenario.id == scenario_id)
+        )
+        if version is not None and none_match(request, entity_etag(version)):
+            return not_modified(entity_etag(version))
+
+    # правила грузим сразу: ленивой подгрузки в AsyncSession нет
+    scenario = await db.scalar(
+        select(AutomationScenario)
+        .options(selectinload(AutomationScenario.rules))
+        .where(AutomationScenario.id == scenario_id)
+    )
     if not scenario:
         raise HTTPException(status_code=404, detail="Scenario not found")
 
+    response.headers["ETag"] = entity_etag(scenario.version)
     return _build_response(scenario, scenario.rules)
 
 # ---------------------------------------------------------------------------
@@ -73,111 +237,66 @@ def get_scenario(scenario_id: UUID, db: Session = Depends(get_db)):
 )
 async def create_scenario(
     data: ScenarioWithRulesCreate,
-    db: Session = Depends(get_db),
-    producer: AIOKafkaProducer = Depends(get_kafka_producer),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    """Создать сценарий + правила и отправить событие в Kafka."""
-
-    # 1. валидируем пользователя
-    if not db.query(User).filter(User.id == data.user_id).first():
-        raise HTTPException(status_code=404, detail="User not found")
-
-    try:
-        # 2. создаём сценарий
-        new_scenario = AutomationScenario(**data.dict(exclude={"rules"}))
-        db.add(new_scenario)
-        db.flush()  # сразу получаем new_scenario.id
-
-        # 3. создаём правила
-        created_rules: List[AutomationRule] = []
-        for rule_data in data.rules:
-            # проверяем существование устройства
-            if rule_data.action_target:
-                if not db.query(Device).filter(Device.id == rule_data.action_target).first():
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Device {rule_data.action_target} not found",
-                    )
-
-            rule = AutomationRule(
-                **rule_data.dict(exclude={"scenario_id"}),
-                scenario_id=new_scenario.id,
-            )
-            db.add(rule)
-            created_rules.append(rule)
-
-        # 4. фиксируем транзакцию
-        db.commit()
-
-    except HTTPException:
-        db.rollback()
-        raise
-    except IntegrityError as e:
-        db.rollback()
-        raise HTTPException(status_code=400, detail="Database integrity error") from e
+    """Создать сценарий + правила и поставить событие в outbox для Kafka."""
+    [(new_scenario, created_rules)] = await _create_scenarios(db, [data])
+    return _build_response(new_scenario, created_rules)
 
-    # 5. рефрешим объекты
-    db.refresh(new_scenario)
-    for r in created_rules:
-        db.refresh(r)
 
-    # 6. шлём событие в Kafka (не критично при ошибке)
-    try:
-        await producer.send_and_wait(
-            topic="autoCommand",
-            key=str(new_scenario.id),
-            value={
-                "id": str(new_scenario.id),
-                "name": new_scenario.name,
-                "user_id": str(new_scenario.user_id),
-                "enabled": new_scenario.enabled,
-                "created_at": new_scenario.created_at.isoformat(),
-                "rules": [
-                    {
-                        "id": str(r.id),
-                        "trigger_type": r.trigger_type.value,
-                        "trigger_condition": r.trigger_condition,
-                        "action_type": r.action_type.value,
-                        "action_target": str(r.action_target),
-                    }
-                    for r in created_rules
-                ],
-            },
+@router.post(
+    "/bulk",
+    response_model=List[ScenarioWithRulesResponse],
+    status_code=status.HTTP_201_CREATED,
+)
+async def create_scenarios_bulk(
+    data: List[ScenarioWithRulesCreate],
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Импорт многих сценариев с правилами одной транзакцией (всё или ничего)."""
+    if not data:
+        return []
+    if len(data) > MAX_BULK_SCENARIOS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Bulk import is limited to {MAX_BULK_SCENARIOS} scenarios",
         )
-    except Exception as e:
-        print(f"[Kafka] Failed to send message: {e}")
-
-    # 7. отдаём DTO клиенту
-    return _build_response(new_scenario, created_rules)
+    created = await _create_scenarios(db, data)
+    return [_build_response(scenario, rules) for scenario, rules in created]
 
 # ---------------------------------------------------------------------------
 @router.put("/{scenario_id}", response_model=ScenarioResponse)
-def update_scenario(
+async def update_scenario(
     scenario_id: UUID,
     data: ScenarioBase,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
 ):
-    scenario = db.query(AutomationScenario).filter(
-        AutomationScenario.id == scenario_id
-    ).first()
+    scenario = await db.get(
+        AutomationScenario, scenario_id, with_for_update=if_match_requested(request)
+    )
     if not scenario:
         raise HTTPException(status_code=404, detail="Scenario not found")
+    check_if_match(request, entity_etag(scenario.version))
 
     for field, value in data.dict(exclude_unset=True).items():
         setattr(scenario, field, value)
 
-    db.commit()
-    db.refresh(scenario)
+    await db.commit()
+    response.headers["ETag"] = entity_etag(scenario.version)
+    rules = await db.scalars(select(AutomationRule).where(AutomationRule.scenario_id == scenario_id))
+    _reload_scenario(scenario, rules.all())
     return scenario
 
 # ---------------------------------------------------------------------------
 @router.delete("/{scenario_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_scenario(scenario_id: UUID, db: Session = Depends(get_db)):
-    scenario = db.query(AutomationScenario).filter(
-        AutomationScenario.id == scenario_id
-    ).first()
+async def delete_scenario(scenario_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    scenario = await db.get(AutomationScenario, scenario_id)
     if not scenario:
         raise HTTPException(status_code=404, detail="Scenario not found")
 
-    db.delete(scenario)  # cascade=\"all, delete-orphan\" удалит правила
-    db.commit()
+    await db.delete(scenario)  # cascade=\"all, delete-orphan\" удалит правила
+    await db.commit()
+    rule_engine.remove_scenario(scenario_id)
+    rule_scheduler.remove_scenario(scenario_id)
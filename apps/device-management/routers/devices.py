@@ -3,20 +3,73 @@ from uuid import UUID
 from typing import List, Optional
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from aiokafka import AIOKafkaProducer
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import get_db
-from models import Device
-from schemas import DeviceBase, DeviceResponse
-from kafka import get_kafka_producer
+from database import get_async_db
+from metrics import TimedRoute
+from pagination import (
+    JSON_FAST_PATH,
+    PageParams,
+    export_snapshot,
+    page_selection,
+    paginate,
+    paginate_json,
+    stream_ndjson,
+)
+from models import Device, DeviceType
+from schemas import DeviceBase, DeviceBulkUpdate, DeviceBulkUpdateResult, DeviceResponse
+from outbox import enqueue_event
+from cache import caches
+from etag import (
+    Tagged,
+    check_if_match,
+    collection_etag,
+    entity_etag,
+    if_match_requested,
+    none_match,
+    not_modified,
+    tagged,
+)
 
 router = APIRouter(
     prefix="/sensors",       
     tags=["Devices"],
+    route_class=TimedRoute,
 )
 
+device_cache = caches["device"]
+
+MAX_BULK_DEVICES = 10_000
+
+
+def _integrity_error(e: IntegrityError) -> HTTPException:
+    # activation_code уникален по индексу: дубль ловим здесь, а не проверкой до записи
+    if "activation_code" in str(e.orig):
+        return HTTPException(status_code=400, detail="Activation code already registered")
+    return HTTPException(status_code=400, detail="Database integrity error")
+
+
+async def enqueue_device_deletions(db: AsyncSession) -> List[UUID]:
+    """deleteDeviceNotification на каждое устройство, помеченное в сессии к удалению.
+
+    Устройства дома, комнаты или пользователя удаляет каскад ORM; события те же,
+    что у DELETE /sensors/{id}, по ним остальные воркеры чистят свой кэш.
+    События ставятся после flush, под блокировкой удалённых строк (см. outbox.py).
+    """
+    device_ids = [obj.id for obj in db.deleted if isinstance(obj, Device)]
+    await db.flush()
+    for device_id in device_ids:
+        enqueue_event(
+            db,
+            topic="deleteDeviceNotification",
+            key=str(device_id),
+            value={"id": str(device_id)},
+        )
+    return device_ids
+
 # ---------------------------------------------------------------------------
 def _device_payload(device: Device) -> dict:
     """Сериализуем ORM-объект в dict, приводя всё не-JSON к str."""
@@ -30,42 +83,158 @@ def _device_payload(device: Device) -> dict:
         "home_id":        str(device.home_id) if device.home_id else None,
         "room_id":        str(device.room_id) if device.room_id else None,
         "is_activated":   device.is_activated,
+        # версия строки: потребитель отбрасывает событие старее уже применённого
+        "version":        device.version,
     }
 
 # ---------------------------------------------------------------------------
 @router.get("/", response_model=List[DeviceResponse])
-async def list_devices(db: Session = Depends(get_db)):
-    return db.query(Device).all()
+async def list_devices(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+):
+    selection = page_selection(select(Device), [Device.id], page)
+    etag = await collection_etag(db, selection, request)
+    if none_match(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    if page.stream:
+        return stream_ndjson(
+            select(Device),
+            [Device.id],
+            DeviceResponse,
+            page,
+            headers={"ETag": etag},
+            snapshot=await export_snapshot(db),
+        )
+    if JSON_FAST_PATH == "on":
+        return await paginate_json(
+            db, select(Device), [Device.id], DeviceResponse, page, headers={"ETag": etag}
+        )
+    return await paginate(db, select(Device), [Device.id], page, response)
+
+# ---------------------------------------------------------------------------
+@router.patch("/bulk", response_model=DeviceBulkUpdateResult)
+async def update_devices_bulk(
+    data: DeviceBulkUpdate,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Частичное обновление многих устройств одним UPDATE ... RETURNING.
+
+    На каждое изменённое устройство — событие uiCommand в outbox в той же
+    транзакции; relay отправляет их в Kafka пачкой, не дожидаясь по одному.
+    """
+    values = data.patch.dict(exclude_unset=True)
+    if not values:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    not_nullable = [f for f, v in values.items() if v is None and not Device.__table__.c[f].nullable]
+    if not_nullable:
+        raise HTTPException(status_code=400, detail=f"Fields cannot be null: {', '.join(not_nullable)}")
+
+    conditions = []
+    if data.ids is not None:
+        if len(data.ids) > MAX_BULK_DEVICES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Bulk update is limited to {MAX_BULK_DEVICES} devices",
+            )
+        conditions.append(Device.id.in_(data.ids))
+    selector = data.filter.dict(exclude_none=True) if data.filter else {}
+    if "type" in selector:
+        try:
+            selector["type"] = DeviceType(selector["type"].value)
+        except ValueError:
+            # тип есть в API, но не в БД: под фильтр не попадает ни одно устройство
+            return DeviceBulkUpdateResult(updated=[], not_found=data.ids or [])
+    conditions.extend(getattr(Device, field) == value for field, value in selector.items())
+    if not conditions:
+        raise HTTPException(status_code=400, detail="Select devices by ids or filter")
+
+    if selector:
+        # сначала только id, не больше лимита: широкий фильтр получает 413 без
+        # записи и триггеров; FOR UPDATE в порядке id — строки не уйдут до UPDATE,
+        # а параллельные bulk-запросы не сцепятся в deadlock
+        locked = (
+            await db.scalars(
+                select(Device.id)
+                .where(*conditions)
+                .order_by(Device.id)
+                .limit(MAX_BULK_DEVICES + 1)
+                .with_for_update()
+            )
+        ).all()
+        if len(locked) > MAX_BULK_DEVICES:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Filter matches more than {MAX_BULK_DEVICES} devices",
+            )
+        conditions = [Device.id.in_(locked)]
+
+    devices = (
+        await db.scalars(update(Device).where(*conditions).values(**values).returning(Device))
+    ).all()
+
+    for device in devices:
+        enqueue_event(
+            db,
+            topic="uiCommand",
+            key=str(device.id),
+            value=_device_payload(device),
+        )
+    await db.commit()
+    for device in devices:
+        device_cache.invalidate(device.id)
+
+    updated_ids = {device.id for device in devices}
+    return DeviceBulkUpdateResult(
+        updated=[{"id": device.id, "etag": entity_etag(device.version)} for device in devices],
+        not_found=[device_id for device_id in dict.fromkeys(data.ids or []) if device_id not in updated_ids],
+    )
 
 # ---------------------------------------------------------------------------
 @router.get("/{device_id}", response_model=DeviceResponse)
-async def get_device(device_id: UUID, db: Session = Depends(get_db)):
-    device = db.query(Device).filter(Device.id == device_id).first()
+async def get_device(
+    device_id: UUID,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+):
+    async def _load() -> Optional[Tagged]:
+        device = await db.get(Device, device_id)
+        return tagged(DeviceResponse, device) if device else None
+
+    device = await device_cache.get_or_load(device_id, _load)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
-    return device
+    if none_match(request, device.etag):
+        return not_modified(device.etag)
+    response.headers["ETag"] = device.etag
+    return device.body
 
 # ---------------------------------------------------------------------------
 @router.post("/", response_model=DeviceResponse, status_code=status.HTTP_201_CREATED)
 async def create_device(
     device_data: DeviceBase,
-    db: Session = Depends(get_db),
-    producer: AIOKafkaProducer = Depends(get_kafka_producer),
+    db: AsyncSession = Depends(get_async_db),
 ):
     device = Device(**device_data.dict())
     db.add(device)
-    db.commit()
-    db.refresh(device)
-
     try:
-        await producer.send_and_wait(
+        await db.flush()  # id и серверные дефолты нужны для события
+
+        enqueue_event(
+            db,
             topic="newDeviceNotification",
-            key=str(device.id),           
-            value=_device_payload(device), 
+            key=str(device.id),
+            value=_device_payload(device),
         )
-        print("[Kafka] newDeviceNotification sent")
-    except Exception as e:
-        print(f"[Kafka] Failed to send message: {e}")
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        raise _integrity_error(e) from e
 
     return device
 
@@ -75,11 +244,10 @@ async def activate_device(
     activation_code: str,
     home_id: UUID,
     room_id: UUID,
-    db: Session = Depends(get_db),
-    producer: AIOKafkaProducer = Depends(get_kafka_producer),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    device: Optional[Device] = (
-        db.query(Device).filter(Device.activation_code == activation_code).first()
+    device: Optional[Device] = await db.scalar(
+        select(Device).where(Device.activation_code == activation_code)
     )
     if not device:
         raise HTTPException(status_code=404, detail="Activation code not found")
@@ -90,19 +258,16 @@ async def activate_device(
     device.room_id = room_id
     device.is_activated = True
     device.activated_at = datetime.utcnow()
+    await db.flush()  # событие — под блокировкой строки и с новой version
 
-    db.commit()
-    db.refresh(device)
-
-    try:
-        await producer.send_and_wait(
-            topic="uiActivatedCommand",
-            key=str(device.id),
-            value=_device_payload(device),
-        )
-        print("[Kafka] uiActivatedCommand sent")
-    except Exception as e:
-        print(f"[Kafka] Failed to send message: {e}")
+    enqueue_event(
+        db,
+        topic="uiActivatedCommand",
+        key=str(device.id),
+        value=_device_payload(device),
+    )
+    await db.commit()
+    device_cache.invalidate(device.id)
 
     return device
 
@@ -111,28 +276,32 @@ async def activate_device(
 async def update_device(
     device_id: UUID,
     device_data: DeviceBase,
-    db: Session = Depends(get_db),
-    producer: AIOKafkaProducer = Depends(get_kafka_producer),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
 ):
-    device = db.query(Device).filter(Device.id == device_id).first()
+    device = await db.get(Device, device_id, with_for_update=if_match_requested(request))
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
+    check_if_match(request, entity_etag(device.version))
 
     for field, value in device_data.dict(exclude_unset=True).items():
         setattr(device, field, value)
 
-    db.commit()
-    db.refresh(device)
-
     try:
-        await producer.send_and_wait(
+        await db.flush()  # событие — под блокировкой строки и с новой version
+        enqueue_event(
+            db,
             topic="uiCommand",
             key=str(device.id),
             value=_device_payload(device),
         )
-        print("[Kafka] uiCommand sent")
-    except Exception as e:
-        print(f"[Kafka] Failed to send message: {e}")
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        raise _integrity_error(e) from e
+    device_cache.invalidate(device_id)
+    response.headers["ETag"] = entity_etag(device.version)
 
     return device
 
@@ -140,22 +309,19 @@ async def update_device(
 @router.delete("/{device_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_device(
     device_id: UUID,
-    db: Session = Depends(get_db),
-    producer: AIOKafkaProducer = Depends(get_kafka_producer),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    device = db.query(Device).filter(Device.id == device_id).first()
+    device = await db.get(Device, device_id)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
 
-    db.delete(device)
-    db.commit()
-
-    try:
-        await producer.send_and_wait(
-            topic="deleteDeviceNotification",
-            key=str(device.id),
-            value={"id": str(device.id)},
-        )
-        print("[Kafka] deleteDeviceNotification sent")
-    except Exception as e:
-        print(f"[Kafka] Failed to send message: {e}")
+    await db.delete(device)
+    await db.flush()  # событие — после DELETE, под блокировкой строки
+    enqueue_event(
+        db,
+        topic="deleteDeviceNotification",
+        key=str(device.id),
+        value={"id": str(device.id)},
+    )
+    await db.commit()
+    device_cache.invalidate(device_id)
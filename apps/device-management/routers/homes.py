@@ -1,52 +1,167 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
-from typing import List
+from typing import List, Optional
 
-from models import Home
-from database import get_db
-from schemas import HomeBase, HomeResponse
+from models import Home, Room
+from database import get_async_db
+from metrics import TimedRoute
+from pagination import PageParams, export_snapshot, page_selection, paginate, stream_ndjson
+from cache import caches
+from routers.devices import enqueue_device_deletions
+from etag import (
+    Tagged,
+    check_if_match,
+    collection_etag,
+    entity_etag,
+    if_match_requested,
+    none_match,
+    not_modified,
+    tagged,
+)
+from schemas import HomeBase, HomeResponse, HomeTopologyResponse, RoomResponse, RoomTopology
 
 router = APIRouter(
     prefix="/homes",
-    tags=["Homes"]
+    tags=["Homes"],
+    route_class=TimedRoute,
 )
 
+home_cache = caches["home"]
+
+# ветки дерева для ?include=: rooms — комнаты, rooms.devices — комнаты с их
+# устройствами, devices — все устройства дома плоским списком
+TOPOLOGY_INCLUDES = ("rooms", "rooms.devices", "devices")
+
 @router.get("/", response_model=List[HomeResponse])
-def list_homes(db: Session = Depends(get_db)):
-    return db.query(Home).all()
+async def list_homes(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+):
+    selection = page_selection(select(Home), [Home.id], page)
+    etag = await collection_etag(db, selection, request)
+    if none_match(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    if page.stream:
+        return stream_ndjson(
+            select(Home),
+            [Home.id],
+            HomeResponse,
+            page,
+            headers={"ETag": etag},
+            snapshot=await export_snapshot(db),
+        )
+    return await paginate(db, select(Home), [Home.id], page, response)
 
 @router.get("/{home_id}", response_model=HomeResponse)
-def get_home(home_id: UUID, db: Session = Depends(get_db)):
-    home = db.query(Home).filter(Home.id == home_id).first()
+async def get_home(
+    home_id: UUID,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+):
+    async def _load() -> Optional[Tagged]:
+        home = await db.get(Home, home_id)
+        return tagged(HomeResponse, home) if home else None
+
+    home = await home_cache.get_or_load(home_id, _load)
     if not home:
         raise HTTPException(status_code=404, detail="Home not found")
-    return home
+    if none_match(request, home.etag):
+        return not_modified(home.etag)
+    response.headers["ETag"] = home.etag
+    return home.body
+
+@router.get(
+    "/{home_id}/topology",
+    response_model=HomeTopologyResponse,
+    response_model_exclude_unset=True,
+)
+async def get_home_topology(
+    home_id: UUID,
+    include: str = Query(
+        "rooms.devices",
+        description="Через запятую: " + ", ".join(TOPOLOGY_INCLUDES),
+    ),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Дом целиком за 1–4 запроса: по одному selectinload на каждый уровень ветки."""
+    branches = {part.strip() for part in include.split(",") if part.strip()}
+    unknown = branches.difference(TOPOLOGY_INCLUDES)
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown include: {', '.join(sorted(unknown))}"
+        )
+    with_rooms = bool(branches & {"rooms", "rooms.devices"})
+
+    options = []
+    if "rooms.devices" in branches:
+        options.append(selectinload(Home.rooms).selectinload(Room.devices))
+    elif with_rooms:
+        options.append(selectinload(Home.rooms))
+    if "devices" in branches:
+        options.append(selectinload(Home.devices))
+
+    home = await db.scalar(select(Home).where(Home.id == home_id).options(*options))
+    if not home:
+        raise HTTPException(status_code=404, detail="Home not found")
+
+    # явно задаём только запрошенные ветки: остальные уберёт exclude_unset
+    fields = HomeResponse.model_validate(home, from_attributes=True).model_dump()
+    if with_rooms:
+        fields["rooms"] = [
+            RoomTopology.model_validate(room, from_attributes=True)
+            if "rooms.devices" in branches
+            else RoomTopology(**RoomResponse.model_validate(room, from_attributes=True).model_dump())
+            for room in home.rooms
+        ]
+    if "devices" in branches:
+        fields["devices"] = home.devices
+    return HomeTopologyResponse.model_validate(fields, from_attributes=True)
 
 @router.post("/", response_model=HomeResponse, status_code=status.HTTP_201_CREATED)
-def create_home(home_data: HomeBase, db: Session = Depends(get_db)):
+async def create_home(home_data: HomeBase, db: AsyncSession = Depends(get_async_db)):
     home = Home(**home_data.dict())
     db.add(home)
-    db.commit()
-    db.refresh(home)
+    await db.commit()
     return home
 
 @router.put("/{home_id}", response_model=HomeResponse)
-def update_home(home_id: UUID, home_data: HomeBase, db: Session = Depends(get_db)):
-    home = db.query(Home).filter(Home.id == home_id).first()
+async def update_home(
+    home_id: UUID,
+    home_data: HomeBase,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+):
+    home = await db.get(Home, home_id, with_for_update=if_match_requested(request))
     if not home:
         raise HTTPException(status_code=404, detail="Home not found")
+    check_if_match(request, entity_etag(home.version))
     for field, value in home_data.dict().items():
         setattr(home, field, value)
-    db.commit()
-    db.refresh(home)
+    await db.commit()
+    home_cache.invalidate(home_id)
+    response.headers["ETag"] = entity_etag(home.version)
     return home
 
 @router.delete("/{home_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_home(home_id: UUID, db: Session = Depends(get_db)):
-    home = db.query(Home).filter(Home.id == home_id).first()
+async def delete_home(home_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    home = await db.get(Home, home_id)
     if not home:
         raise HTTPException(status_code=404, detail="Home not found")
-    db.delete(home)
-    db.commit()
+    await db.delete(home)  # cascade="all, delete-orphan" удалит комнаты и устройства дома
+    room_ids = [obj.id for obj in db.deleted if isinstance(obj, Room)]
+    device_ids = await enqueue_device_deletions(db)
+    await db.commit()
+    home_cache.invalidate(home_id)
+    for room_id in room_ids:
+        caches["room"].invalidate(room_id)
+    for device_id in device_ids:
+        caches["device"].invalidate(device_id)
     return
@@ -0,0 +1,148 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import DateTime, String, false, func, insert, literal, select, union, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from uuid import UUID
+from datetime import datetime
+from typing import List, Optional
+
+from models import Device, Home, Notification, NotificationCounter, User
+from database import get_async_db
+from metrics import TimedRoute
+from ingest import as_naive_utc
+from pagination import JSON_FAST_PATH, PageParams, paginate, paginate_json, stream_ndjson
+from schemas import (
+    NotificationBulkCreate,
+    NotificationBulkResult,
+    NotificationMarkReadResult,
+    NotificationResponse,
+    NotificationUnreadCount,
+)
+
+router = APIRouter(
+    prefix="/notifications",
+    tags=["Notifications"],
+    route_class=TimedRoute,
+)
+
+MAX_BULK_RECIPIENTS = 10_000
+
+# лента — сначала новые
+FEED_KEY = [Notification.sent_at, Notification.id]
+
+# ---------------------------------------------------------------------------
+@router.get("/", response_model=List[NotificationResponse])
+async def list_notifications(
+    response: Response,
+    user_id: UUID = Query(...),
+    unread: bool = Query(False, description="Только непрочитанные"),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Лента пользователя по keyset-курсору (sent_at, id), сначала новые."""
+    stmt = select(Notification).where(Notification.user_id == user_id)
+    if unread:
+        stmt = stmt.where(Notification.read.is_not(True))
+    if page.stream:
+        return stream_ndjson(stmt, FEED_KEY, NotificationResponse, page, descending=True)
+    if JSON_FAST_PATH == "on":
+        return await paginate_json(db, stmt, FEED_KEY, NotificationResponse, page, descending=True)
+    return await paginate(db, stmt, FEED_KEY, page, response, descending=True)
+
+# ---------------------------------------------------------------------------
+@router.get("/unread-count", response_model=NotificationUnreadCount)
+async def get_unread_count(
+    user_id: UUID = Query(...),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Бейдж: чтение счётчика по первичному ключу, без COUNT(*) по notifications."""
+    unread = await db.scalar(
+        select(NotificationCounter.unread).where(NotificationCounter.user_id == user_id)
+    )
+    return NotificationUnreadCount(user_id=user_id, unread=unread or 0)
+
+# ---------------------------------------------------------------------------
+def _recipients(data: NotificationBulkCreate):
+    """Получатели одним SELECT: существующие user_ids и участники дома без повторов.
+
+    Отдельной таблицы участников нет: участник дома — его владелец и владельцы
+    устройств в нём.
+    """
+    sources = []
+    if data.user_ids:
+        sources.append(select(User.id.label("user_id")).where(User.id.in_(data.user_ids)))
+    if data.home_id is not None:
+        sources.append(
+            select(Home.owner_id).where(Home.id == data.home_id, Home.owner_id.is_not(None))
+        )
+        sources.append(
+            select(Device.owner_id).where(Device.home_id == data.home_id, Device.owner_id.is_not(None))
+        )
+    return union(*sources).subquery() if len(sources) > 1 else sources[0].subquery()
+
+
+@router.post("/bulk", response_model=NotificationBulkResult, status_code=status.HTTP_201_CREATED)
+async def create_notifications_bulk(
+    data: NotificationBulkCreate,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Рассылка одним INSERT ... SELECT; счётчики непрочитанных обновляет триггер в той же транзакции."""
+    if not data.user_ids and data.home_id is None:
+        raise HTTPException(status_code=400, detail="Specify user_ids or home_id")
+    if len(data.user_ids) > MAX_BULK_RECIPIENTS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Bulk notification is limited to {MAX_BULK_RECIPIENTS} recipients",
+        )
+
+    sent_at = as_naive_utc(data.sent_at) if data.sent_at else datetime.utcnow()
+    recipients = _recipients(data)
+    rows = select(
+        func.gen_random_uuid(),
+        recipients.c[0],
+        literal(data.title, String),
+        literal(data.body, String),
+        literal(sent_at, DateTime),
+        false(),
+    )
+    stmt = (
+        insert(Notification)
+        .from_select(["id", "user_id", "title", "body", "sent_at", "read"], rows)
+        .returning(Notification.user_id)
+    )
+    created = set((await db.execute(stmt)).scalars().all())
+    await db.commit()
+
+    return NotificationBulkResult(
+        created=len(created),
+        unknown_user_ids=[u for u in dict.fromkeys(data.user_ids) if u not in created],
+    )
+
+# ---------------------------------------------------------------------------
+@router.post("/mark-all-read", response_model=NotificationMarkReadResult)
+async def mark_all_read(
+    user_id: UUID = Query(...),
+    until: Optional[datetime] = Query(None, description="Только отправленные не позже"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Одним UPDATE; уведомления, пришедшие после until, остаются непрочитанными."""
+    stmt = update(Notification).where(
+        Notification.user_id == user_id, Notification.read.is_not(True)
+    )
+    if until is not None:
+        stmt = stmt.where(Notification.sent_at <= as_naive_utc(until))
+    result = await db.execute(
+        stmt.values(read=True).execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return NotificationMarkReadResult(updated=result.rowcount)
+
+# ---------------------------------------------------------------------------
+@router.post("/{notification_id}/read", response_model=NotificationResponse)
+async def mark_read(notification_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    notification = await db.get(Notification, notification_id)
+    if not notification:
+        raise HTTPException(status_code=404, detail="Notification not found")
+    if not notification.read:
+        notification.read = True
+        await db.commit()
+    return notification
@@ -1,52 +1,112 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
-from typing import List
+from typing import List, Optional
 
 from models import Room
-from database import get_db
+from database import get_async_db
+from metrics import TimedRoute
+from pagination import PageParams, export_snapshot, page_selection, paginate, stream_ndjson
+from cache import caches
+from routers.devices import enqueue_device_deletions
+from etag import (
+    Tagged,
+    check_if_match,
+    collection_etag,
+    entity_etag,
+    if_match_requested,
+    none_match,
+    not_modified,
+    tagged,
+)
 from schemas import RoomBase, RoomResponse
 
 router = APIRouter(
     prefix="/rooms",
-    tags=["Rooms"]
+    tags=["Rooms"],
+    route_class=TimedRoute,
 )
 
+room_cache = caches["room"]
+
 @router.get("/", response_model=List[RoomResponse])
-def list_rooms(db: Session = Depends(get_db)):
-    return db.query(Room).all()
+async def list_rooms(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+):
+    selection = page_selection(select(Room), [Room.id], page)
+    etag = await collection_etag(db, selection, request)
+    if none_match(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    if page.stream:
+        return stream_ndjson(
+            select(Room),
+            [Room.id],
+            RoomResponse,
+            page,
+            headers={"ETag": etag},
+            snapshot=await export_snapshot(db),
+        )
+    return await paginate(db, select(Room), [Room.id], page, response)
 
 @router.get("/{room_id}", response_model=RoomResponse)
-def get_room(room_id: UUID, db: Session = Depends(get_db)):
-    room = db.query(Room).filter(Room.id == room_id).first()
+async def get_room(
+    room_id: UUID,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+):
+    async def _load() -> Optional[Tagged]:
+        room = await db.get(Room, room_id)
+        return tagged(RoomResponse, room) if room else None
+
+    room = await room_cache.get_or_load(room_id, _load)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
-    return room
+    if none_match(request, room.etag):
+        return not_modified(room.etag)
+    response.headers["ETag"] = room.etag
+    return room.body
 
 @router.post("/", response_model=RoomResponse, status_code=status.HTTP_201_CREATED)
-def create_room(room_data: RoomBase, db: Session = Depends(get_db)):
+async def create_room(room_data: RoomBase, db: AsyncSession = Depends(get_async_db)):
     room = Room(**room_data.dict())
     db.add(room)
-    db.commit()
-    db.refresh(room)
+    await db.commit()
     return room
 
 @router.put("/{room_id}", response_model=RoomResponse)
-def update_room(room_id: UUID, room_data: RoomBase, db: Session = Depends(get_db)):
-    room = db.query(Room).filter(Room.id == room_id).first()
+async def update_room(
+    room_id: UUID,
+    room_data: RoomBase,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+):
+    room = await db.get(Room, room_id, with_for_update=if_match_requested(request))
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
+    check_if_match(request, entity_etag(room.version))
     for field, value in room_data.dict().items():
         setattr(room, field, value)
-    db.commit()
-    db.refresh(room)
+    await db.commit()
+    room_cache.invalidate(room_id)
+    response.headers["ETag"] = entity_etag(room.version)
     return room
 
 @router.delete("/{room_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_room(room_id: UUID, db: Session = Depends(get_db)):
-    room = db.query(Room).filter(Room.id == room_id).first()
+async def delete_room(room_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    room = await db.get(Room, room_id)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
-    db.delete(room)
-    db.commit()
+    await db.delete(room)  # cascade="all, delete-orphan" удалит устройства комнаты
+    device_ids = await enqueue_device_deletions(db)
+    await db.commit()
+    room_cache.invalidate(room_id)
+    for device_id in device_ids:
+        caches["device"].invalidate(device_id)
     return
@@ -1,41 +1,168 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
-from typing import List
+from datetime import datetime
+from typing import List, Literal, Optional
 
-from models import SensorData
-from database import get_db
-from schemas import SensorDataBase, SensorDataResponse
+from models import RollupInvalidation, SensorData
+from aggregates import aggregate_sensor_data, bucket_count
+from database import get_async_db
+from metrics import TimedRoute
+from ingest import as_naive_utc, parse_batch_body, validate_readings, write_readings
+from live import LIVE_DEFAULT_POLICY, resolve_live_devices, serve_websocket, sse_events
+from pagination import JSON_FAST_PATH, PageParams, paginate, paginate_json, stream_ndjson
+from rules import evaluate_readings
+from schemas import (
+    SensorDataAggregateResponse,
+    SensorDataBase,
+    SensorDataBatchResult,
+    SensorDataResponse,
+)
 
 router = APIRouter(
     prefix="/sensor-data",
-    tags=["SensorData"]
+    tags=["SensorData"],
+    route_class=TimedRoute,
 )
 
+MAX_BATCH_SIZE = 10_000
+MAX_AGGREGATE_BUCKETS = 10_000
+
 @router.get("/", response_model=List[SensorDataResponse])
-def list_sensor_data(db: Session = Depends(get_db)):
-    return db.query(SensorData).all()
+async def list_sensor_data(
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+):
+    if page.stream:
+        return stream_ndjson(select(SensorData), [SensorData.id], SensorDataResponse, page)
+    if JSON_FAST_PATH == "on":
+        return await paginate_json(db, select(SensorData), [SensorData.id], SensorDataResponse, page)
+    return await paginate(db, select(SensorData), [SensorData.id], page, response)
+
+@router.post(
+    "/batch",
+    response_model=SensorDataBatchResult,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"type": "array", "items": {"$ref": "#/components/schemas/SensorDataBase"}}
+                },
+                "application/x-ndjson": {"schema": {"type": "string"}},
+            },
+        }
+    },
+)
+async def create_sensor_data_batch(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Пакетная запись показаний: JSON-массив или NDJSON, одна транзакция, COPY."""
+    try:
+        items, rejects = parse_batch_body(
+            await request.body(), request.headers.get("content-type", "application/json")
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch is limited to {MAX_BATCH_SIZE} readings",
+        )
+
+    rows, invalid = validate_readings(items)
+    rejects.extend(invalid)
+    accepted = await write_readings(db, rows, rejects)
+    await db.commit()
+    rejects.sort(key=lambda r: r.index)
+    return SensorDataBatchResult(accepted=accepted, rejected=rejects)
+
+@router.get("/aggregate", response_model=SensorDataAggregateResponse)
+async def aggregate_sensor_data_endpoint(
+    device_id: List[UUID] = Query(...),
+    type: str = Query(...),
+    start: datetime = Query(...),
+    end: datetime = Query(...),
+    bucket: Literal["1m", "5m", "1h", "1d"] = Query("1h"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Агрегаты по бакетам времени для графиков, без выгрузки сырых показаний."""
+    start, end = as_naive_utc(start), as_naive_utc(end)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if bucket_count(start, end, bucket) > MAX_AGGREGATE_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range is too wide for bucket {bucket}: max {MAX_AGGREGATE_BUCKETS} buckets",
+        )
+    return await aggregate_sensor_data(db, device_id, type, start, end, bucket)
+
+@router.get("/live", response_class=StreamingResponse)
+async def live_sensor_data(
+    home_id: Optional[UUID] = Query(None),
+    room_id: Optional[UUID] = Query(None),
+    device_id: List[UUID] = Query([]),
+    policy: Literal["drop_oldest", "coalesce"] = Query(LIVE_DEFAULT_POLICY),
+):
+    """Живые показания устройств дома, комнаты или списка через Server-Sent Events."""
+    devices = await resolve_live_devices(home_id, room_id, device_id)
+    return StreamingResponse(
+        sse_events(devices, policy),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.websocket("/live/ws")
+async def live_sensor_data_ws(
+    websocket: WebSocket,
+    home_id: Optional[UUID] = Query(None),
+    room_id: Optional[UUID] = Query(None),
+    device_id: List[UUID] = Query([]),
+    policy: Literal["drop_oldest", "coalesce"] = Query(LIVE_DEFAULT_POLICY),
+):
+    """То же по WebSocket: кадр — JSON-массив накопившихся показаний."""
+    try:
+        devices = await resolve_live_devices(home_id, room_id, device_id)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=str(e.detail))
+        return
+    await websocket.accept()
+    await serve_websocket(websocket, devices, policy)
 
 @router.get("/{data_id}", response_model=SensorDataResponse)
-def get_sensor_data(data_id: UUID, db: Session = Depends(get_db)):
-    data = db.query(SensorData).filter(SensorData.id == data_id).first()
+async def get_sensor_data(data_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    data = await db.get(SensorData, data_id)
     if not data:
         raise HTTPException(status_code=404, detail="Sensor data not found")
     return data
 
 @router.post("/", response_model=SensorDataResponse, status_code=status.HTTP_201_CREATED)
-def create_sensor_data(data: SensorDataBase, db: Session = Depends(get_db)):
+async def create_sensor_data(data: SensorDataBase, db: AsyncSession = Depends(get_async_db)):
     new_data = SensorData(**data.dict())
     db.add(new_data)
-    db.commit()
-    db.refresh(new_data)
+    evaluate_readings(
+        db,
+        [
+            {
+                "device_id": new_data.device_id,
+                "timestamp": new_data.timestamp,
+                "type": new_data.type,
+                "numeric_value": new_data.numeric_value,
+            }
+        ],
+    )
+    await db.commit()
     return new_data
 
 @router.delete("/{data_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_sensor_data(data_id: UUID, db: Session = Depends(get_db)):
-    data = db.query(SensorData).filter(SensorData.id == data_id).first()
+async def delete_sensor_data(data_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    data = await db.get(SensorData, data_id)
     if not data:
         raise HTTPException(status_code=404, detail="Sensor data not found")
-    db.delete(data)
-    db.commit()
+    if data.device_id and data.type and data.timestamp:
+        # бакет роллапа с этим показанием пересчитается при следующем refresh
+        db.add(RollupInvalidation(device_id=data.device_id, type=data.type, timestamp=data.timestamp))
+    await db.delete(data)
+    await db.commit()
     return
@@ -1,56 +1,132 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
-from typing import List
+from typing import List, Optional
 
-from models import User
-from database import get_db
+from models import Home, Room, User
+from database import get_async_db
+from metrics import TimedRoute
+from pagination import PageParams, export_snapshot, page_selection, paginate, stream_ndjson
+from cache import caches
+from routers.devices import enqueue_device_deletions
+from etag import (
+    Tagged,
+    check_if_match,
+    collection_etag,
+    entity_etag,
+    if_match_requested,
+    none_match,
+    not_modified,
+    tagged,
+)
 from schemas import UserCreate, UserResponse
 
 router = APIRouter(
     prefix="/users",
-    tags=["Users"]
+    tags=["Users"],
+    route_class=TimedRoute,
 )
 
+user_cache = caches["user"]
+
+
+async def _commit_user(db: AsyncSession) -> None:
+    """Уникальность email держит индекс: проверка до записи не спасает от гонки."""
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Email already registered") from e
+
 @router.get("/", response_model=List[UserResponse])
-def list_users(db: Session = Depends(get_db)):
-    return db.query(User).all()
+async def list_users(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+):
+    selection = page_selection(select(User), [User.id], page)
+    etag = await collection_etag(db, selection, request)
+    if none_match(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    if page.stream:
+        return stream_ndjson(
+            select(User),
+            [User.id],
+            UserResponse,
+            page,
+            headers={"ETag": etag},
+            snapshot=await export_snapshot(db),
+        )
+    return await paginate(db, select(User), [User.id], page, response)
 
 @router.get("/{user_id}", response_model=UserResponse)
-def get_user(user_id: UUID, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+async def get_user(
+    user_id: UUID,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+):
+    async def _load() -> Optional[Tagged]:
+        user = await db.get(User, user_id)
+        return tagged(UserResponse, user) if user else None
+
+    user = await user_cache.get_or_load(user_id, _load)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    if none_match(request, user.etag):
+        return not_modified(user.etag)
+    response.headers["ETag"] = user.etag
+    return user.body
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+async def register_user(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    existing_user = await db.scalar(select(User).where(User.email == user_data.email))
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
     user = User(**user_data.dict())
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await _commit_user(db)
     return user
 
 @router.put("/{user_id}", response_model=UserResponse)
-def update_user(user_id: UUID, user_data: UserCreate, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+async def update_user(
+    user_id: UUID,
+    user_data: UserCreate,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+):
+    user = await db.get(User, user_id, with_for_update=if_match_requested(request))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    check_if_match(request, entity_etag(user.version))
     for field, value in user_data.dict().items():
         setattr(user, field, value)
-    db.commit()
-    db.refresh(user)
+    await _commit_user(db)
+    user_cache.invalidate(user_id)
+    response.headers["ETag"] = entity_etag(user.version)
     return user
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(user_id: UUID, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+async def delete_user(user_id: UUID, db: AsyncSession = Depends(get_async_db)):
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    db.delete(user)
-    db.commit()
+    await db.delete(user)  # cascade="all, delete-orphan" удалит дома с комнатами и все устройства
+    home_ids = [obj.id for obj in db.deleted if isinstance(obj, Home)]
+    room_ids = [obj.id for obj in db.deleted if isinstance(obj, Room)]
+    device_ids = await enqueue_device_deletions(db)
+    await db.commit()
+    user_cache.invalidate(user_id)
+    for home_id in home_ids:
+        caches["home"].invalidate(home_id)
+    for room_id in room_ids:
+        caches["room"].invalidate(room_id)
+    for device_id in device_ids:
+        caches["device"].invalidate(device_id)
     return
@@ -0,0 +1,383 @@
+"""In-process движок правил автоматизации с триггером SENSOR.
+
+``trigger_condition`` правила компилируется один раз в предикат::
+
+    temperature > 25
+    3fa85f64-5717-4562-b3fc-2c963f66afa6.humidity <= 40.5
+
+Без префикса устройства правило срабатывает на показания любого устройства.
+Скомпилированные правила индексируются по (устройство, тип показания), а
+внутри — по порогу, поэтому показание проверяет только те правила, которые
+им удовлетворяются. Действие выдаётся по фронту: пока условие держится,
+повторно TURN_ON/TURN_OFF не шлём. Новое состояние фронтов копится в
+``session.info`` и попадает в движок только после commit транзакции, в
+которой легли действия: откат (повтор пачки consumer'ом, ошибка FK) не
+глушит действие при повторной записи тех же показаний.
+
+Правки сценариев из других воркеров и реплик приходят в движок через
+LISTEN/NOTIFY (scenario_sync.py) — по одному сценарию, без полной перезагрузки.
+"""
+import bisect
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, SessionTransaction
+
+from models import AutomationRule, AutomationScenario, TriggerType
+from outbox import enqueue_event
+
+__all__ = [
+    "AUTOMATION_ACTION_TOPIC",
+    "ConditionError",
+    "RuleEngine",
+    "compile_condition",
+    "evaluate_readings",
+    "load_rule_engine",
+    "rule_engine",
+]
+
+logger = logging.getLogger("rules")
+
+AUTOMATION_ACTION_TOPIC = os.getenv("AUTOMATION_ACTION_TOPIC", "automationAction")
+
+_CONDITION_RE = re.compile(
+    r"^\s*(?:(?P<device>[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})\s*\.\s*)?"
+    r"(?P<type>[A-Za-z_][\w-]*)\s*"
+    r"(?P<op>>=|<=|==|!=|>|<|=)\s*"
+    r"(?P<threshold>[-+]?(?:\d+(?:\.\d*)?|\.\d+))\s*$"
+)
+
+class ConditionError(ValueError):
+    """trigger_condition не разбирается."""
+
+
+class Condition(NamedTuple):
+    device_id: Optional[UUID]
+    reading_type: str
+    op: str
+    threshold: float
+
+
+class CompiledRule(NamedTuple):
+    rule_id: UUID
+    scenario_id: UUID
+    condition: Condition
+    action_type: str
+    action_target: Optional[UUID]
+
+
+class RuleAction(NamedTuple):
+    rule_id: UUID
+    scenario_id: UUID
+    action_type: str
+    action_target: Optional[UUID]
+
+
+def compile_condition(text: str) -> Condition:
+    match = _CONDITION_RE.match(text or "")
+    if not match:
+        raise ConditionError(
+            f"Invalid trigger_condition {text!r}: expected '[<device_id>.]<type> <op> <number>'"
+        )
+    op = "==" if match["op"] == "=" else match["op"]
+    return Condition(
+        device_id=UUID(match["device"]) if match["device"] else None,
+        reading_type=match["type"].lower(),
+        op=op,
+        threshold=float(match["threshold"]),
+    )
+
+
+# ---------------------------------------------------------------------------
+# index
+
+class _SortedThresholds:
+    """Пороги по возрастанию + id правил в том же порядке."""
+
+    def __init__(self):
+        self.thresholds: List[float] = []
+        self.rule_ids: List[UUID] = []
+
+    def add(self, threshold: float, rule_id: UUID) -> None:
+        i = bisect.bisect_right(self.thresholds, threshold)
+        self.thresholds.insert(i, threshold)
+        self.rule_ids.insert(i, rule_id)
+
+    def remove(self, threshold: float, rule_id: UUID) -> None:
+        i = bisect.bisect_left(self.thresholds, threshold)
+        while i < len(self.thresholds) and self.thresholds[i] == threshold:
+            if self.rule_ids[i] == rule_id:
+                del self.thresholds[i]
+                del self.rule_ids[i]
+                return
+            i += 1
+
+    def below(self, value: float, inclusive: bool) -> List[UUID]:
+        """Правила с порогом < value (<= при inclusive)."""
+        bound = bisect.bisect_right if inclusive else bisect.bisect_left
+        return self.rule_ids[: bound(self.thresholds, value)]
+
+    def above(self, value: float, inclusive: bool) -> List[UUID]:
+        """Правила с порогом > value (>= при inclusive)."""
+        bound = bisect.bisect_left if inclusive else bisect.bisect_right
+        return self.rule_ids[bound(self.thresholds, value):]
+
+    def __len__(self) -> int:
+        return len(self.thresholds)
+
+
+class _Bucket:
+    """Все правила одного (устройство, тип показания), разложенные по операторам."""
+
+    def __init__(self):
+        self.by_op: Dict[str, _SortedThresholds] = {
+            op: _SortedThresholds() for op in (">", ">=", "<", "<=")
+        }
+        self.eq: Dict[float, Set[UUID]] = {}
+        self.ne: Dict[UUID, float] = {}
+
+    def add(self, rule: CompiledRule) -> None:
+        c = rule.condition
+        if c.op in self.by_op:
+            self.by_op[c.op].add(c.threshold, rule.rule_id)
+        elif c.op == "==":
+            self.eq.setdefault(c.threshold, set()).add(rule.rule_id)
+        else:
+            self.ne[rule.rule_id] = c.threshold
+
+    def remove(self, rule: CompiledRule) -> None:
+        c = rule.condition
+        if c.op in self.by_op:
+            self.by_op[c.op].remove(c.threshold, rule.rule_id)
+        elif c.op == "==":
+            ids = self.eq.get(c.threshold)
+            if ids:
+                ids.discard(rule.rule_id)
+                if not ids:
+                    del self.eq[c.threshold]
+        else:
+            self.ne.pop(rule.rule_id, None)
+
+    def matching(self, value: float) -> List[UUID]:
+        # value > threshold  <=>  threshold < value и т.д.
+        matched = self.by_op[">"].below(value, inclusive=False)
+        matched += self.by_op[">="].below(value, inclusive=True)
+        matched += self.by_op["<"].above(value, inclusive=False)
+        matched += self.by_op["<="].above(value, inclusive=True)
+        matched.extend(self.eq.get(value, ()))
+        if self.ne:
+            # "!=" срабатывает почти всегда — перебор этих правил неизбежен
+            matched.extend(rule_id for rule_id, t in self.ne.items() if t != value)
+        return matched
+
+    def __len__(self) -> int:
+        return sum(map(len, self.by_op.values())) + sum(map(len, self.eq.values())) + len(self.ne)
+
+
+class RuleEngine:
+    def __init__(self):
+        self._rules: Dict[UUID, CompiledRule] = {}
+        self._by_scenario: Dict[UUID, Set[UUID]] = {}
+        self._index: Dict[Tuple[Optional[UUID], str], _Bucket] = {}
+        # (устройство-источник, тип) -> правила, чьё условие держится сейчас
+        self._active: Dict[Tuple[UUID, str], Set[UUID]] = {}
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    # --- incremental updates ------------------------------------------------
+
+    def add_rule(self, rule: CompiledRule) -> None:
+        if rule.rule_id in self._rules:
+            self.remove_rule(rule.rule_id)
+        self._rules[rule.rule_id] = rule
+        self._by_scenario.setdefault(rule.scenario_id, set()).add(rule.rule_id)
+        key = (rule.condition.device_id, rule.condition.reading_type)
+        self._index.setdefault(key, _Bucket()).add(rule)
+
+    def remove_rule(self, rule_id: UUID) -> None:
+        rule = self._rules.pop(rule_id, None)
+        if rule is None:
+            return
+        scenario_rules = self._by_scenario.get(rule.scenario_id)
+        if scenario_rules is not None:
+            scenario_rules.discard(rule_id)
+            if not scenario_rules:
+                del self._by_scenario[rule.scenario_id]
+        key = (rule.condition.device_id, rule.condition.reading_type)
+        bucket = self._index.get(key)
+        if bucket is not None:
+            bucket.remove(rule)
+            if not len(bucket):
+                del self._index[key]
+
+    def remove_scenario(self, scenario_id: UUID) -> None:
+        for rule_id in list(self._by_scenario.get(scenario_id, ())):
+            self.remove_rule(rule_id)
+
+    def load_scenario(self, scenario: AutomationScenario, rules: Iterable[AutomationRule]) -> None:
+        """Заменить правила сценария; выключенный сценарий просто убирается из индекса."""
+        self.remove_scenario(scenario.id)
+        if not scenario.enabled:
+            return
+        for rule in rules:
+            compiled = compile_rule(rule)
+            if compiled is not None:
+                self.add_rule(compiled)
+
+    def clear(self) -> None:
+        # _active не трогаем: после перезагрузки правил не хотим повторно стрелять
+        # по условиям, которые уже держатся
+        self._rules.clear()
+        self._by_scenario.clear()
+        self._index.clear()
+
+    # --- evaluation -----------------------------------------------------------
+
+    def matching_rules(self, device_id: UUID, reading_type: str, value: float) -> Set[UUID]:
+        reading_type = reading_type.lower()
+        matched: Set[UUID] = set()
+        for key in ((device_id, reading_type), (None, reading_type)):
+            bucket = self._index.get(key)
+            if bucket is not None:
+                matched.update(bucket.matching(value))
+        return matched
+
+    def evaluate(
+        self,
+        device_id: UUID,
+        reading_type: str,
+        value: float,
+        pending: Optional[Dict[Tuple[UUID, str], Set[UUID]]] = None,
+    ) -> List[RuleAction]:
+        """Действия правил, чьё условие стало истинным на этом показании.
+
+        С pending новое состояние фронта пишется туда (поверх уже накопленного
+        в той же транзакции), а в движок его переносит apply_edges.
+        """
+        matched = self.matching_rules(device_id, reading_type, value)
+        state_key = (device_id, reading_type.lower())
+        if pending is None:
+            previously = self._active.get(state_key, set())
+            self.apply_edges({state_key: matched})
+        else:
+            previously = pending.get(state_key, self._active.get(state_key, set()))
+            pending[state_key] = matched
+
+        actions = []
+        for rule_id in matched - previously:
+            rule = self._rules[rule_id]
+            actions.append(
+                RuleAction(rule.rule_id, rule.scenario_id, rule.action_type, rule.action_target)
+            )
+        return actions
+
+    def apply_edges(self, pending: Dict[Tuple[UUID, str], Set[UUID]]) -> None:
+        for state_key, matched in pending.items():
+            if matched:
+                self._active[state_key] = matched
+            else:
+                self._active.pop(state_key, None)
+
+
+def compile_rule(rule: AutomationRule) -> Optional[CompiledRule]:
+    trigger_type = getattr(rule.trigger_type, "value", rule.trigger_type)
+    if trigger_type != TriggerType.SENSOR.value:
+        return None
+    try:
+        condition = compile_condition(rule.trigger_condition)
+    except ConditionError as e:
+        logger.warning("Rule %s skipped: %s", rule.id, e)
+        return None
+    return CompiledRule(
+        rule_id=rule.id,
+        scenario_id=rule.scenario_id,
+        condition=condition,
+        action_type=getattr(rule.action_type, "value", rule.action_type),
+        action_target=rule.action_target,
+    )
+
+
+# общий движок процесса
+rule_engine = RuleEngine()
+
+
+async def load_rule_engine(db: AsyncSession, engine: RuleEngine = rule_engine) -> int:
+    """Полная загрузка включённых SENSOR-правил из БД."""
+    rules = await db.scalars(
+        select(AutomationRule)
+        .join(AutomationScenario, AutomationRule.scenario_id == AutomationScenario.id)
+        .where(
+            AutomationScenario.enabled.is_(True),
+            AutomationRule.trigger_type == TriggerType.SENSOR,
+        )
+        .execution_options(allow_unindexed=True)  # полная загрузка при старте
+    )
+    engine.clear()
+    for rule in rules:
+        compiled = compile_rule(rule)
+        if compiled is not None:
+            engine.add_rule(compiled)
+    return len(engine)
+
+
+# ---------------------------------------------------------------------------
+# фронты применяются только после commit
+
+_PENDING_EDGES = "rule_edges"
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_edges(session: Session) -> None:
+    for engine, pending in session.info.pop(_PENDING_EDGES, {}).items():
+        engine.apply_edges(pending)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_pending_edges(session: Session, transaction: SessionTransaction) -> None:
+    # после commit здесь уже пусто; остаток — от откаченной транзакции
+    if transaction.parent is None:
+        session.info.pop(_PENDING_EDGES, None)
+
+
+def evaluate_readings(db: AsyncSession, rows: Iterable[dict], engine: RuleEngine = rule_engine) -> int:
+    """Прогнать принятые показания через движок и поставить действия в outbox.
+
+    Вызывается в транзакции записи показаний, поэтому действия уходят
+    в Kafka только вместе с закоммиченными данными, а фронты запоминаются
+    только после того же commit.
+    """
+    pending = db.info.setdefault(_PENDING_EDGES, {}).setdefault(engine, {})
+    emitted = 0
+    for row in rows:
+        value = row.get("numeric_value")
+        if value is None or row.get("device_id") is None or not row.get("type"):
+            continue
+        for action in engine.evaluate(row["device_id"], row["type"], value, pending):
+            enqueue_event(
+                db,
+                topic=AUTOMATION_ACTION_TOPIC,
+                key=str(action.action_target),
+                value={
+                    "rule_id": str(action.rule_id),
+                    "scenario_id": str(action.scenario_id),
+                    "action_type": action.action_type,
+                    "action_target": str(action.action_target),
+                    "trigger_device_id": str(row["device_id"]),
+                    "reading_type": row["type"],
+                    "value": value,
+                    "timestamp": _isoformat(row.get("timestamp")),
+                },
+            )
+            emitted += 1
+    return emitted
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
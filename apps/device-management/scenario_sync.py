@@ -0,0 +1,152 @@
+"""Доставка правок сценариев в in-process индексы правил: движок SENSOR и планировщик TIME.
+
+Триггеры миграции 0006 шлют ``NOTIFY scenario_changed`` с id сценария на
+правку его правил, включение/выключение и удаление; уведомление приходит
+после commit из любого воркера и реплики, в том числе из собственного
+процесса. ScenarioSync держит отдельное соединение с LISTEN и перечитывает
+только затронутые сценарии — через ``load_scenario``/``remove_scenario``
+индекса, как это делает и роутер сценариев после своего commit.
+
+Полная загрузка — только при старте и после потери LISTEN-соединения:
+пока его не было, уведомления могли пройти мимо.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, List, Optional, Sequence, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+from sqlalchemy.orm import selectinload
+
+from database import AsyncSessionLocal, async_engine
+from models import AutomationScenario
+
+__all__ = [
+    "SCENARIO_CHANNEL",
+    "ScenarioSync",
+]
+
+logger = logging.getLogger("scenario_sync")
+
+SCENARIO_CHANNEL = "scenario_changed"
+SCENARIO_SYNC_BATCH_SIZE = int(os.getenv("SCENARIO_SYNC_BATCH_SIZE", "500"))
+SCENARIO_SYNC_RETRY_BACKOFF_S = float(os.getenv("SCENARIO_SYNC_RETRY_BACKOFF_S", "5"))
+# как часто без уведомлений проверяем, что LISTEN-соединение живо
+SCENARIO_SYNC_PING_S = float(os.getenv("SCENARIO_SYNC_PING_S", "30"))
+
+# индекс (rule_engine, rule_scheduler) и его полная загрузка из БД
+FullLoader = Callable[[AsyncSession, Any], Awaitable[int]]
+
+
+class ScenarioSync:
+    def __init__(self, indexes: Sequence[Tuple[Any, FullLoader]]):
+        self._indexes = list(indexes)
+        self._pending: Set[UUID] = set()
+        self._wakeup = asyncio.Event()
+        self._conn: Optional[AsyncConnection] = None
+        self._listener = None  # asyncpg-соединение под self._conn
+        self._lost = False
+
+    # --- LISTEN-соединение --------------------------------------------------
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        try:
+            self._pending.add(UUID(payload))
+        except ValueError:
+            logger.warning("Bad %s payload: %r", channel, payload)
+            return
+        self._wakeup.set()
+
+    def _on_terminate(self, connection) -> None:
+        self._lost = True
+        self._wakeup.set()
+
+    async def start(self) -> None:
+        """LISTEN, затем полная загрузка: правка между ними придёт уведомлением."""
+        self._conn = await async_engine.connect()
+        raw = await self._conn.get_raw_connection()
+        self._listener = raw.driver_connection
+        self._lost = False
+        self._listener.add_termination_listener(self._on_terminate)
+        await self._listener.add_listener(SCENARIO_CHANNEL, self._on_notify)
+        self._pending.clear()
+        async with AsyncSessionLocal() as db:
+            for index, load in self._indexes:
+                count = await load(db, index)
+                logger.info("Loaded %d rules into %s", count, type(index).__name__)
+
+    async def close(self) -> None:
+        if self._conn is None:
+            return
+        conn, listener = self._conn, self._listener
+        self._conn = self._listener = None
+        try:
+            if self._lost or listener.is_closed():
+                await conn.invalidate()
+            else:
+                # соединение вернётся в пул — без подписки
+                await listener.remove_listener(SCENARIO_CHANNEL, self._on_notify)
+                listener.remove_termination_listener(self._on_terminate)
+            await conn.close()
+        except Exception:
+            logger.warning("Failed to close LISTEN connection", exc_info=True)
+
+    async def _wait(self) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), SCENARIO_SYNC_PING_S)
+        except asyncio.TimeoutError:
+            # полуоткрытое TCP-соединение termination listener не заметит
+            await asyncio.wait_for(self._listener.fetchval("SELECT 1"), SCENARIO_SYNC_PING_S)
+        self._wakeup.clear()
+        if self._lost:
+            raise ConnectionError("LISTEN connection lost")
+
+    # --- применение правок ----------------------------------------------------
+
+    async def apply_pending(self) -> int:
+        """Перечитать сценарии из накопленных уведомлений; удалённые убираются из индексов."""
+        ids: List[UUID] = list(self._pending)
+        self._pending.clear()
+        try:
+            async with AsyncSessionLocal() as db:
+                for start in range(0, len(ids), SCENARIO_SYNC_BATCH_SIZE):
+                    chunk = ids[start:start + SCENARIO_SYNC_BATCH_SIZE]
+                    scenarios = {
+                        scenario.id: scenario
+                        for scenario in await db.scalars(
+                            select(AutomationScenario)
+                            .options(selectinload(AutomationScenario.rules))
+                            .where(AutomationScenario.id.in_(chunk))
+                        )
+                    }
+                    for scenario_id in chunk:
+                        scenario = scenarios.get(scenario_id)
+                        for index, _ in self._indexes:
+                            if scenario is None:
+                                index.remove_scenario(scenario_id)
+                            else:
+                                index.load_scenario(scenario, scenario.rules)
+        except BaseException:
+            # не потерять правки: перечитаем на следующем круге
+            self._pending.update(ids)
+            raise
+        return len(ids)
+
+    async def run(self) -> None:
+        """Фоновый цикл; без start() сначала подключается и делает полную загрузку."""
+        while True:
+            try:
+                if self._conn is None:
+                    await self.start()
+                await self._wait()
+                if self._pending:
+                    await self.apply_pending()
+            except asyncio.CancelledError:
+                await self.close()
+                raise
+            except Exception:
+                logger.exception("Scenario sync failed")
+                await self.close()
+                await asyncio.sleep(SCENARIO_SYNC_RETRY_BACKOFF_S)
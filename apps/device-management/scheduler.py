@@ -0,0 +1,378 @@
+"""Планировщик правил автоматизации с триггером TIME.
+
+Поддерживаемые ``trigger_condition``::
+
+    every 30s | every 5m | every 2h | every 1d   (выравнивание от 2000-01-01 UTC)
+    at 07:30                                     (ежедневно, UTC)
+
+Время следующего срабатывания каждого правила лежит в куче; изменения
+сценариев не перестраивают кучу, а добавляют новую запись с новой версией,
+старая отбрасывается при извлечении. Срабатывание пишет событие в outbox и
+``automation_rules.last_fired_at`` одной транзакцией — после рестарта или
+при нескольких репликах правило не стреляет дважды за один слот.
+
+Куча своя у каждого процесса: правки правил в других воркерах и репликах
+приходят по LISTEN/NOTIFY (scenario_sync.py) и перестраивают только свой
+сценарий; пока уведомление в пути, диспетчер сверяет каждое наступившее
+срабатывание с текущим правилом в БД.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import re
+from datetime import datetime, time, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from uuid import UUID
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models import AutomationRule, AutomationScenario, TriggerType
+from outbox import enqueue_event
+from rules import AUTOMATION_ACTION_TOPIC
+
+__all__ = [
+    "ScheduleError",
+    "load_scheduler",
+    "parse_schedule",
+    "dispatch_due",
+    "run_rule_scheduler",
+    "rule_scheduler",
+    "scheduler_stats",
+]
+
+logger = logging.getLogger("scheduler")
+
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", "1000"))
+SCHEDULER_MAX_SLEEP_S = float(os.getenv("SCHEDULER_MAX_SLEEP_S", "1"))
+SCHEDULER_RETRY_BACKOFF_S = float(os.getenv("SCHEDULER_RETRY_BACKOFF_S", "2"))
+# слот, пропущенный во время простоя, догоняем один раз, если опоздали не больше чем на grace
+SCHEDULER_MISFIRE_GRACE_S = float(os.getenv("SCHEDULER_MISFIRE_GRACE_S", "300"))
+
+# один диспетчер за раз; от двойного срабатывания страхует last_fired_at
+_LOCK_KEY = 0x5C4ED0
+
+_EVERY_RE = re.compile(r"^\s*every\s+(\d+)\s*([smhd])\s*$", re.IGNORECASE)
+_AT_RE = re.compile(r"^\s*at\s+([01]?\d|2[0-3]):([0-5]\d)\s*$", re.IGNORECASE)
+_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+_ORIGIN = datetime(2000, 1, 1)
+
+
+class ScheduleError(ValueError):
+    """trigger_condition TIME-правила не разбирается."""
+
+
+class Schedule(NamedTuple):
+    interval: Optional[timedelta]
+    at: Optional[time]
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Ближайший слот строго после moment."""
+        if self.interval is not None:
+            return _ORIGIN + ((moment - _ORIGIN) // self.interval + 1) * self.interval
+        candidate = datetime.combine(moment.date(), self.at)
+        return candidate if candidate > moment else candidate + timedelta(days=1)
+
+
+def parse_schedule(text_: str) -> Schedule:
+    match = _EVERY_RE.match(text_ or "")
+    if match:
+        interval = timedelta(**{_UNITS[match[2].lower()]: int(match[1])})
+        if not interval:
+            raise ScheduleError(f"Invalid trigger_condition {text_!r}: interval must be positive")
+        return Schedule(interval=interval, at=None)
+    match = _AT_RE.match(text_ or "")
+    if match:
+        return Schedule(interval=None, at=time(int(match[1]), int(match[2])))
+    raise ScheduleError(
+        f"Invalid trigger_condition {text_!r}: expected 'every <N>s|m|h|d' or 'at HH:MM'"
+    )
+
+
+class _Entry(NamedTuple):
+    version: int
+    rule_id: UUID
+    scenario_id: UUID
+    schedule: Schedule
+    fire_at: datetime
+
+
+class SchedulerStats:
+    def __init__(self):
+        self.fired = 0
+        self.skipped = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    def record_fire(self, lag: timedelta) -> None:
+        self.fired += 1
+        self.last_lag_ms = lag.total_seconds() * 1000
+        self.max_lag_ms = max(self.max_lag_ms, self.last_lag_ms)
+
+
+class RuleScheduler:
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int, UUID]] = []
+        self._entries: Dict[UUID, _Entry] = {}
+        self._by_scenario: Dict[UUID, Set[UUID]] = {}
+        self._versions = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self.stats = SchedulerStats()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # --- incremental updates ------------------------------------------------
+
+    def schedule(self, rule_id: UUID, scenario_id: UUID, schedule: Schedule, fire_at: datetime) -> None:
+        entry = _Entry(next(self._versions), rule_id, scenario_id, schedule, fire_at)
+        self._entries[rule_id] = entry
+        self._by_scenario.setdefault(scenario_id, set()).add(rule_id)
+        wake = not self._heap or fire_at < self._heap[0][0]
+        heapq.heappush(self._heap, (fire_at, entry.version, rule_id))
+        self._compact()
+        if wake and self._wakeup is not None:
+            self._wakeup.set()
+
+    def unschedule(self, rule_id: UUID) -> None:
+        # запись в куче остаётся и будет выброшена при извлечении
+        entry = self._entries.pop(rule_id, None)
+        if entry is None:
+            return
+        scenario_rules = self._by_scenario.get(entry.scenario_id)
+        if scenario_rules is not None:
+            scenario_rules.discard(rule_id)
+            if not scenario_rules:
+                del self._by_scenario[entry.scenario_id]
+
+    def remove_scenario(self, scenario_id: UUID) -> None:
+        for rule_id in list(self._by_scenario.get(scenario_id, ())):
+            self.unschedule(rule_id)
+
+    def load_scenario(
+        self,
+        scenario: AutomationScenario,
+        rules: Iterable[AutomationRule],
+        now: Optional[datetime] = None,
+    ) -> None:
+        """Заменить расписания сценария; выключенный сценарий просто снимается."""
+        self.remove_scenario(scenario.id)
+        if not scenario.enabled:
+            return
+        now = now or datetime.utcnow()
+        for rule in rules:
+            self.add_rule(rule, now)
+
+    def clear(self) -> None:
+        self._heap.clear()
+        self._entries.clear()
+        self._by_scenario.clear()
+
+    def add_rule(self, rule: AutomationRule, now: datetime) -> None:
+        if getattr(rule.trigger_type, "value", rule.trigger_type) != TriggerType.TIME.value:
+            return
+        try:
+            schedule = parse_schedule(rule.trigger_condition)
+        except ScheduleError as e:
+            logger.warning("Rule %s skipped: %s", rule.id, e)
+            return
+        self.schedule(rule.id, rule.scenario_id, schedule, _initial_fire_at(schedule, rule.last_fired_at, now))
+
+    def _compact(self) -> None:
+        # при частых изменениях сценариев мёртвые записи не должны копиться бесконечно
+        if len(self._heap) > 2 * len(self._entries) + 1024:
+            self._heap = [item for item in self._heap if self._is_live(item)]
+            heapq.heapify(self._heap)
+
+    def _is_live(self, item: Tuple[datetime, int, UUID]) -> bool:
+        entry = self._entries.get(item[2])
+        return entry is not None and entry.version == item[1]
+
+    # --- dispatch -------------------------------------------------------------
+
+    def next_fire_at(self) -> Optional[datetime]:
+        while self._heap and not self._is_live(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime, limit: int) -> List[_Entry]:
+        due: List[_Entry] = []
+        while len(due) < limit:
+            next_at = self.next_fire_at()
+            if next_at is None or next_at > now:
+                break
+            _, _, rule_id = heapq.heappop(self._heap)
+            due.append(self._entries[rule_id])
+        return due
+
+    def reschedule(self, entry: _Entry, fire_at: datetime, schedule: Optional[Schedule] = None) -> None:
+        """Вернуть правило в кучу, если его не успели изменить за время диспетчеризации."""
+        current = self._entries.get(entry.rule_id)
+        if current is not None and current.version == entry.version:
+            self.schedule(entry.rule_id, entry.scenario_id, schedule or entry.schedule, fire_at)
+
+    async def wait(self, max_sleep: float) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        next_at = self.next_fire_at()
+        timeout = max_sleep
+        if next_at is not None:
+            timeout = min(max_sleep, max((next_at - datetime.utcnow()).total_seconds(), 0))
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+
+def _current_schedule(rule: AutomationRule) -> Optional[Schedule]:
+    """Расписание правила, каким оно сейчас лежит в БД; None, если это уже не TIME-правило."""
+    if getattr(rule.trigger_type, "value", rule.trigger_type) != TriggerType.TIME.value:
+        return None
+    try:
+        return parse_schedule(rule.trigger_condition)
+    except ScheduleError:
+        return None
+
+
+def _initial_fire_at(schedule: Schedule, last_fired_at: Optional[datetime], now: datetime) -> datetime:
+    if last_fired_at is None:
+        return schedule.next_after(now)
+    missed = schedule.next_after(last_fired_at)
+    if missed > now or (now - missed).total_seconds() <= SCHEDULER_MISFIRE_GRACE_S:
+        return missed
+    return schedule.next_after(now)
+
+
+# общий планировщик процесса
+rule_scheduler = RuleScheduler()
+
+
+def scheduler_stats() -> dict:
+    next_at = rule_scheduler.next_fire_at()
+    stats = rule_scheduler.stats
+    return {
+        "scheduled": len(rule_scheduler),
+        "fired": stats.fired,
+        "skipped": stats.skipped,
+        "last_lag_ms": round(stats.last_lag_ms, 2),
+        "max_lag_ms": round(stats.max_lag_ms, 2),
+        "next_fire_at": next_at.isoformat() if next_at else None,
+    }
+
+
+async def load_scheduler(db: AsyncSession, scheduler: RuleScheduler = rule_scheduler) -> int:
+    """Полная загрузка TIME-правил включённых сценариев из БД."""
+    rules = await db.scalars(
+        select(AutomationRule)
+        .join(AutomationScenario, AutomationRule.scenario_id == AutomationScenario.id)
+        .where(
+            AutomationScenario.enabled.is_(True),
+            AutomationRule.trigger_type == TriggerType.TIME,
+        )
+        .execution_options(allow_unindexed=True)  # полная загрузка при старте
+    )
+    now = datetime.utcnow()
+    scheduler.clear()
+    for rule in rules:
+        scheduler.add_rule(rule, now)
+    return len(scheduler)
+
+
+async def dispatch_due(db: AsyncSession, scheduler: RuleScheduler = rule_scheduler) -> Optional[int]:
+    """Отправить одну пачку наступивших срабатываний; None, если диспетчер занят другим процессом."""
+    now = datetime.utcnow()
+    next_at = scheduler.next_fire_at()
+    if next_at is None or next_at > now:
+        return 0
+    if not await db.scalar(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _LOCK_KEY}):
+        return None
+
+    due = scheduler.pop_due(now, SCHEDULER_BATCH_SIZE)
+    try:
+        rules = {
+            rule.id: rule
+            for rule in await db.scalars(
+                select(AutomationRule)
+                .join(AutomationScenario, AutomationRule.scenario_id == AutomationScenario.id)
+                .where(
+                    AutomationRule.id.in_([entry.rule_id for entry in due]),
+                    AutomationScenario.enabled.is_(True),
+                )
+                .with_for_update(of=AutomationRule)
+            )
+        }
+
+        fired: List[_Entry] = []
+        changed: Dict[UUID, Optional[Schedule]] = {}
+        for entry in due:
+            rule = rules.get(entry.rule_id)
+            if rule is None:
+                continue  # правило удалено или сценарий выключен
+            schedule = _current_schedule(rule)
+            if schedule != entry.schedule:
+                # правило изменили в другом процессе, куча узнает об этом только при перезагрузке
+                changed[rule.id] = schedule
+                continue
+            if rule.last_fired_at is not None and rule.last_fired_at >= entry.fire_at:
+                scheduler.stats.skipped += 1  # этот слот уже отработала другая реплика
+                continue
+            enqueue_event(
+                db,
+                topic=AUTOMATION_ACTION_TOPIC,
+                key=str(rule.action_target),
+                value={
+                    "rule_id": str(rule.id),
+                    "scenario_id": str(rule.scenario_id),
+                    "action_type": rule.action_type.value,
+                    "action_target": str(rule.action_target),
+                    "trigger": TriggerType.TIME.value,
+                    "scheduled_at": entry.fire_at.isoformat(),
+                    "fired_at": now.isoformat(),
+                },
+            )
+            rule.last_fired_at = entry.fire_at
+            fired.append(entry)
+        await db.commit()
+    except BaseException:
+        # срабатывания не записаны — возвращаем их в кучу как были
+        for entry in due:
+            scheduler.reschedule(entry, entry.fire_at)
+        raise
+
+    for entry in fired:
+        scheduler.stats.record_fire(now - entry.fire_at)
+    for entry in due:
+        rule = rules.get(entry.rule_id)
+        if rule is None or (entry.rule_id in changed and changed[entry.rule_id] is None):
+            scheduler.unschedule(entry.rule_id)
+        elif entry.rule_id in changed:
+            schedule = changed[entry.rule_id]
+            scheduler.reschedule(entry, _initial_fire_at(schedule, rule.last_fired_at, now), schedule)
+        else:
+            # отставшие слоты не догоняем пачкой — следующий после текущего момента
+            scheduler.reschedule(entry, entry.schedule.next_after(max(rule.last_fired_at, now)))
+    return len(fired)
+
+
+async def run_rule_scheduler() -> None:
+    """Спит до ближайшего слота, но не дольше SCHEDULER_MAX_SLEEP_S; слоты отрабатывает держатель lock."""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                fired = await dispatch_due(db)
+            if fired == SCHEDULER_BATCH_SIZE:
+                continue  # наступивших срабатываний больше, чем влезло в пачку
+            if fired is None:
+                await asyncio.sleep(SCHEDULER_MAX_SLEEP_S)  # слоты отрабатывает другая реплика
+            else:
+                await rule_scheduler.wait(SCHEDULER_MAX_SLEEP_S)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Rule scheduler failed")
+            await asyncio.sleep(SCHEDULER_RETRY_BACKOFF_S)
+
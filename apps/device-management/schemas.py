@@ -79,6 +79,45 @@ class DeviceResponse(DeviceBase):
     class Config:
         orm_mode = True
 
+class RoomTopology(RoomResponse):
+    devices: List[DeviceResponse] = []
+
+class HomeTopologyResponse(HomeResponse):
+    """Дом с комнатами и устройствами; ветки, не запрошенные в include, отсутствуют."""
+    rooms: List[RoomTopology] = []
+    devices: List[DeviceResponse] = []
+
+class DevicePatch(BaseModel):
+    """Частичное обновление устройства: меняются только переданные поля."""
+    name: Optional[str] = None
+    model: Optional[str] = None
+    location: Optional[str] = None
+    unit: Optional[str] = None
+    firmware_version: Optional[str] = None
+    status: Optional[str] = None
+    room_id: Optional[UUID4] = None
+    home_id: Optional[UUID4] = None
+
+class DeviceBulkFilter(BaseModel):
+    home_id: Optional[UUID4] = None
+    room_id: Optional[UUID4] = None
+    type: Optional[DeviceType] = None
+
+class DeviceBulkUpdate(BaseModel):
+    """Устройства выбираются списком ids и/или фильтром; patch применяется ко всем."""
+    ids: Optional[List[UUID4]] = None
+    filter: Optional[DeviceBulkFilter] = None
+    patch: DevicePatch
+
+class DeviceBulkUpdated(BaseModel):
+    id: UUID4
+    etag: str
+
+class DeviceBulkUpdateResult(BaseModel):
+    updated: List[DeviceBulkUpdated]
+    # ids из запроса, которых нет или которые не прошли фильтр
+    not_found: List[UUID4] = []
+
 class DeviceActivationRequest(BaseModel):
     activation_code: str
     home_id: UUID4
@@ -96,6 +135,25 @@ class SensorDataResponse(SensorDataBase):
     class Config:
         orm_mode = True
 
+class SensorDataReject(BaseModel):
+    index: int
+    errors: List[str]
+
+class SensorDataBatchResult(BaseModel):
+    accepted: int
+    rejected: List[SensorDataReject]
+
+class SensorDataAggregateResponse(BaseModel):
+    """Колоночный ответ: i-й элемент каждого списка относится к одному бакету."""
+    bucket_width: str
+    device_id: List[UUID4]
+    bucket: List[datetime]
+    min: List[Optional[float]]
+    max: List[Optional[float]]
+    avg: List[Optional[float]]
+    count: List[int]
+    last: List[Optional[float]]
+
 class ScenarioBase(BaseModel):
     name: str
     user_id: UUID4
@@ -140,6 +198,25 @@ class NotificationResponse(NotificationBase):
     class Config:
         orm_mode = True
 
+class NotificationBulkCreate(BaseModel):
+    """Одно уведомление многим: списку user_ids и/или участникам дома home_id."""
+    user_ids: List[UUID4] = []
+    home_id: Optional[UUID4] = None
+    title: str
+    body: str
+    sent_at: Optional[datetime] = None
+
+class NotificationBulkResult(BaseModel):
+    created: int
+    unknown_user_ids: List[UUID4] = []
+
+class NotificationUnreadCount(BaseModel):
+    user_id: UUID4
+    unread: int
+
+class NotificationMarkReadResult(BaseModel):
+    updated: int
+
 class EventLogBase(BaseModel):
     device_id: UUID4
     event_type: str
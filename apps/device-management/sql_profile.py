@@ -0,0 +1,180 @@
+"""Профилирование SQL по запросам: число запросов, время в БД, N+1, медленные запросы.
+
+Хук на ``before/after_cursor_execute`` движка считает каждый запрос в профиль
+текущего HTTP-запроса (contextvar, его ставит SQLProfileMiddleware). Режим
+задаётся SQL_PROFILE:
+
+``log`` — по итогам запроса предупреждение, если один и тот же текст SQL
+выполнился SQL_N_PLUS_ONE_THRESHOLD и более раз (N+1); сводка по запросу —
+в debug-лог;
+``headers`` — то же плюс заголовки ``X-DB-Query-Count`` и ``Server-Timing``;
+``off`` — профиль не собирается.
+
+Запросы дольше SQL_SLOW_QUERY_MS пишутся в лог в любом режиме, кроме off,
+в том числе из фоновых задач; вместо значений параметров — только их типы.
+
+Для тестов: ``with assert_max_queries(3): client.get(...)``.
+"""
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.datastructures import MutableHeaders
+
+__all__ = [
+    "QueryProfile",
+    "SQLProfileMiddleware",
+    "SQL_PROFILE",
+    "assert_max_queries",
+    "install_sql_profiler",
+]
+
+logger = logging.getLogger("sql")
+
+SQL_PROFILE = os.getenv("SQL_PROFILE", "log")  # off | log | headers
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "200"))
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+
+_MAX_LOGGED_SQL = 1000
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryProfile:
+    """Запросы одного HTTP-запроса (или блока assert_max_queries)."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: Counter = Counter()
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.count += 1
+        self.seconds += elapsed
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int) -> List[tuple]:
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+
+_current: ContextVar[Optional[QueryProfile]] = ContextVar("sql_profile", default=None)
+# профили assert_max_queries: видят запросы из любого потока и задачи
+_collectors: List[QueryProfile] = []
+
+
+def _compact(statement: str) -> str:
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    if len(statement) > _MAX_LOGGED_SQL:
+        statement = statement[:_MAX_LOGGED_SQL] + "..."
+    return statement
+
+
+def _redact(parameters: Any, executemany: bool) -> str:
+    """Типы параметров вместо значений: в логах не должно быть данных."""
+    if executemany:
+        return f"<executemany x{len(parameters)}>"
+    if isinstance(parameters, dict):
+        return repr({key: type(value).__name__ for key, value in parameters.items()})
+    if isinstance(parameters, (list, tuple)):
+        return repr([type(value).__name__ for value in parameters])
+    return f"<{type(parameters).__name__}>"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._sql_profile_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    elapsed = time.perf_counter() - context._sql_profile_started
+    profile = _current.get()
+    if profile is not None:
+        profile.record(statement, elapsed)
+    for collector in _collectors:
+        collector.record(statement, elapsed)
+    if elapsed * 1000 >= SQL_SLOW_QUERY_MS:
+        logger.warning(
+            "Slow query %.1f ms: %s params=%s",
+            elapsed * 1000,
+            _compact(statement),
+            _redact(parameters, executemany),
+        )
+
+
+def install_sql_profiler(engine: AsyncEngine) -> None:
+    if SQL_PROFILE == "off":
+        return
+    target = engine.sync_engine
+    if not event.contains(target, "before_cursor_execute", _before_cursor_execute):
+        event.listen(target, "before_cursor_execute", _before_cursor_execute)
+        event.listen(target, "after_cursor_execute", _after_cursor_execute)
+
+
+class SQLProfileMiddleware:
+    """ASGI-middleware: профиль SQL на каждый HTTP-запрос."""
+
+    def __init__(self, app):
+        self.app = app
+        self.headers = SQL_PROFILE == "headers"
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or SQL_PROFILE == "off":
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile()
+        token = _current.set(profile)
+
+        async def send_with_profile(message) -> None:
+            if self.headers and message["type"] == "http.response.start":
+                # запросы, выполненные при отдаче тела потока, сюда не попадут
+                headers = MutableHeaders(scope=message)
+                headers.append("X-DB-Query-Count", str(profile.count))
+                headers.append("Server-Timing", f"db;dur={profile.seconds * 1000:.1f}")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            _current.reset(token)
+            self._report(scope, profile)
+
+    @staticmethod
+    def _report(scope, profile: QueryProfile) -> None:
+        if not profile.count:
+            return
+        route = scope.get("route")
+        path = getattr(route, "path", None) or scope["path"]
+        for statement, times in profile.repeated(SQL_N_PLUS_ONE_THRESHOLD):
+            logger.warning(
+                "Possible N+1 in %s %s: %d x %s", scope["method"], path, times, _compact(statement)
+            )
+        logger.debug(
+            "%s %s: %d queries, %.1f ms in DB",
+            scope["method"],
+            path,
+            profile.count,
+            profile.seconds * 1000,
+        )
+
+
+@contextmanager
+def assert_max_queries(limit: int) -> Iterator[QueryProfile]:
+    """Для тестов: AssertionError, если в блоке выполнено больше ``limit`` запросов.
+
+    Считаются все запросы процесса, в том числе фоновых задач приложения.
+    """
+    profile = QueryProfile()
+    _collectors.append(profile)
+    try:
+        yield profile
+    finally:
+        _collectors.remove(profile)
+    if profile.count > limit:
+        details = "\n".join(f"  {n} x {_compact(sql)}" for sql, n in profile.statements.most_common())
+        raise AssertionError(f"Expected at most {limit} queries, got {profile.count}:\n{details}")
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# модули сервиса лежат плоско в корне приложения, как и при запуске uvicorn/consumer
+sys.path.insert(0, APP_DIR)
+
+# тесты с БД идут только против отдельной базы из TEST_DATABASE_URL (postgresql://...);
+# подменяем DSN до импорта database, без переменной такие тесты пропускаются
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+
+@pytest.fixture(scope="session")
+def migrated_db() -> None:
+    """Схема тестовой базы, поднятая миграциями до head."""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(os.path.join(APP_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(APP_DIR, "migrations"))
+    command.upgrade(config, "head")
@@ -0,0 +1,106 @@
+"""Сплит упавшей пачки: записанные части не повторяются, ядовитые сообщения уходят в DLQ."""
+import asyncio
+
+import asyncpg
+import pytest
+from aiokafka import ConsumerRecord, TopicPartition
+
+import consumer
+
+
+def _record(partition: int, offset: int, value: bytes = b"{}") -> ConsumerRecord:
+    return ConsumerRecord(
+        "sensorReadings", partition, offset, 0, 0, None, value, None, 0, len(value), []
+    )
+
+
+class FakeConsumer:
+    def __init__(self):
+        self.committed = {}
+
+    async def commit(self, offsets):
+        for tp, offset in offsets.items():
+            assert offset >= self.committed.get(tp, 0), "оффсет не должен откатываться"
+            self.committed[tp] = offset
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    written, dead = [], []
+    failures = {"transient": set()}
+
+    async def write_batch(messages, stats):
+        if any(m.value == b"poison" for m in messages):
+            raise asyncpg.CharacterNotInRepertoireError("invalid byte sequence 0x00")
+        hit = failures["transient"] & {(m.partition, m.offset) for m in messages}
+        if hit:
+            failures["transient"] -= hit
+            raise asyncpg.ConnectionDoesNotExistError("connection lost")
+        written.extend((m.partition, m.offset) for m in messages)
+
+    async def send_and_wait(topic, key, value):
+        dead.append((value["partition"], value["offset"]))
+
+    monkeypatch.setattr(consumer, "_write_batch", write_batch)
+    monkeypatch.setattr(consumer, "send_and_wait", send_and_wait)
+    return written, dead, failures
+
+
+def _batch():
+    messages = [_record(0, offset) for offset in range(4)] + [_record(1, offset) for offset in range(4)]
+    messages[2] = _record(0, 2, b"poison")
+    return messages
+
+
+def test_poison_message_goes_to_dlq_and_offsets_pass_it(pipeline):
+    written, dead, _ = pipeline
+    messages = _batch()
+    kafka = FakeConsumer()
+    positions = {TopicPartition("sensorReadings", p): 0 for p in (0, 1)}
+    stats = consumer.WorkerStats("test")
+
+    asyncio.run(consumer._write_split(kafka, messages, positions, stats))
+
+    assert dead == [(0, 2)]
+    assert sorted(written) == sorted((m.partition, m.offset) for m in messages if m.value != b"poison")
+    assert kafka.committed == {
+        TopicPartition("sensorReadings", 0): 4,
+        TopicPartition("sensorReadings", 1): 4,
+    }
+    assert positions == kafka.committed
+    assert stats.dead_lettered == 1 and stats.split_batches == 1
+
+
+def test_transient_failure_resumes_after_committed_prefix(pipeline):
+    written, dead, failures = pipeline
+    messages = _batch()
+    failures["transient"] = {(1, 2)}
+    kafka = FakeConsumer()
+    positions = {TopicPartition("sensorReadings", p): 0 for p in (0, 1)}
+    stats = consumer.WorkerStats("test")
+
+    with pytest.raises(asyncpg.ConnectionDoesNotExistError):
+        asyncio.run(consumer._write_split(kafka, messages, positions, stats))
+    # всё до упавшей части записано и закоммичено; run_worker перечитает отсюда
+    assert positions[TopicPartition("sensorReadings", 0)] == 4
+    assert positions[TopicPartition("sensorReadings", 1)] == 0
+
+    resumed = [m for m in messages if m.offset >= positions[TopicPartition(m.topic, m.partition)]]
+    asyncio.run(consumer._write_split(kafka, resumed, positions, stats))
+
+    # каждое показание записано ровно один раз
+    assert len(written) == len(set(written)) == 7
+    assert dead == [(0, 2)]
+    assert kafka.committed[TopicPartition("sensorReadings", 1)] == 4
+
+
+def test_transient_errors_are_not_blamed_on_the_message():
+    assert not consumer._is_transient(asyncpg.CharacterNotInRepertoireError("0x00"))
+    assert consumer._is_transient(asyncpg.ConnectionDoesNotExistError("gone"))
+    try:
+        try:
+            raise asyncpg.ConnectionDoesNotExistError("gone")
+        except Exception as e:
+            raise RuntimeError("wrapped") from e
+    except RuntimeError as wrapped:
+        assert consumer._is_transient(wrapped)
@@ -0,0 +1,116 @@
+"""LiveHub на тысячах подписчиков: буфер ограничен, быстрые получают всё, отписка чистит индекс."""
+import asyncio
+import uuid
+
+import orjson
+import pytest
+
+from live import LIVE_QUEUE_SIZE, LiveHub
+
+SUBSCRIBERS = 2000
+DEVICES = [str(uuid.uuid4()) for _ in range(50)]
+TYPES = ("temperature", "humidity")
+
+
+def _reading(device_id: str, reading_type: str, value: int) -> dict:
+    return {"device_id": device_id, "type": reading_type, "value": value}
+
+
+def _subscribe_all(hub: LiveHub, policy: str) -> list:
+    # у каждого подписчика по три устройства, каждое устройство — у многих подписчиков
+    n = len(DEVICES)
+    return [
+        hub.subscribe({DEVICES[i % n], DEVICES[(i * 7 + 1) % n], DEVICES[(i * 13 + 2) % n]}, policy)
+        for i in range(SUBSCRIBERS)
+    ]
+
+
+@pytest.mark.parametrize("policy", ["drop_oldest", "coalesce"])
+def test_slow_subscribers_stay_bounded(policy):
+    hub = LiveHub()
+    subscribers = _subscribe_all(hub, policy)
+    # никто не читает: на каждое устройство приходит больше показаний, чем влезает в буфер
+    for value in range(LIVE_QUEUE_SIZE * 2):
+        for device_id in DEVICES:
+            hub.publish(_reading(device_id, TYPES[value % 2], value))
+
+    assert all(len(subscriber) <= LIVE_QUEUE_SIZE for subscriber in subscribers)
+    assert hub.stats.dropped > 0
+    assert hub.stats.dropped == sum(subscriber.dropped for subscriber in subscribers)
+    if policy == "drop_oldest":
+        last = orjson.loads(asyncio.run(subscribers[0].get())[-1])
+        assert last["value"] == LIVE_QUEUE_SIZE * 2 - 1
+
+
+def test_fast_subscribers_receive_everything():
+    async def scenario():
+        hub = LiveHub()
+        subscribers = _subscribe_all(hub, "drop_oldest")
+        received = {subscriber: [] for subscriber in subscribers}
+
+        async def drain(subscriber):
+            while True:
+                received[subscriber].extend(await subscriber.get())
+
+        readers = [asyncio.create_task(drain(subscriber)) for subscriber in subscribers]
+        published = []
+        # между раундами читатели успевают забрать всё: раунд меньше буфера
+        for round_ in range(20):
+            for device_id in DEVICES:
+                reading = _reading(device_id, TYPES[round_ % 2], round_)
+                published.append(reading)
+                hub.publish(reading)
+            for _ in range(3):
+                await asyncio.sleep(0)
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        return hub, published, received
+
+    hub, published, received = asyncio.run(scenario())
+
+    assert hub.stats.dropped == 0
+    for subscriber, items in received.items():
+        expected = [r for r in published if r["device_id"] in subscriber.devices]
+        assert [orjson.loads(item) for item in items] == expected
+        assert subscriber.dropped == 0
+    assert hub.stats.delivered == sum(len(items) for items in received.values())
+
+
+def test_coalesce_keeps_latest_per_device_and_type():
+    hub = LiveHub()
+    subscribers = _subscribe_all(hub, "coalesce")
+    for value in range(100):
+        for device_id in DEVICES:
+            for reading_type in TYPES:
+                hub.publish(_reading(device_id, reading_type, value))
+
+    for subscriber in subscribers[:200]:
+        items = [orjson.loads(item) for item in asyncio.run(subscriber.get())]
+        keys = [(item["device_id"], item["type"]) for item in items]
+        assert len(keys) == len(set(keys)) == len(subscriber.devices) * len(TYPES)
+        assert all(item["value"] == 99 for item in items)
+        assert len(subscriber) == 0
+
+
+def test_unsubscribe_removes_index_entries():
+    hub = LiveHub()
+    subscribers = _subscribe_all(hub, "drop_oldest")
+    kept, gone = subscribers[::2], subscribers[1::2]
+
+    for subscriber in gone:
+        hub.unsubscribe(subscriber)
+    assert len(hub) == len(kept)
+    for device_id, indexed in hub._by_device.items():
+        assert indexed.isdisjoint(gone)
+        assert indexed == {s for s in kept if device_id in s.devices}
+
+    for subscriber in kept:
+        hub.unsubscribe(subscriber)
+    assert len(hub) == 0
+    assert hub._by_device == {}
+    assert not hub._has_subscribers.is_set()
+
+    hub.publish(_reading(DEVICES[0], "temperature", 1))
+    assert hub.stats.delivered == 0
+    assert all(len(subscriber) == 0 for subscriber in subscribers)
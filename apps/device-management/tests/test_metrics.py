@@ -0,0 +1,44 @@
+"""TimedRoute пишет в http_requests настоящий статус ответа, в том числе 404 и 422."""
+from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from starlette.exceptions import HTTPException as StarletteHTTPException
+
+from metrics import TimedRoute
+
+router = APIRouter(prefix="/timed-test", route_class=TimedRoute)
+
+
+@router.get("/items/{item_id}")
+async def get_item(item_id: int):
+    if item_id == 404:
+        raise HTTPException(status_code=404, detail="Not found")
+    if item_id == 409:
+        raise StarletteHTTPException(status_code=409)
+    return {"id": item_id}
+
+
+app = FastAPI()
+app.include_router(router)
+
+
+def _count(status: str) -> float:
+    value = REGISTRY.get_sample_value(
+        "http_requests_total",
+        {"method": "GET", "route": "/timed-test/items/{item_id}", "status": status},
+    )
+    return value or 0.0
+
+
+def test_status_labels():
+    client = TestClient(app)
+    before = {status: _count(status) for status in ("200", "404", "409", "422", "500")}
+
+    assert client.get("/timed-test/items/1").status_code == 200
+    assert client.get("/timed-test/items/404").status_code == 404
+    assert client.get("/timed-test/items/409").status_code == 409
+    assert client.get("/timed-test/items/abc").status_code == 422
+
+    for status in ("200", "404", "409", "422"):
+        assert _count(status) == before[status] + 1, status
+    assert _count("500") == before["500"]
@@ -0,0 +1,141 @@
+"""Число SQL-запросов горячих ручек не растёт с числом правил, комнат и устройств."""
+import asyncio
+import uuid
+
+import httpx
+import pytest
+
+P = "/api/v2.0"
+
+
+@pytest.fixture
+def api(migrated_db):
+    """Запуск сценария проверки с ASGI-клиентом; lifespan и фоновые задачи не стартуют."""
+    from database import dispose_db
+    from main import app
+
+    def run(check):
+        async def _main():
+            transport = httpx.ASGITransport(app=app)
+            try:
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                    await check(client)
+            finally:
+                # пул привязан к циклу asyncio.run этого теста
+                await dispose_db()
+
+        asyncio.run(_main())
+
+    return run
+
+
+async def _home_with_devices(client: httpx.AsyncClient, rooms: int, devices_per_room: int) -> dict:
+    user = (await client.post(P + "/users/register", json={"email": f"{uuid.uuid4()}@test", "name": "n"})).json()
+    home = (await client.post(P + "/homes/", json={"name": "h", "owner_id": user["id"]})).json()
+    devices = []
+    for i in range(rooms):
+        room = (await client.post(P + "/rooms/", json={"name": f"r{i}", "home_id": home["id"]})).json()
+        for j in range(devices_per_room):
+            response = await client.post(
+                P + "/sensors/",
+                json={
+                    "name": f"d{i}.{j}",
+                    "type": "SENSOR",
+                    "model": "m",
+                    "location": "l",
+                    "unit": "u",
+                    "home_id": home["id"],
+                    "room_id": room["id"],
+                },
+            )
+            devices.append(response.json())
+    return {"user": user, "home": home, "devices": devices}
+
+
+def _scenario(user_id: str, device_ids: list) -> dict:
+    return {
+        "name": "s",
+        "user_id": user_id,
+        "rules": [
+            {
+                "trigger_type": "SENSOR",
+                "trigger_condition": f"temperature > {i}",
+                "action_type": "TURN_ON",
+                "action_target": device_id,
+            }
+            for i, device_id in enumerate(device_ids)
+        ],
+    }
+
+
+def test_create_scenario_queries(api):
+    from sql_profile import assert_max_queries
+
+    async def check(client):
+        data = await _home_with_devices(client, rooms=2, devices_per_room=10)
+        device_ids = [d["id"] for d in data["devices"]]
+        # проверка FK пользователя и устройств, сценарий, правила одним INSERT, outbox
+        with assert_max_queries(5):
+            response = await client.post(
+                P + "/automation-scenarios/", json=_scenario(data["user"]["id"], device_ids)
+            )
+        assert response.status_code == 201
+        assert len(response.json()["rules"]) == 20
+
+    api(check)
+
+
+def test_get_scenario_queries(api):
+    from sql_profile import assert_max_queries
+
+    async def check(client):
+        data = await _home_with_devices(client, rooms=1, devices_per_room=10)
+        created = await client.post(
+            P + "/automation-scenarios/",
+            json=_scenario(data["user"]["id"], [d["id"] for d in data["devices"]]),
+        )
+        path = P + "/automation-scenarios/" + created.json()["id"]
+
+        # сценарий и selectinload правил
+        with assert_max_queries(2):
+            response = await client.get(path)
+        assert response.status_code == 200
+        assert len(response.json()["rules"]) == 10
+
+        # на 304 правила не читаются: только version
+        with assert_max_queries(1):
+            response = await client.get(path, headers={"If-None-Match": response.headers["etag"]})
+        assert response.status_code == 304
+
+    api(check)
+
+
+@pytest.mark.parametrize(
+    "include, limit",
+    [
+        ("rooms.devices", 3),
+        ("rooms", 2),
+        ("devices", 2),
+        ("rooms.devices,devices", 4),
+    ],
+)
+def test_home_topology_queries(api, include, limit):
+    from sql_profile import assert_max_queries
+
+    async def check(client):
+        data = await _home_with_devices(client, rooms=3, devices_per_room=4)
+        # дом и по одному selectinload на каждый уровень ветки
+        with assert_max_queries(limit):
+            response = await client.get(
+                P + f"/homes/{data['home']['id']}/topology", params={"include": include}
+            )
+        assert response.status_code == 200
+        body = response.json()
+        if "rooms" in include:
+            assert len(body["rooms"]) == 3
+        if "rooms.devices" in include:
+            assert sum(len(room["devices"]) for room in body["rooms"]) == 12
+        if "devices" in include.split(","):
+            assert len(body["devices"]) == 12
+
+    api(check)
@@ -1,7 +1,46 @@
+import os
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
 from app.models import ServiceRequest
 
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://mongo:27017")
+MONGO_DB = os.getenv("MONGO_DB", "service_db")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN", "1")
+MONGO_JOURNAL = os.getenv("MONGO_JOURNAL", "true").lower() == "true"
+MONGO_WTIMEOUT_MS = int(os.getenv("MONGO_WTIMEOUT_MS", "5000"))
+
+client = None
+
+def create_client() -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(
+        MONGO_URI,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        w=int(MONGO_WRITE_CONCERN) if MONGO_WRITE_CONCERN.isdigit() else MONGO_WRITE_CONCERN,
+        journal=MONGO_JOURNAL,
+        wTimeoutMS=MONGO_WTIMEOUT_MS,
+        retryWrites=True,
+    )
+
 async def init_db():
-    client = AsyncIOMotorClient("mongodb://mongo:27017")
-    await init_beanie(database=client["service_db"], document_models=[ServiceRequest])
+    global client
+    client = create_client()
+    await init_beanie(database=client[MONGO_DB], document_models=[ServiceRequest])
+
+async def close_db():
+    global client
+    if client is not None:
+        client.close()
+        client = None
@@ -1,5 +1,6 @@
 from beanie import Document
 from pydantic import BaseModel, Field
+from pymongo import ASCENDING, IndexModel
 from datetime import datetime
 
 class ServiceRequest(Document):
@@ -10,3 +11,14 @@ class ServiceRequest(Document):
 
     class Settings:
         name = "requests"
+        indexes = [
+            IndexModel([("created_at", ASCENDING), ("_id", ASCENDING)], name="created_at_id"),
+            IndexModel(
+                [("status", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+                name="status_created_at_id",
+            ),
+            IndexModel(
+                [("customerId", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+                name="customerId_created_at_id",
+            ),
+        ]
@@ -1,13 +1,131 @@
-from fastapi import APIRouter
+import base64
+import json
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import List, Optional
+
+from beanie import PydanticObjectId
+from bson.errors import InvalidId
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import Field, create_model
+from pymongo.errors import BulkWriteError
 from app.models import ServiceRequest
 
 router = APIRouter()
 
+MAX_BULK_REQUESTS = 10_000
+SORT = [("created_at", 1), ("_id", 1)]
+CURSOR_FIELDS = ("created_at",)
+
 @router.post("/request")
 async def create_request(data: ServiceRequest):
     await data.create()
     return {"id": str(data.id)}
 
+@router.post("/requests/bulk")
+async def create_requests_bulk(data: List[ServiceRequest]):
+    if len(data) > MAX_BULK_REQUESTS:
+        raise HTTPException(status_code=413, detail=f"Bulk insert is limited to {MAX_BULK_REQUESTS} requests")
+    if not data:
+        return {"inserted": 0, "ids": [], "errors": []}
+    for doc in data:
+        doc.id = doc.id or PydanticObjectId()
+    try:
+        await ServiceRequest.insert_many(data, ordered=False)
+        failed = []
+    except BulkWriteError as e:
+        failed = e.details.get("writeErrors", [])
+    errors = [{"index": err["index"], "code": err["code"], "message": err["errmsg"]} for err in failed]
+    rejected = {err["index"] for err in errors}
+    ids = [str(doc.id) for i, doc in enumerate(data) if i not in rejected]
+    return {"inserted": len(ids), "ids": ids, "errors": errors}
+
+def naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def encode_cursor(doc) -> str:
+    raw = json.dumps([doc.created_at.isoformat(), str(doc.id)])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        created_at, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at, doc_id = datetime.fromisoformat(created_at), PydanticObjectId(doc_id)
+    except (ValueError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"$or": [
+        {"created_at": {"$gt": created_at}},
+        {"created_at": created_at, "_id": {"$gt": doc_id}},
+    ]}
+
+@lru_cache(maxsize=64)
+def projection_model(fields: tuple):
+    model_fields = ServiceRequest.model_fields
+    return create_model(
+        "ServiceRequestProjection",
+        id=(PydanticObjectId, Field(alias="_id")),
+        **{name: (Optional[model_fields[name].annotation], None) for name in fields},
+    )
+
+def parse_fields(fields: str) -> tuple:
+    names = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in ServiceRequest.model_fields or name in ("id", "revision_id")]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return tuple(sorted(set(names) | set(CURSOR_FIELDS)))
+
+def dump(doc) -> dict:
+    return doc.model_dump(mode="json", by_alias=True, exclude={"revision_id"})
+
+async def ndjson(query):
+    batch = []
+    async for doc in query:
+        batch.append(json.dumps(dump(doc)))
+        if len(batch) == 500:
+            yield "\n".join(batch) + "\n"
+            batch = []
+    if batch:
+        yield "\n".join(batch) + "\n"
+
 @router.get("/requests")
-async def list_requests():
-    return await ServiceRequest.find_all().to_list()
+async def list_requests(
+    status: Optional[str] = None,
+    customerId: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    after: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = None,
+    stream: bool = False,
+):
+    conditions = []
+    if status is not None:
+        conditions.append({"status": status})
+    if customerId is not None:
+        conditions.append({"customerId": customerId})
+    if created_from is not None or created_to is not None:
+        created_at = {}
+        if created_from is not None:
+            created_at["$gte"] = naive_utc(created_from)
+        if created_to is not None:
+            created_at["$lt"] = naive_utc(created_to)
+        conditions.append({"created_at": created_at})
+    if after:
+        conditions.append(decode_cursor(after))
+
+    query = ServiceRequest.find({"$and": conditions} if conditions else {}).sort(SORT)
+    if fields:
+        query = query.project(projection_model(parse_fields(fields)))
+
+    if stream:
+        return StreamingResponse(ndjson(query), media_type="application/x-ndjson")
+
+    docs = await query.limit(limit + 1).to_list()
+    headers = {}
+    if len(docs) > limit:
+        docs = docs[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(docs[-1])
+    return JSONResponse([dump(doc) for doc in docs], headers=headers)
@@ -0,0 +1,94 @@
+"""Вставка заявок: POST /request по одной против POST /requests/bulk пачками.
+
+Приложение поднимается в этом же процессе (httpx ASGITransport), Mongo —
+любой локальный mongod из MONGO_URI, например ``docker run -p 27017:27017 mongo:6.0``.
+Пишет в отдельную базу MONGO_DB (по умолчанию service_db_bench) и очищает
+коллекцию перед каждым прогоном. Пул и write concern — из тех же переменных,
+что и у сервиса (MONGO_MAX_POOL_SIZE, MONGO_WRITE_CONCERN, ...).
+
+Запуск из apps/py-supporting:
+
+    python benchmarks/bench_insert.py --count 20000 --batch-size 500
+    MONGO_WRITE_CONCERN=majority python benchmarks/bench_insert.py --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("MONGO_DB", "service_db_bench")
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+from app.database import close_db, init_db  # noqa: E402
+from app.models import ServiceRequest  # noqa: E402
+
+
+def _body(i: int) -> dict:
+    return {"customerId": i % 1000, "description": f"bench request {i}"}
+
+
+async def _single(client: httpx.AsyncClient, count: int, concurrency: int) -> int:
+    counter = iter(range(count))
+    errors = 0
+
+    async def _worker() -> None:
+        nonlocal errors
+        for i in counter:
+            response = await client.post("/request", json=_body(i))
+            errors += response.status_code >= 400
+
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    return errors
+
+
+async def _bulk(client: httpx.AsyncClient, count: int, concurrency: int, batch_size: int) -> int:
+    batches = iter(range(0, count, batch_size))
+    errors = 0
+
+    async def _worker() -> None:
+        nonlocal errors
+        for start in batches:
+            body = [_body(i) for i in range(start, min(start + batch_size, count))]
+            response = await client.post("/requests/bulk", json=body)
+            errors += len(body) if response.status_code >= 400 else len(response.json()["errors"])
+
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    return errors
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    await init_db()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            runs = {
+                "single": lambda: _single(client, args.count, args.concurrency),
+                "bulk": lambda: _bulk(client, args.count, args.concurrency, args.batch_size),
+            }
+            for name, run in runs.items():
+                await ServiceRequest.delete_all()
+                started = time.perf_counter()
+                errors = await run()
+                elapsed = time.perf_counter() - started
+                stored = await ServiceRequest.count()
+                print(
+                    f"{name:<7} {args.count:,} docs in {elapsed:6.2f}s  {args.count / elapsed:>9,.0f} docs/s"
+                    f"  stored {stored:,}  errors {errors}",
+                    flush=True,
+                )
+            await ServiceRequest.delete_all()
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=10_000, help="заявок на прогон")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=500)
+    asyncio.run(main_async(parser.parse_args()))
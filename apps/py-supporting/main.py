@@ -1,5 +1,5 @@
 from fastapi import FastAPI
-from app.database import init_db
+from app.database import close_db, init_db
 from app.routes import router
 
 app = FastAPI()
@@ -8,4 +8,8 @@ app = FastAPI()
 async def startup_event():
     await init_db()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await close_db()
+
 app.include_router(router)